@@ -15,6 +15,7 @@ using static System.Net.Mime.MediaTypeNames;
 using System.Text.RegularExpressions;
 using System.Data;
 using System.Globalization;
+using System.Text.Json;
 using SVSModel.Configuration;
 
 namespace TestModel
@@ -49,25 +50,25 @@ namespace TestModel
 
             List<string> sets = new List<string> { "WS1", "WS2", "CropStage", "Residues", "Location", "Moisture", "Losses" };
 
-            //Delete graphs from previous test run
+            //Graphs from the previous test run are kept, validate.py only redraws those whose inputs changed
             string graphFolder = Path.Join(Directory.GetCurrentDirectory(), "TestGraphs", "Outputs");
             if (!Directory.Exists(graphFolder))
             {
                 System.IO.Directory.CreateDirectory(graphFolder);
             }
 
-            string[] graphPaths = Directory.GetFiles(graphFolder);
-            foreach (string graphPath in graphPaths)
-                File.Delete(graphPath);
-
-            foreach (string s in sets)
+            //One python process makes the configs and graphs for every set
+            using (PythonWorker python = new PythonWorker(root))
             {
-                //Make config file in format that .NET DataTable is able to import
-                runPythonScript(root, Path.Join("TestGraphs", "MakeConfigs", $"{s}.py"));
-                //Run each test
-                runTestSet(path, s);
-                //Make graphs associated with each test
-                runPythonScript(root, Path.Join("TestGraphs", "MakeGraphs", $"{s}.py"));
+                foreach (string s in sets)
+                {
+                    //Make config file in format that .NET DataTable is able to import
+                    python.RunStep("configs", s);
+                    //Run each test
+                    runTestSet(path, s);
+                    //Make graphs associated with each test
+                    python.RunStep("graphs", s);
+                }
             }
         }
 
@@ -86,6 +87,11 @@ namespace TestModel
             var assembly = Assembly.GetExecutingAssembly();
             string testConfig = "TestComponents.TestSets." + set + ".FieldConfigs.csv";
             Stream configcsv = assembly.GetManifestResourceStream(testConfig);
+            //Sets that are not built in, like sensitivity batches, are read from their folder
+            if (configcsv == null)
+            {
+                configcsv = File.OpenRead(Path.Join(path, set, "FieldConfigs.csv"));
+            }
             DataFrame allTests = DataFrame.LoadCsv(configcsv);
 
             string fertData = "TestComponents.TestSets." + set + ".FertiliserData.csv";
@@ -166,17 +172,144 @@ namespace TestModel
             }
         }
 
-        private static void runPythonScript(string path, string pyProg)
+        /// <summary>
+        /// TestGraphs/validate.py --worker, sent one step at a time.  A worker that dies is started again
+        /// once, and if that one dies too the run stops with the end of what it wrote to stderr.
+        /// </summary>
+        private sealed class PythonWorker : IDisposable
         {
-            string progToRun = Path.Join(path,pyProg);
-
-            Process proc = new Process();
-            proc.StartInfo.FileName = "python";
-            proc.StartInfo.RedirectStandardOutput = true;
-            proc.StartInfo.UseShellExecute = false;
-            proc.StartInfo.Arguments = progToRun;
-            proc.Start();
-            proc.WaitForExit();
+            //Lines of stderr kept to report when the worker dies
+            private const int errorLines = 50;
+
+            private readonly string progToRun;
+            private readonly Queue<string> errors = new Queue<string>();
+            private Process? proc;
+
+            public PythonWorker(string path)
+            {
+                progToRun = Path.Join(path, "TestGraphs", "validate.py");
+                start();
+            }
+
+            private void start()
+            {
+                Process started = new Process();
+                started.StartInfo.FileName = "python";
+                started.StartInfo.RedirectStandardInput = true;
+                started.StartInfo.RedirectStandardOutput = true;
+                started.StartInfo.RedirectStandardError = true;
+                started.StartInfo.UseShellExecute = false;
+                started.StartInfo.Arguments = $"\"{progToRun}\" --worker";
+                //The scripts print to stderr, which is passed on and its last lines kept
+                started.ErrorDataReceived += (sender, e) =>
+                {
+                    if (e.Data == null)
+                        return;
+                    Console.Error.WriteLine(e.Data);
+                    lock (errors)
+                    {
+                        errors.Enqueue(e.Data);
+                        while (errors.Count > errorLines)
+                            errors.Dequeue();
+                    }
+                };
+                try
+                {
+                    started.Start();
+                    started.BeginErrorReadLine();
+                }
+                catch
+                {
+                    started.Dispose();
+                    throw;
+                }
+                proc = started;
+            }
+
+            public void RunStep(string step, string set)
+            {
+                string? reply = send(step, set);
+                if (reply == null)
+                {
+                    Console.WriteLine($"Python worker exited before running {step} for {set}, starting it again:{Environment.NewLine}{lastErrors()}");
+                    stop();
+                    start();
+                    reply = send(step, set);
+                }
+                if (reply == null)
+                {
+                    string errorText = lastErrors();
+                    stop();
+                    throw new InvalidOperationException($"Python worker exited running {step} for {set}:{Environment.NewLine}{errorText}");
+                }
+                JsonElement result = JsonDocument.Parse(reply).RootElement;
+                if (!result.GetProperty("ok").GetBoolean())
+                {
+                    Console.WriteLine($"Python {step} for {set} failed: {result.GetProperty("error").GetString()}");
+                }
+            }
+
+            private string? send(string step, string set)
+            {
+                //Send one request and wait for its reply, null if the worker has died
+                if (proc == null || proc.HasExited)
+                    return null;
+                try
+                {
+                    proc.StandardInput.WriteLine(JsonSerializer.Serialize(new { step = step, set = set }));
+                    proc.StandardInput.Flush();
+                    return proc.StandardOutput.ReadLine();
+                }
+                catch (IOException)
+                {
+                    //It died between the check and the write
+                    return null;
+                }
+            }
+
+            private string lastErrors()
+            {
+                //Wait for the worker to finish exiting, so all of its stderr has been read
+                if (proc != null && proc.WaitForExit(10000))
+                    proc.WaitForExit();
+                lock (errors)
+                {
+                    string text = string.Join(Environment.NewLine, errors);
+                    errors.Clear();
+                    return text;
+                }
+            }
+
+            private void stop()
+            {
+                if (proc == null)
+                    return;
+                try
+                {
+                    if (!proc.HasExited)
+                    {
+                        //Closing stdin ends the worker once it has answered every request
+                        proc.StandardInput.Close();
+                        if (!proc.WaitForExit(60000))
+                            proc.Kill(true);
+                    }
+                    proc.WaitForExit();
+                }
+                catch (IOException)
+                {
+                    //It died while its stdin was being closed
+                }
+                finally
+                {
+                    proc.Dispose();
+                    proc = null;
+                }
+            }
+
+            public void Dispose()
+            {
+                stop();
+            }
         }
 
         public static (SVSModel.Configuration.Config, double) SetConfigFromDataFrame(string test, DataFrame allTests)
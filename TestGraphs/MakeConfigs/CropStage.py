@@ -18,11 +18,12 @@
 # Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
 
 import os
-import pandas as pd
+import sys
 
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         path = os.path.join(root,"TestComponents", "TestSets", "Location")
 except:
     rootfrags = os.path.abspath('CropStage.py').split("\\")
@@ -32,13 +33,16 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     path = os.path.join(root,"FieldNBalance","TestComponents", "TestSets", "CropStage")
 
-Configs = pd.read_excel(os.path.join(path, "FieldConfigs.xlsx"),skiprows=[0,1],nrows=45,usecols=lambda x: 'Unnamed' not in x)
+from validation.workbook import readWorkbook, readSheet
+from validation.configs import writeConfigs
 
-Configs.set_index('Name',inplace=True)
+sheets = readWorkbook(os.path.join(path, "FieldConfigs.xlsx"))
+
+Configs = readSheet(sheets,skiprows=[0,1],nrows=45,usecols=lambda x: 'Unnamed' not in x)
 
-CSConfigs = Configs.transpose()
-CSConfigs.to_csv(os.path.join(path, "FieldConfigs.csv"),header=True)
+Configs.set_index('Name',inplace=True)
 
-Configs.to_pickle(os.path.join(path, "FieldConfigs.pkl"))
+writeConfigs(Configs.items(), path)
@@ -18,11 +18,12 @@
 # Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
 
 import os
-import pandas as pd
+import sys
 
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         path = os.path.join(root,"TestComponents", "TestSets", "Losses")
 except:
     rootfrags = os.path.abspath('Losses.py').split("\\")
@@ -32,13 +33,19 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     path = os.path.join(root,"FieldNBalance","TestComponents", "TestSets", "Losses")
 
-Configs = pd.read_excel(os.path.join(path, "FieldConfigs.xlsx"),nrows=45,usecols=lambda x: 'Unnamed' not in x)
+from validation.workbook import readWorkbook, readSheet
+from validation.configs import expandTreatments, workbookFactors, writeConfigs
+
+sheets = readWorkbook(os.path.join(path, "FieldConfigs.xlsx"))
+
+Configs = readSheet(sheets,nrows=45,usecols=lambda x: 'Unnamed' not in x)
 
 Configs.set_index('Name',inplace=True)
 
-CSConfigs = Configs.transpose()
-CSConfigs.to_csv(os.path.join(path, "FieldConfigs.csv"),header=True)
+#The treatments are the loss treatment by site factorial laid out in the workbook's columns
+base, factors = workbookFactors(Configs, "{Site}_{Treatment}")
 
-Configs.to_pickle(os.path.join(path, "FieldConfigs.pkl"))
+writeConfigs(expandTreatments(base, factors, name="{Site}_{Treatment}"), path)
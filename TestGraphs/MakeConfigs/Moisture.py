@@ -17,12 +17,13 @@
 # Author: Hamish Brown.
 # Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
 
-import os 
-import pandas as pd
+import os
+import sys
 
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         path = os.path.join(root,"TestComponents", "TestSets", "Moisture")
 except:
     rootfrags = os.path.abspath('Moisture.py').split("\\")
@@ -32,17 +33,23 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     path = os.path.join(root,"FieldNBalance","TestComponents", "TestSets", "Moisture")
 
-Configs = pd.read_excel(
-    os.path.join(path, "FieldConfigs.xlsx"),
+from validation.workbook import readWorkbook, readSheet
+from validation.configs import expandTreatments, workbookFactors, writeConfigs
+
+sheets = readWorkbook(os.path.join(path, "FieldConfigs.xlsx"))
+
+Configs = readSheet(
+    sheets,
     nrows=45,
     usecols=lambda x: 'Unnamed' not in x,
     keep_default_na=False)
 
 Configs.set_index('Name',inplace=True)
 
-CSConfigs = Configs.transpose()
-CSConfigs.to_csv(os.path.join(path, "FieldConfigs.csv"),header=True)
+#The treatments are the rain by irrigation factorial laid out in the workbook's columns
+base, factors = workbookFactors(Configs, "{Rain}_{Irrigation}")
 
-Configs.to_pickle(os.path.join(path, "FieldConfigs.pkl"))
+writeConfigs(expandTreatments(base, factors, name="{Rain}_{Irrigation}"), path)
@@ -14,7 +14,8 @@
 # ---
 
 import os
-import pandas as pd
+import sys
+import itertools
 
 Sites = {
  1: 'LincolnRot1',
@@ -26,6 +27,7 @@ Sites = {
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         path = os.path.join(root,"TestComponents", "TestSets", "WS1")
 except:
     rootfrags = os.path.abspath('WS1.py').split("\\")
@@ -35,23 +37,20 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     path = os.path.join(root,"FieldNBalance","TestComponents", "TestSets", "WS1")
 
-Configs = pd.read_excel(os.path.join(path, "FieldConfigs.xlsx"),sheet_name=Sites[1],nrows=45,usecols=lambda x: 'Unnamed' not in x,keep_default_na=False)
-Configs.set_index('Name',inplace=True)
-for s in range(1,5):
-    sites = pd.read_excel(os.path.join(path, "FieldConfigs.xlsx"),sheet_name=Sites[s],nrows=45,usecols=lambda x: 'Unnamed' not in x,keep_default_na=False)
-    sites.set_index('Name',inplace=True)
-    if s != 1:
-        Configs = pd.concat([Configs,sites],axis=1)
-    #set the other N treatments
-    nlast = "_N1_"
-    for n in ["_N2_","_N3_","_N4_"]:
-        sites.columns = [sites.columns[x].replace(nlast,n) for x in range(sites.columns.size)]
-        Configs = pd.concat([Configs,sites],axis=1)
-        nlast = n
+from validation.workbook import readWorkbook, readSheet
+from validation.configs import expandTreatments, writeConfigs
+
+sheets = readWorkbook(os.path.join(path, "FieldConfigs.xlsx"))
 
-CSConfigs = Configs.transpose()
-CSConfigs.to_csv(os.path.join(path, "FieldConfigs.csv"),header=True)
+def siteTreatments(s):
+    sites = readSheet(sheets,Sites[s],nrows=45,usecols=lambda x: 'Unnamed' not in x,keep_default_na=False)
+    sites.set_index('Name',inplace=True)
+    #the sheet has the N1 treatments, the other N treatments only differ in name
+    nTreatments = {n: {} for n in ["N1","N2","N3","N4"]}
+    return expandTreatments(sites, {'N': nTreatments},
+                            name=lambda base, levels: base.replace("_N1_", "_"+levels['N']+"_"))
 
-Configs.to_pickle(os.path.join(path, "FieldConfigs.pkl"))
+writeConfigs(itertools.chain.from_iterable(siteTreatments(s) for s in range(1,5)), path)
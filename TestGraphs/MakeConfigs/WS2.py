@@ -18,7 +18,8 @@
 # Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
 
 import os
-import pandas as pd
+import sys
+import itertools
 
 Sites = {
  1: 'Wilcox',
@@ -35,6 +36,7 @@ Sites = {
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         path = os.path.join(root,"TestComponents", "TestSets", "WS2")
 except:
     rootfrags = os.path.abspath('WS2.py').split("\\")
@@ -44,16 +46,17 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     path = os.path.join(root,"FieldNBalance","TestComponents", "TestSets", "WS2")
 
-Configs = pd.read_excel(os.path.join(path, "FieldConfigs.xlsx"),sheet_name=Sites[1],nrows=45,usecols=lambda x: 'Unnamed' not in x,keep_default_na=False)
-Configs.set_index('Name',inplace=True)
-for s in range(2,10):
-    sites = pd.read_excel(os.path.join(path, "FieldConfigs.xlsx"),sheet_name=Sites[s],nrows=45,usecols=lambda x: 'Unnamed' not in x,keep_default_na=False)
-    sites.set_index('Name',inplace=True)
-    Configs = pd.concat([Configs,sites],axis=1)
+from validation.workbook import readWorkbook, readSheet
+from validation.configs import writeConfigs
+
+sheets = readWorkbook(os.path.join(path, "FieldConfigs.xlsx"))
 
-CSConfigs = Configs.transpose()
-CSConfigs.to_csv(os.path.join(path, "FieldConfigs.csv"),header=True)
+def siteTreatments(s):
+    sites = readSheet(sheets,Sites[s],nrows=45,usecols=lambda x: 'Unnamed' not in x,keep_default_na=False)
+    sites.set_index('Name',inplace=True)
+    return sites.items()
 
-Configs.to_pickle(os.path.join(path, "FieldConfigs.pkl"))
+writeConfigs(itertools.chain.from_iterable(siteTreatments(s) for s in range(1,10)), path)
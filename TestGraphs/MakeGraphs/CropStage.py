@@ -19,10 +19,7 @@
 # Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
 # +
 import os 
-import datetime as dt
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
+import sys
 import matplotlib.dates as mdates
 
 CBcolors = {
@@ -44,13 +41,10 @@ CBcolors = {
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         inPath = os.path.join(root, "TestComponents", "TestSets", "CropStage", "Outputs")
         outPath = os.path.join(root, "TestGraphs", "Outputs")  
-        localDayFirst = False
-        localDateFormat = '%m/%d/%Y %H:%M:%S'
 except:
-    localDayFirst = True
-    localDateFormat = '%d/%m/%Y %H:%M:%S %p'
     rootfrags = os.path.abspath('Location.py').split("\\")
     root = ""
     for d in rootfrags:
@@ -58,61 +52,48 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     inPath = os.path.join(root,"FieldNBalance","TestComponents", "TestSets", "CropStage", "Outputs")
     outPath = os.path.join(root,"FieldNBalance","TestGraphs", "Outputs")  
 
+from validation import listTests
+from validation.aggregate import Series, streamOutputs
+from validation import figures
+from validation.render import FigureJob, renderFigures
+
 # Get names and results from each test
 
-testFiles = []
-tests = []
-for file in os.listdir(inPath):
-    if file.endswith('.csv'):
-        testFiles.append(file)
-        tests.append(file.replace(".csv",""))
+tests = listTests(inPath)
 
-# Pack tests up into dataframe for graphing
+# Read the columns graphed from each test
 
-# +
-Alltests =[]
-for t in testFiles[:]:  
-    testframe = pd.read_csv(os.path.join(inPath, t),index_col=0,dayfirst=localDayFirst,date_format=localDateFormat)  
-    Alltests.append(testframe)   
-
-AllData = pd.concat(Alltests,axis=1,keys=tests)
-AllData.sort_index(axis=0,inplace=True)
-AllData.index = pd.to_datetime(AllData.index)
-# -
+Outputs, = streamOutputs(inPath, [Series(['Green cover','CropN'])])
 
 # Make graph
 
 colors = ['purple','purple','green','green','orange','orange','blue','blue','red','red','black','yellow','yellow']
 lines = ['-','--','-','--','-','--','-','--','-','--','-','-','--']
 
-Graph = plt.figure()
-ax = Graph.add_subplot(1,1,1)
-pos = 0
-for t in tests:
-    plt.plot(AllData.loc[:,(t,'Green cover')],lines[pos],color=CBcolors[colors[pos]],label = t)
-    pos +=1
-plt.legend(loc=(1.01,0.01))
-plt.ylabel('Crop Cover')
-plt.xticks(rotation=60)
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-plt.text(0.05,0.95,"Crop Cover with different Establish and Harvest Stages",fontsize = 16,transform=ax.transAxes)
-Graph.tight_layout(pad=1.5)
-plt.ylim(0,1.1)
-plt.savefig(os.path.join(outPath,'3-CropStage_Cover.png'))
+def plotTests(Graph, variable, cumulative, ylabel, title, ylim=None):
+    ax = Graph.axes[0]
+    pos = 0
+    for t in tests:
+        data = Outputs[t][variable]
+        if cumulative:
+            data = data.cumsum()
+        figures.line(ax,data.index,data.values,linestyle=lines[pos],color=CBcolors[colors[pos]],label = t)
+        pos +=1
+    ax.legend(loc=(1.01,0.01))
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis='x',labelrotation=60)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
+    figures.text(ax,0.05,0.95,title,fontsize = 16,transform=ax.transAxes)
+    Graph.tight_layout(pad=1.5)
+    if ylim != None:
+        ax.set_ylim(ylim)
+
 
-Graph = plt.figure()
-ax = Graph.add_subplot(1,1,1)
-pos = 0
-for t in tests:
-    plt.plot(AllData.loc[:,(t,'CropN')],lines[pos],color=CBcolors[colors[pos]],label = t)
-    pos +=1
-plt.legend(loc=(1.01,0.01))
-plt.ylabel('Cum CropNUptake (kg/ha)')
-plt.xticks(rotation=60)
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-plt.text(0.05,0.95,"NUptake With different establish and harvest stages",fontsize = 16,transform=ax.transAxes)
-Graph.tight_layout(pad=1.5)
-plt.savefig(os.path.join(outPath,'3-CropStage_NUptake.png'))
+renderFigures([
+    FigureJob('3-CropStage_Cover.png', plotTests, ('Green cover', False, 'Crop Cover', "Crop Cover with different Establish and Harvest Stages", (0,1.1)), layout=(1,1), inputs=Outputs),
+    FigureJob('3-CropStage_NUptake.png', plotTests, ('CropN', False, 'Cum CropNUptake (kg/ha)', "NUptake With different establish and harvest stages"), layout=(1,1), inputs=Outputs),
+], outPath)
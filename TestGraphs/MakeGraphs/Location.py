@@ -19,10 +19,7 @@
 # Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
 # +
 import os 
-import datetime as dt
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
+import sys
 import matplotlib.dates as mdates
 
 CBcolors = {
@@ -43,13 +40,10 @@ CBcolors = {
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         inPath = os.path.join(root, "TestComponents", "TestSets", "Location", "Outputs")
         outPath = os.path.join(root, "TestGraphs", "Outputs")
-        localDayFirst = False
-        localDateFormat = '%m/%d/%Y %H:%M:%S'
 except:
-    localDayFirst = True
-    localDateFormat = '%d/%m/%Y %H:%M:%S %p'
     rootfrags = os.path.abspath('Location.py').split("\\")
     root = ""
     for d in rootfrags:
@@ -57,88 +51,48 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     inPath = os.path.join(root,"FieldNBalance","TestComponents", "TestSets", "Location", "Outputs")
     outPath = os.path.join(root,"FieldNBalance","TestGraphs", "Outputs")  
 
+from validation import listTests
+from validation.aggregate import Series, streamOutputs
+from validation import figures
+from validation.render import FigureJob, renderFigures
+
 # Get names and results from each test
 
-testFiles = []
-tests = []
-for file in os.listdir(inPath):
-    if file.endswith('.csv'):
-        testFiles.append(file)
-        tests.append(file.replace(".csv",""))
+tests = listTests(inPath)
 
-# Pack tests up into dataframe for graphing
+# Read the columns graphed from each test
 
-# +
-Alltests =[]
-for t in testFiles[:]:  
-    testframe = pd.read_csv(os.path.join(inPath, t),index_col=0,dayfirst=localDayFirst,date_format=localDateFormat)  
-    Alltests.append(testframe)   
-
-AllData = pd.concat(Alltests,axis=1,keys=tests)
-AllData.sort_index(axis=0,inplace=True)
-AllData.index = pd.to_datetime(AllData.index)
-# -
+Outputs, = streamOutputs(inPath, [Series(['ResidueN','SoilOMN','Green cover','CropN'])])
 
 # Make graph
 
 colors = ['purple','purple','green','green','orange','orange','blue','blue','red','red','yellow','yellow',]
 lines = ['-','--','-','--','-','--','-','--','-','--','-','--']
 
-Graph = plt.figure()
-ax = Graph.add_subplot(1,1,1)
-pos = 0
-for t in tests:
-    plt.plot(AllData.loc[:,(t,'ResidueN')].cumsum(),lines[pos],color=CBcolors[colors[pos]],label = t)
-    pos +=1
-plt.legend(loc=(1.01,0.01))
-plt.ylabel('Cum Net Residue mineralisation (kg/ha)')
-plt.xticks(rotation=60)
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-plt.text(0.05,0.9,"Locational residue mineralisation tests",fontsize = 16,transform=ax.transAxes)
-Graph.tight_layout(pad=1.5)
-plt.savefig(os.path.join(outPath,'7-Location_Residues.png'))
-
-Graph = plt.figure()
-ax = Graph.add_subplot(1,1,1)
-pos = 0
-for t in tests:
-    plt.plot(AllData.loc[:,(t,'SoilOMN')].cumsum(),lines[pos],color=CBcolors[colors[pos]],label = t)
-    pos +=1
-plt.legend(loc=(1.01,0.01))
-plt.ylabel('Cum Net SOM mineralisation (kg/ha)')
-plt.xticks(rotation=60)
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-plt.text(0.05,0.9,"Locational SOM mineralisation tests",fontsize = 16,transform=ax.transAxes)
-Graph.tight_layout(pad=1.5)
-plt.savefig(os.path.join(outPath,'7-Location_SOM.png'))
+def plotTests(Graph, variable, cumulative, ylabel, title):
+    ax = Graph.axes[0]
+    pos = 0
+    for t in tests:
+        data = Outputs[t][variable]
+        if cumulative:
+            data = data.cumsum()
+        figures.line(ax,data.index,data.values,linestyle=lines[pos],color=CBcolors[colors[pos]],label = t)
+        pos +=1
+    ax.legend(loc=(1.01,0.01))
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis='x',labelrotation=60)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
+    figures.text(ax,0.05,0.9,title,fontsize = 16,transform=ax.transAxes)
+    Graph.tight_layout(pad=1.5)
 
-Graph = plt.figure()
-ax = Graph.add_subplot(1,1,1)
-pos = 0
-for t in tests:
-    plt.plot(AllData.loc[:,(t,'Green cover')],lines[pos],color=CBcolors[colors[pos]],label = t)
-    pos +=1
-plt.legend(loc=(1.01,0.01))
-plt.ylabel('Crop Cover')
-plt.xticks(rotation=60)
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-plt.text(0.05,0.9,"Locational cover tests",fontsize = 16,transform=ax.transAxes)
-Graph.tight_layout(pad=1.5)
-plt.savefig(os.path.join(outPath,'7-Location_Cover.png'))
 
-Graph = plt.figure()
-ax = Graph.add_subplot(1,1,1)
-pos = 0
-for t in tests:
-    plt.plot(AllData.loc[:,(t,'CropN')],lines[pos],color=CBcolors[colors[pos]],label = t)
-    pos +=1
-plt.legend(loc=(1.01,0.01))
-plt.ylabel('Crop Nitrogen (kg/ha)')
-plt.xticks(rotation=60)
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-plt.text(0.05,0.9,"Locational CropN tests",fontsize = 16,transform=ax.transAxes)
-Graph.tight_layout(pad=1.5)
-plt.savefig(os.path.join(outPath,'7-Location_CropN.png'))
+renderFigures([
+    FigureJob('7-Location_Residues.png', plotTests, ('ResidueN', True, 'Cum Net Residue mineralisation (kg/ha)', "Locational residue mineralisation tests"), layout=(1,1), inputs=Outputs),
+    FigureJob('7-Location_SOM.png', plotTests, ('SoilOMN', True, 'Cum Net SOM mineralisation (kg/ha)', "Locational SOM mineralisation tests"), layout=(1,1), inputs=Outputs),
+    FigureJob('7-Location_Cover.png', plotTests, ('Green cover', False, 'Crop Cover', "Locational cover tests"), layout=(1,1), inputs=Outputs),
+    FigureJob('7-Location_CropN.png', plotTests, ('CropN', False, 'Crop Nitrogen (kg/ha)', "Locational CropN tests"), layout=(1,1), inputs=Outputs),
+], outPath)
@@ -19,9 +19,7 @@
 # Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
 # +
 import os 
-import datetime as dt
-import pandas as pd
-import numpy as np
+import sys
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
@@ -43,13 +41,10 @@ CBcolors = {
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         inPath = os.path.join(root, "TestComponents", "TestSets", "Losses", "Outputs")
         outPath = os.path.join(root, "TestGraphs", "Outputs") 
-        localDayFirst = False
-        localDateFormat = '%m/%d/%Y %H:%M:%S'
 except:
-    localDayFirst = True
-    localDateFormat = '%d/%m/%Y %H:%M:%S %p'
     rootfrags = os.path.abspath('Losses.py').split("\\")
     root = ""
     for d in rootfrags:
@@ -57,30 +52,21 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     inPath = os.path.join(root,"FieldNBalance","TestComponents", "TestSets", "Losses", "Outputs")
     outPath = os.path.join(root,"FieldNBalance","TestGraphs", "Outputs")  
 
+from validation import listTests
+from validation.aggregate import Series, streamOutputs
+from validation.render import FigureJob, renderFigures
+
 # Get names and results from each test
 
-testFiles = []
-tests = []
-for file in os.listdir(inPath):
-    if file.endswith('.csv'):
-        testFiles.append(file)
-        tests.append(file.replace(".csv",""))
+tests = listTests(inPath)
 
-# Pack tests up into dataframe for graphing
+# Read the cumulative losses of each test
 
-# +
-Alltests =[]
-for t in testFiles[:]:  
-    testframe = pd.read_csv(os.path.join(inPath, t),index_col=0,dayfirst=localDayFirst,date_format=localDateFormat)  
-    Alltests.append(testframe)   
-
-AllData = pd.concat(Alltests,axis=1,keys=tests)
-AllData.sort_index(axis=0,inplace=True)
-AllData.index = pd.to_datetime(AllData.index)
-# -
+Outputs, = streamOutputs(inPath, [Series(['LostN'], cumulative=['LostN'])])
 
 Treats = ["Base","LowYield","Rocks","VeryDry","VeryWet"]
 cols = [CBcolors['gray'],
@@ -91,22 +77,24 @@ cols = [CBcolors['gray'],
 
 # Make graph
 
-Graph = plt.figure(figsize=(10,5))
-pos=1
-for site in ['Lauder','Lincoln','Levin']:
-    ax = Graph.add_subplot(1,3,pos)
-    tpos=0
-    for t in Treats:
-        data = AllData.loc[:,[(site in x) and (t in x) for x in AllData.columns.get_level_values(0)]]
-        plt.plot(data.loc[:,['LostN' in x for x in data.columns.get_level_values(1)]].cumsum(),color=cols[tpos],label = t)
-        tpos+=1
-    if site=="Lauder":
-        plt.legend(loc=(.05,0.6))
-    plt.ylabel('Cum losses (kg/ha)')
-    plt.text(0.05,0.9,site + " loss tests",fontsize = 16,transform=ax.transAxes)
-    plt.ylim(-10,400)
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-    plt.xticks(rotation=60)
-    pos+=1
-Graph.tight_layout(pad=1.5)             
-plt.savefig(os.path.join(outPath,'5-Losses.png'))       
+def plotLosses(Graph):
+    pos=1
+    for site in ['Lauder','Lincoln','Levin']:
+        ax = Graph.add_subplot(1,3,pos)
+        tpos=0
+        for t in Treats:
+            for x in tests:
+                if (site in x) and (t in x):
+                    plt.plot(Outputs[x]['LostN'],color=cols[tpos],label = t)
+            tpos+=1
+        if site=="Lauder":
+            plt.legend(loc=(.05,0.6))
+        plt.ylabel('Cum losses (kg/ha)')
+        plt.text(0.05,0.9,site + " loss tests",fontsize = 16,transform=ax.transAxes)
+        plt.ylim(-10,400)
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
+        plt.xticks(rotation=60)
+        pos+=1
+    Graph.tight_layout(pad=1.5)
+
+renderFigures([FigureJob('5-Losses.png', plotLosses, figsize=(10,5), inputs=Outputs)], outPath)
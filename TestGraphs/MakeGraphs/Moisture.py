@@ -19,10 +19,7 @@
 
 # +
 import os 
-import datetime as dt
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
+import sys
 import matplotlib.dates as mdates
 
 CBcolors = {
@@ -40,18 +37,13 @@ CBcolors = {
 
 # Path for current Tests
 
-dayfirst = True
-date_format = '%d/%m/%Y %H:%M:%S %p'
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         inPath = os.path.join(root, "TestComponents", "TestSets", "Moisture", "Outputs")
         outPath = os.path.join(root, "TestGraphs", "Outputs")  
-        localDayFirst = False
-        localDateFormat = '%m/%d/%Y %H:%M:%S'      
 except:
-    localDayFirst = True
-    localDateFormat = '%d/%m/%Y %H:%M:%S %p'
     rootfrags = os.path.abspath('Moisture.py').split("\\")
     root = ""
     for d in rootfrags:
@@ -59,104 +51,51 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     inPath = os.path.join(root,"FieldNBalance","TestComponents", "TestSets", "Moisture", "Outputs")
     outPath = os.path.join(root,"FieldNBalance","TestGraphs", "Outputs")  
 
+from validation import listTests
+from validation.aggregate import Series, streamOutputs
+from validation import figures
+from validation.render import FigureJob, renderFigures
+
 # Get names and results from each test
 
-testFiles = []
-tests = []
-for file in os.listdir(inPath):
-    if file.endswith('.csv'):
-        testFiles.append(file)
-        tests.append(file.replace(".csv",""))
+tests = listTests(inPath)
 
-# Pack tests up into dataframe for graphing
+# Read the columns graphed from each test
 
-# +
-Alltests =[]
-for t in testFiles[:]:  
-    testframe = pd.read_csv(os.path.join(inPath, t),index_col=0,dayfirst=localDayFirst,date_format=localDateFormat)   
-    Alltests.append(testframe)   
-
-AllData = pd.concat(Alltests,axis=1,keys=tests)
-AllData.sort_index(axis=0,inplace=True)
-AllData.index = pd.to_datetime(AllData.index, dayfirst=dayfirst)
-# -
+Outputs, = streamOutputs(inPath, [Series(['RSWC','SoilOMN','ResidueN','Drainage','CropN'])])
 
-AllData.columns
+Outputs.keys()
 
 # Make graph
 
 colors = ['purple','purple','purple','green','green','green','red','red','red','blue','blue','blue','orange','orange','orange']
 lines = ['-','--',':','-','--',':','-','--',':','-','--',':','-','--',':']
 
-Graph = plt.figure()
-ax = Graph.add_subplot(1,1,1)
-pos = 0
-for t in tests:
-    plt.plot(AllData.loc[:,(t,'RSWC')],lines[pos],color=CBcolors[colors[pos]],label = t)
-    pos +=1
-plt.legend(loc=(1.01,0.01))
-plt.ylabel('relative soil water content (kg/ha)')
-plt.xticks(rotation=60)
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-plt.text(0.05,0.9,"Moisture SWC tests",fontsize = 16,transform=ax.transAxes)
-Graph.tight_layout(pad=1.5)
-plt.savefig(os.path.join(outPath,'6-Moisture_SWC.png'))
-
-Graph = plt.figure()
-ax = Graph.add_subplot(1,1,1)
-pos = 0
-for t in tests:
-    plt.plot(AllData.loc[:,(t,'SoilOMN')].cumsum(),lines[pos],color=CBcolors[colors[pos]],label = t)
-    pos +=1
-plt.legend(loc=(1.01,0.01))
-plt.ylabel('Cum Net SOM mineralisation (kg/ha)')
-plt.xticks(rotation=60)
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-plt.text(0.05,0.9,"Moisture SOM mineralisation tests",fontsize = 16,transform=ax.transAxes)
-Graph.tight_layout(pad=1.5)
-plt.savefig(os.path.join(outPath,'6-Moisture_SOM.png'))
-
-Graph = plt.figure()
-ax = Graph.add_subplot(1,1,1)
-pos = 0
-for t in tests:
-    plt.plot(AllData.loc[:,(t,'ResidueN')].cumsum(),lines[pos],color=CBcolors[colors[pos]],label = t)
-    pos +=1
-plt.legend(loc=(1.01,0.01))
-plt.ylabel('Cum Net Residue mineralisation (kg/ha)')
-plt.xticks(rotation=60)
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-plt.text(0.05,0.9,"Moisture SOM mineralisation tests",fontsize = 16,transform=ax.transAxes)
-Graph.tight_layout(pad=1.5)
-plt.savefig(os.path.join(outPath,'6-Moisture_redisue.png'))
-
-Graph = plt.figure()
-ax = Graph.add_subplot(1,1,1)
-pos = 0
-for t in tests:
-    plt.plot(AllData.loc[:,(t,'Drainage')].cumsum(),lines[pos],color=CBcolors[colors[pos]],label = t)
-    pos +=1
-plt.legend(loc=(1.01,0.01))
-plt.ylabel('Cum drainage (mm)')
-plt.xticks(rotation=60)
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-plt.text(0.05,0.9,"Moisture drainage tests",fontsize = 16,transform=ax.transAxes)
-Graph.tight_layout(pad=1.5)
-plt.savefig(os.path.join(outPath,'6-Moisture_Drianage.png'))
-
-Graph = plt.figure()
-ax = Graph.add_subplot(1,1,1)
-pos = 0
-for t in tests:
-    plt.plot(AllData.loc[:,(t,'CropN')],lines[pos],color=CBcolors[colors[pos]],label = t)
-    pos +=1
-plt.legend(loc=(1.01,0.01))
-plt.ylabel('Cum Net Residue mineralisation (kg/ha)')
-plt.xticks(rotation=60)
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-plt.text(0.05,0.9,"Locational CropN tests",fontsize = 16,transform=ax.transAxes)
-Graph.tight_layout(pad=1.5)
-plt.savefig(os.path.join(outPath,'6-Moisture_CropN.png'))
+def plotTests(Graph, variable, cumulative, ylabel, title):
+    ax = Graph.axes[0]
+    pos = 0
+    for t in tests:
+        data = Outputs[t][variable]
+        if cumulative:
+            data = data.cumsum()
+        figures.line(ax,data.index,data.values,linestyle=lines[pos],color=CBcolors[colors[pos]],label = t)
+        pos +=1
+    ax.legend(loc=(1.01,0.01))
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis='x',labelrotation=60)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
+    figures.text(ax,0.05,0.9,title,fontsize = 16,transform=ax.transAxes)
+    Graph.tight_layout(pad=1.5)
+
+
+renderFigures([
+    FigureJob('6-Moisture_SWC.png', plotTests, ('RSWC', False, 'relative soil water content (kg/ha)', "Moisture SWC tests"), layout=(1,1), inputs=Outputs),
+    FigureJob('6-Moisture_SOM.png', plotTests, ('SoilOMN', True, 'Cum Net SOM mineralisation (kg/ha)', "Moisture SOM mineralisation tests"), layout=(1,1), inputs=Outputs),
+    FigureJob('6-Moisture_redisue.png', plotTests, ('ResidueN', True, 'Cum Net Residue mineralisation (kg/ha)', "Moisture SOM mineralisation tests"), layout=(1,1), inputs=Outputs),
+    FigureJob('6-Moisture_Drianage.png', plotTests, ('Drainage', True, 'Cum drainage (mm)', "Moisture drainage tests"), layout=(1,1), inputs=Outputs),
+    FigureJob('6-Moisture_CropN.png', plotTests, ('CropN', False, 'Cum Net Residue mineralisation (kg/ha)', "Locational CropN tests"), layout=(1,1), inputs=Outputs),
+], outPath)
@@ -18,9 +18,7 @@
 # Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
 
 import os 
-import datetime as dt
-import pandas as pd
-import numpy as np
+import sys
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
@@ -29,13 +27,10 @@ import matplotlib.dates as mdates
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         inPath = os.path.join(root, "TestComponents", "TestSets", "Residues", "Outputs")
         outPath = os.path.join(root, "TestGraphs", "Outputs") 
-        localDayFirst = False
-        localDateFormat = '%m/%d/%Y %H:%M:%S'
 except:
-    localDayFirst = True
-    localDateFormat = '%d/%m/%Y %H:%M:%S %p'
     rootfrags = os.path.abspath('Residues.py').split("\\")
     root = ""
     for d in rootfrags:
@@ -43,30 +38,21 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     inPath = os.path.join(root,"FieldNBalance","TestComponents", "TestSets", "Residues", "Outputs")
     outPath = os.path.join(root,"FieldNBalance","TestGraphs", "Outputs")  
 
+from validation import listTests
+from validation.aggregate import Series, streamOutputs
+from validation.render import FigureJob, renderFigures
+
 # Get names and results from each test
 
-testFiles = []
-tests = []
-for file in os.listdir(inPath):
-    if file.endswith('.csv'):
-        testFiles.append(file)
-        tests.append(file.replace(".csv",""))
+tests = listTests(inPath)
 
-# Pack tests up into dataframe for graphing
+# Read the cumulative residue mineralisation of each test
 
-# +
-Alltests =[]
-for t in testFiles[:]:  
-    testframe = pd.read_csv(os.path.join(inPath, t),index_col=0,dayfirst=localDayFirst,date_format=localDateFormat)    
-    Alltests.append(testframe)   
-
-AllData = pd.concat(Alltests,axis=1,keys=tests)
-AllData.sort_index(axis=0,inplace=True)
-AllData.index = pd.to_datetime(AllData.index)
-# -
+Outputs, = streamOutputs(inPath, [Series(['ResidueN'], cumulative=['ResidueN'])])
 
 # Make graph
 
@@ -74,18 +60,19 @@ AllData.index = pd.to_datetime(AllData.index)
 cols = ['k','k','b','b','g','g','y','y','r','r']
 lines = ['-','--','-','--','-','--','-','--','-','--',]
 
-Graph = plt.figure()
-ax = Graph.add_subplot(1,1,1)
-pos = 0
-for t in tests:
-    plt.plot(AllData.loc[:,(t,'ResidueN')].cumsum(),lines[pos],color=cols[pos],label = t)
-    pos +=1
-plt.legend(loc=(1.01,0.01))
-plt.ylabel('Cum Net Residue mineralisation (kg/ha)')
-plt.xticks(rotation=60)
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
-Graph.tight_layout(pad=1.5)
-plt.savefig(os.path.join(outPath, '4-Residues.png'))
+def plotResidues(Graph):
+    ax = Graph.add_subplot(1,1,1)
+    pos = 0
+    for t in tests:
+        plt.plot(Outputs[t]['ResidueN'],lines[pos],color=cols[pos],label = t)
+        pos +=1
+    plt.legend(loc=(1.01,0.01))
+    plt.ylabel('Cum Net Residue mineralisation (kg/ha)')
+    plt.xticks(rotation=60)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b'))
+    Graph.tight_layout(pad=1.5)
+
+renderFigures([FigureJob('4-Residues.png', plotResidues, inputs=Outputs)], outPath)
 # -
 
-AllData
+Outputs
@@ -15,9 +15,9 @@
 
 # +
 import os 
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
-import datetime as dt
 import matplotlib.dates as mdates
 
 CBcolors = {
@@ -36,13 +36,10 @@ CBcolors = {
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         inPath = os.path.join(root, "TestComponents", "TestSets", "WS1")
         outPath = os.path.join(root, "TestGraphs", "Outputs")  
-        localDayFirst = False
-        localDateFormat = '%m/%d/%Y %H:%M:%S'
 except: 
-    localDayFirst = True
-    localDateFormat = '%d/%m/%Y %H:%M:%S %p'
     rootfrags = os.path.abspath('WS1.py').split("\\")
     root = ""
     for d in rootfrags:
@@ -50,140 +47,88 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     inPath = os.path.join(root,"FieldNBalance","TestComponents", "TestSets", "WS1")
     outPath = os.path.join(root,"FieldNBalance","TestGraphs", "Outputs")   
 
-Configs = pd.read_pickle(os.path.join(inPath, "FieldConfigs.pkl"))
+from validation import listTests, parseDates
+from validation.aggregate import ObsPred, Series, streamOutputs
+from validation.obspred import harvestWindows, observedMeans
+from validation.configs import readConfigs
+from validation.stats import regressionStats
+from validation import figures
+from validation.render import FigureJob, renderFigures
+
+Configs = readConfigs(inPath)
 
 observedCrop = pd.read_csv(os.path.join(inPath, "CropData.csv"), index_col=0)
 observedCrop.sort_index(axis=0,inplace=True)
-observedCrop['Date'] = pd.to_datetime(observedCrop['Date'])
+observedCrop['Date'] = parseDates(observedCrop['Date'])
 
 observedSoil = pd.read_csv(os.path.join(inPath, "SoilData.csv"),index_col=0)
 observedSoil.sort_index(axis=0,inplace=True)
-observedSoil['Date'] = pd.to_datetime(observedSoil['Date'])
+observedSoil['Date'] = parseDates(observedSoil['Date'])
 observedSoil['SoilMineralN'] = observedSoil.loc[:,['SoilN0_15', 'SoilN15_30']].sum(axis=1)
 
-testFiles = []
-tests = []
-for file in os.listdir(os.path.join(inPath,"Outputs")):
-    if file.endswith('.csv'):
-        testFiles.append(file)
-        tests.append(file.replace(".csv",""))
-
-# +
-Alltests =[]
-for t in testFiles[:]:  
-    testframe = pd.read_csv(os.path.join(inPath, "Outputs", t),index_col=0,dayfirst=localDayFirst,date_format=localDateFormat)  
-    Alltests.append(testframe)   
-
-AllData = pd.concat(Alltests,axis=1,keys=tests)
-AllData.sort_index(axis=0,inplace=True)
-AllData.index = pd.to_datetime(AllData.index)
-# -
+tests = listTests(os.path.join(inPath, "Outputs"))
 
 TestsFrame = pd.DataFrame(index = tests,data=[x.split('_') for x in tests],columns = ['Site','N','Irr','Crop'])
 
-ObsPredIndex = pd.MultiIndex.from_product([tests,AllData.index],names=['Treatment','Date'])
-ObsPredCropN = pd.DataFrame(index = ObsPredIndex, columns = ['obs','pred'])
-ObsPredCropN.loc[:,'Site'] =  [TestsFrame.loc[x,'Site'] for x in ObsPredCropN.index.get_level_values(0)]
-ObsPredCropN.set_index('Site',append=True,inplace=True)
-ObsPredCropN = ObsPredCropN.reorder_levels(['Site','Treatment','Date'],axis=0)
-ObsPredCropN = ObsPredCropN.sort_index()
-
-ObsCropN = observedCrop.loc[:,['Date','CropN']]
-ObsCropN.loc[:,'Date'] = [(ObsCropN.iloc[x,0] + dt.timedelta(hours=12)) for x in range(ObsCropN.index.size)]
-ObsCropN.set_index('Date',append=True,inplace=True)
-ObsCropN.columns = ['obs']
-ObsCropN = ObsCropN.groupby(['Site','Date']).mean()
-for t in tests:
-    s = TestsFrame.loc[t,'Site']
-    obst = TestsFrame.loc[t,'Site']+"_"+TestsFrame.loc[t,'N']+"_"+TestsFrame.loc[t,'Irr']
-    obs = ObsCropN.loc[obst,:]
-    obs.sort_index(inplace=True)
-    dates = AllData.loc[Configs.loc["PriorHarvestDate",t]:Configs.loc["CurrentHarvestDate",t],(t,'CropN')].index
-    Pred = AllData.loc[dates,(t,'CropN')]
-    pred = Pred.reindex(obs.index.values)
-    pred.sort_index(axis=0, inplace=True)
-    for d in obs.index.values:
-        ObsPredCropN.loc[(s,t,d),'pred'] = pred[d]
-        ObsPredCropN.loc[(s,t,d), 'obs'] = obs.loc[d,'obs']
-
-sites = list(ObsPredCropN.index.get_level_values(0).drop_duplicates())
-
-graph = plt.figure(figsize=(10,10))
-pos = 1
-for s in sites:
-    Obs = ObsPredCropN.loc[s,'obs']
-    Pred = ObsPredCropN.loc[s,'pred']
-    #RegStats = MUte.MathUtilities.CalcRegressionStats('LN',Pred,Obs)
-    ax = graph.add_subplot(3,3,pos)
-    plt.plot(Obs,Pred,'o')
-    maxval = max(ObsPredCropN.loc[s,'obs'].max(),ObsPredCropN.loc[s,'pred'].max()) * 1.05
-    plt.ylim(-10,maxval)
-    plt.xlim(-10,maxval)
-    plt.plot([0,maxval],[0,maxval],'-')
-    plt.text(0.05,0.9,'site '+str(s),transform = ax.transAxes)
-    #plt.text(0.05,0.8,'NSE = ' +str(RegStats.NSE),transform = ax.transAxes)
-    pos +=1
-
-
-Obs = ObsPredCropN.obs.values
-Pred = ObsPredCropN.pred.values
-graph = plt.figure(figsize = (5,5))
-ax = graph.add_subplot(1,1,1)
-plt.plot(Obs,Pred,'o')
-#RegStats = MUte.MathUtilities.CalcRegressionStats('LN',Pred,Obs)
-#plt.text(0.05,0.8,'NSE = ' +str(RegStats.NSE),transform = ax.transAxes)
-plt.ylabel('Predicted')
-plt.xlabel('Observed')
+obsKeys = TestsFrame.Site+"_"+TestsFrame.N+"_"+TestsFrame.Irr
+windows = harvestWindows(Configs, tests)
 
+ObsCropN = observedMeans(observedCrop, 'CropN')
+ObsSoilN = observedMeans(observedSoil, 'SoilMineralN')
 
+NbalComponents = ['SoilMineralN', 'UptakeN', 'ResidueN', 'SoilOMN', 'FertiliserN',
+       'CropN', 'NDemand','LostN']
+accumulate = [False,True,True,True,True,False,False,True]
+toAccumulate = dict(zip(NbalComponents,accumulate))
 
-ObsSoilN = observedSoil.loc[:,['Date','SoilMineralN']]
-ObsSoilN.loc[:,'Date'] = [(ObsSoilN.iloc[x,0] + dt.timedelta(hours=12)) for x in range(ObsSoilN.index.size)]
-ObsSoilN.set_index('Date',append=True,inplace=True)
-ObsSoilN.columns = ['obs']
-ObsSoilN = ObsSoilN.groupby(['Site','Date']).mean()
-blankIndex = pd.MultiIndex.from_product([[],[],[]], names = ['site','test','date'])
-ObsPredSoilN = pd.DataFrame(index = blankIndex, columns = ['obs','pred'])
-for t in tests:
-    s = TestsFrame.loc[t,'Site']
-    obst = TestsFrame.loc[t,'Site']+"_"+TestsFrame.loc[t,'N']+"_"+TestsFrame.loc[t,'Irr']
-    obs = ObsSoilN.loc[obst,:]
-    dates = AllData.loc[Configs.loc["PriorHarvestDate",t]:Configs.loc["CurrentHarvestDate",t],(t,'SoilMineralN')].index
-    Pred = AllData.loc[dates,(t,'SoilMineralN')]
-    pred = Pred.reindex(obs.index.values)
-    for d in obs.index.values:
-        ObsPredSoilN.loc[(s,t,d),'pred'] = pred[d]
-        ObsPredSoilN.loc[(s,t,d), 'obs'] = obs.loc[d,'obs']
+rot = 'HawkesBayRot3_N'
+irr = '_Irr2_'
+crop = 'Ryegrass'
 
-graph = plt.figure(figsize=(10,10))
-pos = 1
-for s in sites:
-    Obs = ObsPredSoilN.loc[s,'obs']
-    Pred = ObsPredSoilN.loc[s,'pred']
-    #RegStats = MUte.MathUtilities.CalcRegressionStats('LN',Pred,Obs)
-    ax = graph.add_subplot(3,3,pos)
-    plt.plot(Obs,Pred,'o')
-    maxval = max(ObsPredSoilN.loc[s,'obs'].max(),ObsPredSoilN.loc[s,'pred'].max()) * 1.05
-    plt.ylim(-10,maxval)
-    plt.xlim(-10,maxval)
-    plt.plot([0,maxval],[0,maxval],'-')
-    plt.text(0.05,0.9,'site '+str(s),transform = ax.transAxes)
-    #plt.text(0.05,0.8,'NSE = ' +str(RegStats.NSE),transform = ax.transAxes)
-    pos +=1
+# One pass over the outputs, keeping only each test's harvest window and the whole run of the N balance check tests
+ObsPredCropN, ObsPredSoilN, Windows, CheckData = streamOutputs(os.path.join(inPath, "Outputs"), [
+    ObsPred(ObsCropN, 'CropN', obsKeys, TestsFrame.Site, windows),
+    ObsPred(ObsSoilN, 'SoilMineralN', obsKeys, TestsFrame.Site, windows),
+    Series(['SoilMineralN','CropN'], windows=windows),
+    Series(NbalComponents, [c for c in NbalComponents if toAccumulate[c]],
+           tests=[rot+str(N)+irr+crop for N in [1,2,3,4]])])
+
+AllObsPred = pd.concat({'CropN': ObsPredCropN, 'SoilMineralN': ObsPredSoilN}, names=['Variable'])
+SiteStats = regressionStats(AllObsPred, by=['Variable','Site'])
+SetStats = regressionStats(AllObsPred, by='Variable')
+Stats = pd.concat([SetStats.assign(Site='All').set_index('Site',append=True), SiteStats])
+os.makedirs(outPath, exist_ok=True)
+Stats.to_csv(os.path.join(outPath, "1-WS1_Stats.csv"))
 
+sites = list(ObsPredCropN.index.get_level_values(0).drop_duplicates())
 
-Obs = ObsPredSoilN.obs.values
-Pred = ObsPredSoilN.pred.values
-graph = plt.figure(figsize = (5,5))
-ax = graph.add_subplot(1,1,1)
-plt.plot(Obs,Pred,'o')
-#RegStats = MUte.MathUtilities.CalcRegressionStats('LN',Pred,Obs)
-#plt.text(0.05,0.8,'NSE = ' +str(RegStats.NSE),transform = ax.transAxes)
-plt.ylabel('Predicted')
-plt.xlabel('Observed')
+def plotSiteObsPred(Graph, ObsPred, variable):
+    pos = 0
+    for s in sites:
+        Obs = ObsPred.loc[s,'obs'].values
+        Pred = ObsPred.loc[s,'pred'].values
+        ax = Graph.axes[pos]
+        figures.line(ax,Obs,Pred,linestyle='None',marker='o',color='C0')
+        maxval = max(ObsPred.loc[s,'obs'].max(),ObsPred.loc[s,'pred'].max()) * 1.05
+        ax.set_ylim(-10,maxval)
+        ax.set_xlim(-10,maxval)
+        figures.line(ax,[0,maxval],[0,maxval],color='C1')
+        figures.text(ax,0.05,0.9,'site '+str(s),transform = ax.transAxes)
+        figures.text(ax,0.05,0.8,'NSE = %.2f' % SiteStats.loc[(variable,s),'NSE'],transform = ax.transAxes)
+        pos +=1
+
+def plotObsPred(Graph, ObsPred, variable):
+    Obs = ObsPred.obs.values
+    Pred = ObsPred.pred.values
+    ax = Graph.axes[0]
+    figures.line(ax,Obs,Pred,linestyle='None',marker='o',color='C0')
+    figures.text(ax,0.05,0.9,'NSE = %.2f' % SetStats.loc[variable,'NSE'],transform = ax.transAxes)
+    ax.set_ylabel('Predicted')
+    ax.set_xlabel('Observed')
 
 
 # +
@@ -212,27 +157,25 @@ def setLineStyle(treat):
 
 # -
 
-for s in sites:
-    Graph = plt.figure(figsize=(10,12))
+def plotSiteTimeCourse(Graph, s):
     testsAtSite = TestsFrame.loc[TestsFrame.Site==s,:].index.values
     cropsAtSite = []
     for t in testsAtSite:
         cropsAtSite.append(t.split("_")[3])
     cropsAtSite = list(set(cropsAtSite))
-    pos = 1
-    row_num=int(len(testsAtSite)/8)
+    pos = 0
     for cro in cropsAtSite:
         for v in ['SoilMineralN','CropN']:
-            ax = Graph.add_subplot(row_num,2,pos)
+            ax = Graph.axes[pos]
             pos+=1
             for i in ['Irr1','Irr2']:
                 for n in ['N1','N2','N3','N4']:
                     test = s+"_"+n+"_"+i+"_"+cro
                     mec = setEdgeColor(test)
                     mfc = setFillColor(test)
-                    dates = AllData.loc[Configs.loc["PriorHarvestDate",test]:Configs.loc["CurrentHarvestDate",test],(test,v)].index
-                    Data = AllData.loc[dates,(test,v)]
-                    plt.plot(Data,setLineStyle(test),color=mec,label=i)
+                    Data = Windows[test][v]
+                    dates = Data.index
+                    figures.line(ax,Data.index,Data.values,linestyle=setLineStyle(test),color=mec,label=i)
 
                     site = s+"_"+n+"_"+i
                     if v == 'CropN':
@@ -240,33 +183,37 @@ for s in sites:
                     if v == 'SoilMineralN':
                         sData = observedSoil.loc[site,:]
                     dFilter = [dates.min() <= sData['Date'].iloc[x] <= dates.max() for x in range(len(sData['Date']))]
-                    plt.plot(sData.loc[dFilter,'Date'],sData.loc[dFilter,v],'o',mec=mec,mfc=mfc)
-            plt.title(s+cro)
-            plt.xticks(rotation=60)
+                    figures.line(ax,sData.loc[dFilter,'Date'].values,sData.loc[dFilter,v].values,linestyle='None',marker='o',color='C0',mec=mec,mfc=mfc)
+            ax.set_title(s+cro)
+            ax.tick_params(axis='x',labelrotation=60)
             ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b-%y'))
             #plt.legend()
     Graph.tight_layout(pad=1.5)
-    plt.savefig(os.path.join(outPath, "1-WS1_"+s+"TimeCourse.png"))
 
-NbalComponents = ['SoilMineralN', 'UptakeN', 'ResidueN', 'SoilOMN', 'FertiliserN',
-       'CropN', 'NDemand','LostN']
-accumulate = [False,True,True,True,True,False,False,True]
-toAccumulate = dict(zip(NbalComponents,accumulate))
 
-rot = 'HawkesBayRot3_N'
-irr = '_Irr2_'
-crop = 'Ryegrass'
+jobs = [
+    FigureJob("1-WS1_CropNSites.png", plotSiteObsPred, (ObsPredCropN,'CropN'), (10,10), (3,3)),
+    FigureJob("1-WS1_CropNAll.png", plotObsPred, (ObsPredCropN,'CropN'), (5,5), (1,1)),
+    FigureJob("1-WS1_SoilMineralNSites.png", plotSiteObsPred, (ObsPredSoilN,'SoilMineralN'), (10,10), (3,3)),
+    FigureJob("1-WS1_SoilMineralNAll.png", plotObsPred, (ObsPredSoilN,'SoilMineralN'), (5,5), (1,1)),
+]
+for s in sites:
+    testsAtSite = list(TestsFrame.loc[TestsFrame.Site==s,:].index.values)
+    row_num = int(len(testsAtSite)/8)
+    siteInputs = ({t: Windows[t] for t in testsAtSite},
+                  observedCrop.loc[observedCrop.index.str.startswith(s+"_",na=False),:],
+                  observedSoil.loc[observedSoil.index.str.startswith(s+"_",na=False),:],
+                  Configs.reindex(testsAtSite)[["PriorHarvestDate","CurrentHarvestDate"]])
+    jobs.append(FigureJob("1-WS1_"+s+"TimeCourse.png", plotSiteTimeCourse, (s,), (10,12), (row_num,2), siteInputs))
+renderFigures(jobs, outPath)
+
 Graph = plt.figure(figsize=(5,15))
 pos = 1
 for nbc in NbalComponents:
     ax = Graph.add_subplot(8,1,pos)
     for N in [1,2,3,4]:
         sim = rot+str(N)+irr+crop
-        if toAccumulate[nbc] == False:
-            CheckData = AllData.loc[:,sim].dropna()
-        if toAccumulate[nbc] == True:
-            CheckData = AllData.loc[:,sim].dropna().cumsum()
-        plt.plot(CheckData.loc[:,nbc],'-')
+        plt.plot(CheckData[sim].loc[:,nbc],'-')
         plt.text(0.05,0.95,nbc,transform=ax.transAxes)
     pos +=1
 # ax = Graph.add_subplot(6,1,2)
@@ -19,9 +19,9 @@
 
 # +
 import os 
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
-import datetime as dt
 import matplotlib.dates as mdates
 
 CBcolors = {
@@ -40,13 +40,10 @@ CBcolors = {
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         inPath = os.path.join(root, "TestComponents", "TestSets", "WS2")
         outPath = os.path.join(root, "TestGraphs", "Outputs") 
-        localDayFirst = False
-        localDateFormat = '%m/%d/%Y %H:%M:%S'
 except: 
-    localDayFirst = True
-    localDateFormat = '%d/%m/%Y %H:%M:%S %p'
     rootfrags = os.path.abspath('WS2.py').split("\\")
     root = ""
     for d in rootfrags:
@@ -54,193 +51,150 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     inPath = os.path.join(root,"FieldNBalance","TestComponents", "TestSets", "WS2")
     outPath = os.path.join(root,"FieldNBalance","TestGraphs", "Outputs")   
 
-Configs = pd.read_pickle(os.path.join(inPath, "FieldConfigs.pkl"))
+from validation import listTests, parseDates
+from validation.aggregate import ObsPred, Series, streamOutputs
+from validation.obspred import harvestWindows, observedMeans
+from validation.configs import readConfigs
+from validation.stats import regressionStats
+from validation import figures
+from validation.render import FigureJob, renderFigures
+
+Configs = readConfigs(inPath)
 
 observedCrop = pd.read_csv(os.path.join(inPath, "CropData.csv"), index_col=0)
 observedCrop.sort_index(axis=0,inplace=True)
-observedCrop['Date'] = pd.to_datetime(observedCrop['Date'],dayfirst=True)
+observedCrop['Date'] = parseDates(observedCrop['Date'])
 
 observedSoil = pd.read_csv(os.path.join(inPath, "SoilData.csv"),index_col=0)
 observedSoil.sort_index(axis=0,inplace=True)
-observedSoil['Date'] = pd.to_datetime(observedSoil['Date'],dayfirst=True)
+observedSoil['Date'] = parseDates(observedSoil['Date'])
 observedSoil['SoilMineralN'] = observedSoil.loc[:,['SoilN0_15', 'SoilN15_30']].sum(axis=1)
 
-testFiles = []
-tests = []
-for file in os.listdir(os.path.join(inPath,"Outputs")):
-    if file.endswith('.csv'):
-        testFiles.append(file)
-        tests.append(file.replace(".csv",""))
-
-# +
-Alltests =[]
-for t in testFiles[:]:  
-    testframe = pd.read_csv(os.path.join(inPath, "Outputs", t),index_col=0,dayfirst=localDayFirst,date_format=localDateFormat)  
-    Alltests.append(testframe)   
-
-AllData = pd.concat(Alltests,axis=1,keys=tests)
-AllData.sort_index(axis=0,inplace=True)
-AllData.index = pd.to_datetime(AllData.index)
-# -
+tests = listTests(os.path.join(inPath, "Outputs"))
 
 TestsFrame = pd.DataFrame(index = [int(x[0]) for x in tests],data=tests,columns = ['crop'])
 TestsFrame.index.name = 'Site'
 
-ObsPredIndex = pd.MultiIndex.from_product([tests,AllData.index],names=['Treatment','Date'])
-ObsPredCropN = pd.DataFrame(index = ObsPredIndex, columns = ['obs','pred'])
-ObsPredCropN.loc[:,'Site'] =  [int(ObsPredIndex[x][0][0]) for x in range(ObsPredIndex.size)]
-ObsPredCropN.set_index('Site',append=True,inplace=True)
-ObsPredCropN = ObsPredCropN.reorder_levels(['Site','Treatment','Date'],axis=0)
-ObsPredCropN = ObsPredCropN.sort_index()
-
-ObsCropN = observedCrop.loc[:,['Date','CropN']]
-ObsCropN.loc[:,'Date'] = [(ObsCropN.iloc[x,0] + dt.timedelta(hours=12)) for x in range(ObsCropN.index.size)]
-ObsCropN.set_index('Date',append=True,inplace=True)
-ObsCropN.columns = ['obs']
-ObsCropN = ObsCropN.groupby(['Site','Date']).mean()
-for t in tests:
-    s = int(t[0])
-    obs = ObsCropN.loc[s,:]
-    obs.sort_index(inplace=True)
-    dates = AllData.loc[Configs.loc["PriorHarvestDate",t]:Configs.loc["CurrentHarvestDate",t],(t,'CropN')].index
-    Pred = AllData.loc[dates,(t,'CropN')]
-    pred = Pred.reindex(obs.index.values)
-    pred.sort_index(axis=0, inplace=True)
-    for d in obs.index.values:
-        ObsPredCropN.loc[(s,t,d),'pred'] = pred[d]
-        ObsPredCropN.loc[(s,t,d), 'obs'] = obs.loc[d,'obs']
-
-graph = plt.figure(figsize=(10,10))
-pos = 1
-for s in range(1,10):
-    Obs = ObsPredCropN.loc[s,'obs']
-    Pred = ObsPredCropN.loc[s,'pred']
-    #RegStats = MUte.MathUtilities.CalcRegressionStats('LN',Pred,Obs)
-    ax = graph.add_subplot(3,3,pos)
-    plt.plot(Obs,Pred,'o')
-    maxval = max(ObsPredCropN.loc[s,'obs'].max(),ObsPredCropN.loc[s,'pred'].max()) * 1.05
-    plt.ylim(-10,maxval)
-    plt.xlim(-10,maxval)
-    plt.plot([0,maxval],[0,maxval],'-')
-    plt.text(0.05,0.9,'site '+str(s),transform = ax.transAxes)
-    #plt.text(0.05,0.8,'NSE = ' +str(RegStats.NSE),transform = ax.transAxes)
-    pos +=1
+testSites = pd.Series([int(t[0]) for t in tests], index=tests)
+windows = harvestWindows(Configs, tests)
 
+ObsCropN = observedMeans(observedCrop, 'CropN')
+ObsSoilN = observedMeans(observedSoil, 'SoilMineralN')
 
-Obs = ObsPredCropN.obs.values
-Pred = ObsPredCropN.pred.values
-graph = plt.figure(figsize = (5,5))
-ax = graph.add_subplot(1,1,1)
-plt.plot(Obs,Pred,'o')
-plt.plot([0,500],[0,500],'-')
-#RegStats = MUte.MathUtilities.CalcRegressionStats('LN',Pred,Obs)
-#plt.text(0.05,0.8,'NSE = ' +str(RegStats.NSE),transform = ax.transAxes)
-plt.ylabel('Predicted')
-plt.xlabel('Observed')
-
-ObsSoilN = observedSoil.loc[:,['Date','SoilMineralN']]
-ObsSoilN.loc[:,'Date'] = [(ObsSoilN.iloc[x,0] + dt.timedelta(hours=12)) for x in range(ObsSoilN.index.size)]
-ObsSoilN.set_index('Date',append=True,inplace=True)
-ObsSoilN.columns = ['obs']
-ObsSoilN = ObsSoilN.groupby(['Site','Date']).mean()
-blankIndex = pd.MultiIndex.from_product([[],[],[]], names = ['site','test','date'])
-ObsPredSoilN = pd.DataFrame(index = blankIndex, columns = ['obs','pred'])
-for t in tests:
-    s = int(t[0])
-    obs = ObsSoilN.loc[s,:]
-    dates = AllData.loc[Configs.loc["PriorHarvestDate",t]:Configs.loc["CurrentHarvestDate",t],(t,'SoilMineralN')].index
-    Pred = AllData.loc[dates,(t,'SoilMineralN')]
-    pred = Pred.reindex(obs.index.values)
-    for d in obs.index.values:
-        ObsPredSoilN.loc[(s,t,d),'pred'] = pred[d]
-        ObsPredSoilN.loc[(s,t,d), 'obs'] = obs.loc[d,'obs']
-
-graph = plt.figure(figsize=(10,10))
-pos = 1
-for s in range(1,10):
-    Obs = ObsPredSoilN.loc[s,'obs']
-    Pred = ObsPredSoilN.loc[s,'pred']
-    #RegStats = MUte.MathUtilities.CalcRegressionStats('LN',Pred,Obs)
-    ax = graph.add_subplot(3,3,pos)
-    plt.plot(Obs,Pred,'o')
-    maxval = max(ObsPredSoilN.loc[s,'obs'].max(),ObsPredSoilN.loc[s,'pred'].max()) * 1.05
-    plt.ylim(-10,maxval)
-    plt.xlim(-10,maxval)
-    plt.plot([0,maxval],[0,maxval],'-')
-    plt.text(0.05,0.9,'site '+str(s),transform = ax.transAxes)
-    #plt.text(0.05,0.8,'NSE = ' +str(RegStats.NSE),transform = ax.transAxes)
-    pos +=1
+NbalComponents = ['UptakeN', 'ResidueN', 'SoilOMN', 'FertiliserN','NDemand','LostN']
+accumulate = [True,True,True,True,False,True]
+toAccumulate = dict(zip(NbalComponents,accumulate))
 
+timeCourseTest = '8-3Oat'
+
+# One pass over the outputs, keeping only each test's harvest window and the N balance of the time course test
+ObsPredCropN, ObsPredSoilN, Windows, TimeCourse = streamOutputs(os.path.join(inPath, "Outputs"), [
+    ObsPred(ObsCropN, 'CropN', testSites, testSites, windows),
+    ObsPred(ObsSoilN, 'SoilMineralN', testSites, testSites, windows),
+    Series(['SoilMineralN','CropN'], windows=windows),
+    Series(['SoilMineralN','CropN'] + NbalComponents, [c for c in NbalComponents if toAccumulate[c]], windows,
+           tests=[timeCourseTest])])
+
+AllObsPred = pd.concat({'CropN': ObsPredCropN, 'SoilMineralN': ObsPredSoilN}, names=['Variable'])
+SiteStats = regressionStats(AllObsPred, by=['Variable','Site'])
+SetStats = regressionStats(AllObsPred, by='Variable')
+Stats = pd.concat([SetStats.assign(Site='All').set_index('Site',append=True), SiteStats])
+os.makedirs(outPath, exist_ok=True)
+Stats.to_csv(os.path.join(outPath, "2-WS2_Stats.csv"))
+
+def plotSiteObsPred(Graph, ObsPred, variable):
+    pos = 0
+    for s in range(1,10):
+        Obs = ObsPred.loc[s,'obs'].values
+        Pred = ObsPred.loc[s,'pred'].values
+        ax = Graph.axes[pos]
+        figures.line(ax,Obs,Pred,linestyle='None',marker='o',color='C0')
+        maxval = max(ObsPred.loc[s,'obs'].max(),ObsPred.loc[s,'pred'].max()) * 1.05
+        ax.set_ylim(-10,maxval)
+        ax.set_xlim(-10,maxval)
+        figures.line(ax,[0,maxval],[0,maxval],color='C1')
+        figures.text(ax,0.05,0.9,'site '+str(s),transform = ax.transAxes)
+        figures.text(ax,0.05,0.8,'NSE = %.2f' % SiteStats.loc[(variable,s),'NSE'],transform = ax.transAxes)
+        pos +=1
+
+def plotObsPred(Graph, ObsPred, variable, maxval=None):
+    Obs = ObsPred.obs.values
+    Pred = ObsPred.pred.values
+    ax = Graph.axes[0]
+    figures.line(ax,Obs,Pred,linestyle='None',marker='o',color='C0')
+    if maxval != None:
+        figures.line(ax,[0,maxval],[0,maxval],color='C1')
+    figures.text(ax,0.05,0.9,'NSE = %.2f' % SetStats.loc[variable,'NSE'],transform = ax.transAxes)
+    ax.set_ylabel('Predicted')
+    ax.set_xlabel('Observed')
 
-Obs = ObsPredSoilN.obs.values
-Pred = ObsPredSoilN.pred.values
-graph = plt.figure(figsize = (5,5))
-ax = graph.add_subplot(1,1,1)
-plt.plot(Obs,Pred,'o')
-#RegStats = MUte.MathUtilities.CalcRegressionStats('LN',Pred,Obs)
-#plt.text(0.05,0.8,'NSE = ' +str(RegStats.NSE),transform = ax.transAxes)
-plt.ylabel('Predicted')
-plt.xlabel('Observed')
 
 # +
 colors = ['orange','green']
 
-for s in range(1,10):
-    Graph = plt.figure(figsize=(10,15))
+def plotSite(Graph, s):
     testsAtSite = TestsFrame.loc[s,'crop'].values
-    row_num=len(testsAtSite)
-    pos = 1
+    pos = 0
     for t in testsAtSite: #['1Gra-A']:#tests:
         site = t[0]
         site = int(site)
 
-        dates = AllData.loc[Configs.loc["PriorHarvestDate",t]:Configs.loc["CurrentHarvestDate",t],(t,'CropN')].index
+        dates = Windows[t].index
         c = 0    
         for v in ['SoilMineralN','CropN']:
-            ax = Graph.add_subplot(row_num,2,pos)
-            Data = AllData.loc[dates,(t,v)]
-            plt.plot(Data,color=CBcolors[colors[c]],label=v)
+            ax = Graph.axes[pos]
+            Data = Windows[t][v]
+            figures.line(ax,Data.index,Data.values,color=CBcolors[colors[c]],label=v)
 
             if v == 'CropN':
                 sData = observedCrop.loc[site,:]
             if v == 'SoilMineralN':
                 sData = observedSoil.loc[site,:]
             dFilter = [dates.min() <= sData['Date'].iloc[x] <= dates.max() for x in range(len(sData['Date']))]
-            plt.plot(sData.loc[dFilter,'Date'],sData.loc[dFilter,v],'o',color=CBcolors[colors[c]])
+            figures.line(ax,sData.loc[dFilter,'Date'].values,sData.loc[dFilter,v].values,linestyle='None',marker='o',color=CBcolors[colors[c]])
 
-            plt.title(t)
-            plt.xticks(rotation=60)
+            ax.set_title(t)
+            ax.tick_params(axis='x',labelrotation=60)
             ax.xaxis.set_major_formatter(mdates.DateFormatter('%#d-%b-%y'))
             #plt.ylim(0,800)
-            plt.legend()
+            ax.legend()
             pos+=1
             c+=1
     Graph.tight_layout(pad=1.5)
-    plt.savefig(os.path.join(outPath, "2-WS2 Site "+str(s) +".png"))
 
 
-# +
-NbalComponents = ['UptakeN', 'ResidueN', 'SoilOMN', 'FertiliserN','NDemand','LostN']
-accumulate = [True,True,True,True,False,True]
-toAccumulate = dict(zip(NbalComponents,accumulate))
+jobs = [
+    FigureJob("2-WS2 CropN Sites.png", plotSiteObsPred, (ObsPredCropN,'CropN'), (10,10), (3,3)),
+    FigureJob("2-WS2 CropN All.png", plotObsPred, (ObsPredCropN,'CropN',500), (5,5), (1,1)),
+    FigureJob("2-WS2 SoilMineralN Sites.png", plotSiteObsPred, (ObsPredSoilN,'SoilMineralN'), (10,10), (3,3)),
+    FigureJob("2-WS2 SoilMineralN All.png", plotObsPred, (ObsPredSoilN,'SoilMineralN'), (5,5), (1,1)),
+]
+for s in range(1,10):
+    testsAtSite = list(TestsFrame.loc[s,'crop'].values)
+    siteInputs = ({t: Windows[t] for t in testsAtSite}, observedCrop.loc[[s],:], observedSoil.loc[[s],:], Configs.reindex(testsAtSite)[["PriorHarvestDate","CurrentHarvestDate"]])
+    jobs.append(FigureJob("2-WS2 Site "+str(s) +".png", plotSite, (s,), (10,15), (len(testsAtSite),2), siteInputs))
+renderFigures(jobs, outPath)
 
+
+# +
 colors = ['orange','green']
 Graph = plt.figure(figsize=(10,10))
 pos = 1
 row_num=len(tests)
 
-t = '8-3Oat'
+t = timeCourseTest
 site = t[0]
 site = int(site)
 
-dates = AllData.loc[Configs.loc["PriorHarvestDate",t]:Configs.loc["CurrentHarvestDate",t],(t,'CropN')].index
+dates = TimeCourse[t].index
 c = 0    
 for v in ['SoilMineralN','CropN']:
     ax = Graph.add_subplot(5,2,pos)
-    Data = AllData.loc[dates,(t,v)]
+    Data = TimeCourse[t][v]
     plt.plot(Data,color=CBcolors[colors[c]],label=v)
 
     if v == 'CropN':
@@ -260,10 +214,7 @@ for v in ['SoilMineralN','CropN']:
     
 for nbc in NbalComponents:
     ax = Graph.add_subplot(5,2,pos)
-    if toAccumulate[nbc] == False:
-        Data = AllData.loc[dates,(t,nbc)]
-    if toAccumulate[nbc] == True:
-        Data = AllData.loc[dates,(t,nbc)].cumsum()
+    Data = TimeCourse[t][nbc]
     plt.plot(Data,label=nbc)
     plt.legend()
     pos +=1
@@ -0,0 +1,45 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Times the stages of the validation pipeline on synthetic test sets.
+
+    python TestGraphs/bench.py                          every stage at 10, 100 and 1000 treatments
+    python TestGraphs/bench.py 10000 --stages stream    one stage at 10,000 treatments
+    python TestGraphs/bench.py --compare 1a2b3c4        this commit's saved results against 1a2b3c4's
+    python TestGraphs/bench.py --compare 1a2b3c4 5d6e7f8
+
+Results are saved in TestGraphs/benchmarks/results under the commit checked
+out.  The synthetic sets are made the first time each size is run and kept in
+TestGraphs/benchmarks/.cache; the 10,000 treatment set takes about 600 MB.
+"""
+
+import os
+import sys
+import argparse
+
+# Figures are only ever saved, never shown
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from benchmarks.stages import stages
+from benchmarks.suite import commitId, compareResults, defaultSizes, resultsTable, runBenchmarks, saveResults
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("sizes", nargs="*", type=int, default=defaultSizes, help="numbers of treatments (default: 10 100 1000)")
+parser.add_argument("--stages", nargs="+", choices=[s.name for s in stages], help="stages to time (default: all)")
+parser.add_argument("--repeat", type=int, default=3, help="runs of each stage, the fastest is kept (default: 3)")
+parser.add_argument("--no-save", dest="save", action="store_false", help="don't save the results")
+parser.add_argument("--compare", nargs="+", metavar="COMMIT", help="compare saved results of one commit with another, or with this one")
+args = parser.parse_args()
+
+if args.compare:
+    old, new = (args.compare + [commitId()])[:2]
+    table = compareResults(old, new)
+    print(f"before: {old}  after: {new}")
+    print(table.to_string(float_format=lambda x: f"{x:.3f}"))
+    sys.exit(1 if (table['change'] == 'slower').any() else 0)
+
+results = runBenchmarks(args.sizes, args.stages, args.repeat)
+print(resultsTable(results).to_string(float_format=lambda x: f"{x:.3f}"))
+if args.save:
+    print(f"Saved to {saveResults(results)}")
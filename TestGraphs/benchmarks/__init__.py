@@ -0,0 +1,5 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Benchmarks of the validation pipeline on synthetic test sets, run by bench.py."""
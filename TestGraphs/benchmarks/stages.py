@@ -0,0 +1,214 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""The stages of the validation pipeline that are timed, each on its own.
+
+A Stage has a setup function that takes the path of a test set and a
+scratch folder and returns whatever the stage starts from, and a run
+function of that which is the part timed.  Setup isn't timed, so each
+stage's time is only its own work, e.g. the obs/pred stage starts from
+outputs already parsed.
+"""
+
+import os
+import shutil
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from validation import loadOutputs, parseDates
+from validation.aggregate import ObsPred, Series, streamOutputs
+from validation.configs import readConfigs, writeConfigs
+from validation.obspred import harvestWindows, observedMeans
+from validation.packed import refreshPacked
+from validation.render import FigureJob, renderFigures
+from validation.stats import regressionStats
+from validation.workbook import readSheet, readWorkbook
+
+Stage = namedtuple('Stage', ['name', 'setup', 'run'])
+
+
+def _scratch(work, name):
+    path = os.path.join(work, name)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+
+def _observations(setPath):
+    crop = pd.read_csv(os.path.join(setPath, 'CropData.csv'), index_col=0)
+    crop['Date'] = parseDates(crop['Date'])
+    soil = pd.read_csv(os.path.join(setPath, 'SoilData.csv'), index_col=0)
+    soil['Date'] = parseDates(soil['Date'])
+    soil['SoilMineralN'] = soil[['SoilN0_15', 'SoilN15_30']].sum(axis=1)
+    return observedMeans(crop, 'CropN'), observedMeans(soil, 'SoilMineralN')
+
+
+def _obsPredReducers(setPath, tests):
+    windows = harvestWindows(readConfigs(setPath), tests)
+    sites = pd.Series([t.split('_')[0] for t in tests], index=tests)
+    keys = pd.Series(tests, index=tests)
+    obsCropN, obsSoilN = _observations(setPath)
+    return [ObsPred(obsCropN, 'CropN', keys, sites, windows),
+            ObsPred(obsSoilN, 'SoilMineralN', keys, sites, windows)]
+
+
+def _tests(setPath):
+    return sorted(readConfigs(setPath, coefficients=[]).index)
+
+
+# MakeConfigs conversion: workbook to FieldConfigs.csv and .parquet
+
+def setupConfigs(setPath, work):
+    return os.path.join(setPath, 'FieldConfigs.xlsx'), _scratch(work, 'configs')
+
+
+def runConfigs(state):
+    workbook, outPath = state
+    sheets = readWorkbook(workbook, cache=False)
+    configs = readSheet(sheets, nrows=45, usecols=lambda x: 'Unnamed' not in x)
+    configs.set_index('Name', inplace=True)
+    writeConfigs(configs.items(), outPath)
+
+
+# Output ingestion: every csv into the wide frame, from the csvs and from the parquet cache, and streamed
+# from the csvs and from the packed copy
+
+def setupIngest(setPath, work):
+    return os.path.join(setPath, 'Outputs'), _scratch(work, 'ingest')
+
+
+def runIngest(state):
+    outputsPath, cachePath = state
+    loadOutputs(outputsPath, cache=False, cachePath=cachePath)
+
+
+def setupIngestCached(setPath, work):
+    outputsPath, cachePath = setupIngest(setPath, work)
+    loadOutputs(outputsPath, cachePath=cachePath)
+    return outputsPath, cachePath
+
+
+def runIngestCached(state):
+    outputsPath, cachePath = state
+    loadOutputs(outputsPath, cachePath=cachePath)
+
+
+def setupStream(setPath, work):
+    tests = _tests(setPath)
+    return os.path.join(setPath, 'Outputs'), harvestWindows(readConfigs(setPath), tests)
+
+
+def runStream(state):
+    outputsPath, windows = state
+    streamOutputs(outputsPath, [Series(['SoilMineralN', 'CropN'], windows=windows)], cache=False)
+
+
+def setupStreamPacked(setPath, work):
+    outputsPath, windows = setupStream(setPath, work)
+    refreshPacked(outputsPath)
+    return outputsPath, windows
+
+
+def runStreamPacked(state):
+    outputsPath, windows = state
+    streamOutputs(outputsPath, [Series(['SoilMineralN', 'CropN'], windows=windows)])
+
+
+# Obs/pred alignment and statistics, from outputs already parsed
+
+def setupObsPred(setPath, work):
+    tests = _tests(setPath)
+    frames, = streamOutputs(os.path.join(setPath, 'Outputs'), [Series(['SoilMineralN', 'CropN'])])
+    return setPath, tests, frames
+
+
+def obsPredTable(setPath, tests, frames):
+    reducers = _obsPredReducers(setPath, tests)
+    for test in tests:
+        for reducer in reducers:
+            reducer.add(test, frames[test])
+    return pd.concat({'CropN': reducers[0].result(), 'SoilMineralN': reducers[1].result()}, names=['Variable'])
+
+
+def runObsPred(state):
+    obsPred = obsPredTable(*state)
+    regressionStats(obsPred, by=['Variable', 'Site'])
+    regressionStats(obsPred, by='Variable')
+
+
+# Figure rendering: obs/pred scatters and a line per treatment
+
+def plotObsPred(Graph, obsPred):
+    ax = Graph.add_subplot(1, 1, 1)
+    ax.plot(obsPred['obs'].to_numpy(), obsPred['pred'].to_numpy(), 'o')
+    maxval = np.nanmax(obsPred[['obs', 'pred']].to_numpy()) * 1.05
+    ax.plot([0, maxval], [0, maxval], color='C1')
+    ax.set_xlabel('Observed')
+    ax.set_ylabel('Predicted')
+
+
+def plotLines(Graph, frames, variable):
+    ax = Graph.add_subplot(1, 1, 1)
+    for test, frame in frames.items():
+        ax.plot(frame.index, frame[variable].to_numpy(), linewidth=0.5)
+    ax.set_ylabel(variable)
+    ax.tick_params(axis='x', labelrotation=60)
+
+
+def figureJobs(obsPred, frames):
+    return [FigureJob('CropN ObsPred.png', plotObsPred, (obsPred.loc['CropN'],), (5, 5)),
+            FigureJob('SoilMineralN ObsPred.png', plotObsPred, (obsPred.loc['SoilMineralN'],), (5, 5)),
+            FigureJob('CropN.png', plotLines, (frames, 'CropN'), (10, 5)),
+            FigureJob('SoilMineralN.png', plotLines, (frames, 'SoilMineralN'), (10, 5))]
+
+
+def setupRender(setPath, work):
+    setPath, tests, frames = setupObsPred(setPath, work)
+    return figureJobs(obsPredTable(setPath, tests, frames), frames), _scratch(work, 'figures')
+
+
+def runRender(state):
+    jobs, outPath = state
+    renderFigures(jobs, outPath, verbose=False, cache=False)
+
+
+# Report assembly: the report.py script over the rendered figures
+
+def setupReport(setPath, work):
+    jobs, figures = setupRender(setPath, work)
+    renderFigures(jobs, figures, verbose=False, cache=False)
+    root = _scratch(work, 'report')
+    os.makedirs(os.path.join(root, 'TestGraphs'))
+    shutil.copytree(figures, os.path.join(root, 'TestGraphs', 'Outputs'))
+    return root
+
+
+def runReport(root):
+    import runpy
+    # Time a full build, not one with every thumbnail already made
+    shutil.rmtree(os.path.join(root, 'html'), ignore_errors=True)
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'report.py')
+    saved = os.getcwd(), os.environ.get('GITHUB_WORKSPACE')
+    os.environ['GITHUB_WORKSPACE'] = root
+    os.chdir(root)
+    try:
+        runpy.run_path(script, run_name='report')
+    finally:
+        os.chdir(saved[0])
+        if saved[1] is None:
+            del os.environ['GITHUB_WORKSPACE']
+        else:
+            os.environ['GITHUB_WORKSPACE'] = saved[1]
+
+
+stages = [
+    Stage('configs', setupConfigs, runConfigs),
+    Stage('ingest', setupIngest, runIngest),
+    Stage('ingestCached', setupIngestCached, runIngestCached),
+    Stage('stream', setupStream, runStream),
+    Stage('streamPacked', setupStreamPacked, runStreamPacked),
+    Stage('obspred', setupObsPred, runObsPred),
+    Stage('render', setupRender, runRender),
+    Stage('report', setupReport, runReport),
+]
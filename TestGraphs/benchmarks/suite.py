@@ -0,0 +1,130 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Timing of the pipeline stages over synthetic sets and keeping of the results.
+
+Each stage is run repeat times on a synthetic set of each size, after its
+untimed setup, and the fastest and median times are kept.  The results of a
+run are saved as results/<commit>.json, merged with any earlier run at the
+same commit, so runs at two commits can be compared with compareResults().
+A commit with uncommitted changes is saved as <commit>-dirty.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import subprocess
+import pandas as pd
+from .stages import stages
+from .synthetic import syntheticSet
+
+resultsVersion = 1
+
+defaultSizes = [10, 100, 1000]
+
+benchmarksPath = os.path.dirname(os.path.abspath(__file__))
+resultsPath = os.path.join(benchmarksPath, 'results')
+cachePath = os.path.join(benchmarksPath, '.cache')
+
+
+def commitId():
+    """Short hash of the commit checked out, with -dirty if there are uncommitted changes, or 'unknown'."""
+    def git(*args):
+        return subprocess.run(['git'] + list(args), cwd=benchmarksPath, capture_output=True, text=True, check=True).stdout.strip()
+    try:
+        commit = git('rev-parse', '--short', 'HEAD')
+        dirty = git('status', '--porcelain', '--untracked-files=no', '--', os.path.dirname(benchmarksPath))
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def timeStage(stage, setPath, workPath, repeat):
+    """Seconds each of repeat runs of stage took."""
+    state = stage.setup(setPath, workPath)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage.run(state)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def runBenchmarks(sizes=None, stageNames=None, repeat=3, verbose=True):
+    """Times every stage on a synthetic set of each size.
+
+    Returns {stage: {size: result}} where a result has the min and median
+    seconds of the repeats.
+    """
+    sizes = defaultSizes if sizes is None else sizes
+    selected = [s for s in stages if stageNames is None or s.name in stageNames]
+    results = {s.name: {} for s in selected}
+    for size in sizes:
+        setPath = syntheticSet(cachePath, size)
+        workPath = os.path.join(cachePath, 'work', str(size))
+        for stage in selected:
+            times = timeStage(stage, setPath, workPath, repeat)
+            results[stage.name][str(size)] = {'min': min(times), 'median': statistics.median(times), 'repeat': repeat}
+            if verbose:
+                print(f"{stage.name:>14} {size:>6}  {min(times):8.3f}s  (median {statistics.median(times):.3f}s of {repeat})")
+    return results
+
+
+def machine():
+    return {'python': sys.version.split()[0], 'pandas': pd.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def resultsFile(commit):
+    return os.path.join(resultsPath, commit + '.json')
+
+
+def saveResults(results, commit=None):
+    """Saves results under commit (default the one checked out), keeping results of other stages and sizes saved there before."""
+    commit = commit or commitId()
+    saved = loadResults(commit) if os.path.exists(resultsFile(commit)) else {'results': {}}
+    for stage, sizes in results.items():
+        saved['results'].setdefault(stage, {}).update(sizes)
+    saved.update({'version': resultsVersion, 'commit': commit, 'machine': machine(),
+                  'date': time.strftime('%Y-%m-%dT%H:%M:%S')})
+    os.makedirs(resultsPath, exist_ok=True)
+    with open(resultsFile(commit) + '.tmp', 'w') as f:
+        json.dump(saved, f, indent=1)
+    os.replace(resultsFile(commit) + '.tmp', resultsFile(commit))
+    return resultsFile(commit)
+
+
+def loadResults(commit):
+    with open(resultsFile(commit)) as f:
+        saved = json.load(f)
+    if saved.get('version') != resultsVersion:
+        raise ValueError(f"{resultsFile(commit)} is from another version of the benchmarks")
+    return saved
+
+
+def resultsTable(results):
+    """Fastest seconds of each stage (rows) at each size (columns)."""
+    table = pd.DataFrame({stage: {int(size): r.get('min') for size, r in sizes.items()}
+                          for stage, sizes in results.items()}).T
+    return table.reindex(columns=sorted(table.columns))
+
+
+def compareResults(old, new, threshold=1.2):
+    """Fastest times of each stage and size at commits old (before) and new (after), and their ratio.
+
+    Rows where new is more than threshold times slower than old are flagged
+    as regressions, and those more than threshold times faster as
+    improvements.  Machines differ, so compare runs from the same one.
+    """
+    before = resultsTable(loadResults(old)['results']).stack().rename('before')
+    after = resultsTable(loadResults(new)['results']).stack().rename('after')
+    table = pd.concat([before, after], axis=1).rename_axis(['Stage', 'Treatments'])
+    table['ratio'] = table['after'] / table['before']
+    table['change'] = ''
+    table.loc[table['ratio'] > threshold, 'change'] = 'slower'
+    table.loc[table['ratio'] < 1 / threshold, 'change'] = 'faster'
+    return table
@@ -0,0 +1,156 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Synthetic test sets of any size for the benchmarks.
+
+A synthetic set has the files of a real one: a FieldConfigs.xlsx laid out
+like the MakeConfigs workbooks, the FieldConfigs.csv and .parquet written
+from it, an Outputs folder with one csv per treatment in the format
+DataFrame.SaveCsv writes, and CropData.csv and SoilData.csv observations.
+
+Treatments are a WS1 style factorial, eight to a site (four N rates by two
+irrigation levels), and start from the first config of the Location set.
+Sites are spread over five years, so the sets have the spread of dates that
+makes the wide AllData frame mostly empty.  Output values are smooth
+random curves rather than model runs, as only their shape and size matter
+for timing.
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from validation.configs import readConfigs, writeConfigs
+from validation.driver import testSetsPath
+from validation.packed import outputColumns
+
+generatorVersion = 1
+
+stations = ['invercargill', 'ashburton', 'lincoln', 'levin', 'hastings', 'pukekohe']
+
+# Days from the prior harvest, where the outputs start, to each date of a synthetic config
+cropDays = {'PriorEstablishDate': -120, 'PriorHarvestDate': 0, 'CurrentEstablishDate': 75,
+            'CurrentHarvestDate': 190, 'FollowingEstablishDate': 220, 'FollowingHarvestDate': 250}
+
+
+def baseConfig():
+    """First config of the Location set, as its workbook gives it."""
+    config = readConfigs(os.path.join(testSetsPath, 'Location')).iloc[0]
+    return config.map(lambda v: '' if v is None or (not isinstance(v, str) and pd.isna(v)) else v)
+
+
+def treatmentNames(treatments):
+    return [f"Site{t // 8:04d}_N{t % 4 + 1}_Irr{t // 4 % 2 + 1}" for t in range(treatments)]
+
+
+def makeConfigs(treatments, seed=0):
+    """Configs of a synthetic set, a column per treatment like a workbook sheet."""
+    rng = np.random.default_rng(seed)
+    base = baseConfig()
+    names = treatmentNames(treatments)
+    configs = pd.DataFrame({n: base for n in names}, dtype=object)
+    sites = np.arange(treatments) // 8
+    start = pd.to_datetime([f'{2000 + s % 5}-01-25' for s in sites])
+    for coefficient, days in cropDays.items():
+        configs.loc[coefficient] = list(start + pd.Timedelta(days=days))
+    configs.loc['WeatherStation'] = [stations[s % len(stations)] for s in sites]
+    configs.loc['PMN'] = list(np.round(rng.uniform(20, 120, len(set(sites))), 1)[sites])
+    configs.loc['CurrentFieldYield'] = list(np.round(rng.uniform(4, 16, treatments), 1))
+    return configs
+
+
+def writeWorkbook(configs, path):
+    """Writes configs to FieldConfigs.xlsx in path with the layout of the MakeConfigs workbooks."""
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    sheet.append(['', 'Name'] + list(configs.columns))
+    for coefficient, values in configs.iterrows():
+        sheet.append(['', coefficient] + [v.to_pydatetime() if isinstance(v, pd.Timestamp) else v for v in values])
+    workbook.save(os.path.join(path, 'FieldConfigs.xlsx'))
+
+
+def _curve(rng, days, scale, rate):
+    """Smooth increasing curve with a little noise, like a crop N or cumulative uptake."""
+    t = np.arange(days)
+    mid = rng.uniform(0.3, 0.7) * days
+    return scale / (1 + np.exp(-rate * (t - mid))) * (1 + rng.normal(0, 0.01, days))
+
+
+def writeOutputs(configs, outputsPath, seed=0):
+    """Writes an output csv for each treatment, from its prior harvest to its following harvest."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(outputsPath, exist_ok=True)
+    days = cropDays['FollowingHarvestDate'] - cropDays['PriorHarvestDate'] + 1
+    for test in configs.columns:
+        start = configs.loc['PriorHarvestDate', test]
+        dates = pd.date_range(start, periods=days, freq='D').strftime('%d/%m/%Y 12:00:00 am')
+        crop = _curve(rng, days, rng.uniform(100, 300), 0.05)
+        values = np.column_stack([
+            np.abs(60 + np.cumsum(rng.normal(0, 2, days))),
+            np.diff(crop, prepend=0).clip(0),
+            rng.normal(0, 0.3, days),
+            np.abs(rng.normal(0.8, 0.2, days)),
+            np.where(rng.random(days) < 0.02, 50.0, 0.0),
+            crop,
+            crop * 0.4,
+            np.abs(rng.normal(0, 0.2, days)),
+            rng.uniform(0.4, 1, days),
+            np.abs(rng.normal(0, 1, days)),
+            np.where(rng.random(days) < 0.05, 20.0, 0.0),
+            _curve(rng, days, 1, 0.08),
+            crop,
+        ])
+        frame = pd.DataFrame(values, index=pd.Index(dates, name='Date'), columns=outputColumns)
+        frame.to_csv(os.path.join(outputsPath, test + '.csv'))
+
+
+def writeObservations(configs, outputsPath, path, perTest=6, seed=0):
+    """Writes CropData.csv and SoilData.csv with perTest noisy observations of each treatment.
+
+    Observations are of the output values in the treatment's current crop.
+    """
+    rng = np.random.default_rng(seed)
+    crop, soil = [], []
+    span = cropDays['CurrentHarvestDate'] - cropDays['PriorHarvestDate']
+    for test in configs.columns:
+        output = pd.read_csv(os.path.join(outputsPath, test + '.csv'), usecols=['CropN', 'SoilMineralN'])
+        days = np.sort(rng.choice(np.arange(1, span), perTest, replace=False))
+        dates = (configs.loc['PriorHarvestDate', test] + pd.to_timedelta(days, unit='D')).strftime('%Y-%m-%d')
+        noise = rng.normal(1, 0.1, (2, perTest))
+        crop.append(pd.DataFrame({'Site': test, 'Date': dates, 'CropN': output['CropN'].to_numpy()[days] * noise[0]}))
+        soilN = output['SoilMineralN'].to_numpy()[days] * noise[1]
+        soil.append(pd.DataFrame({'Site': test, 'Date': dates, 'SoilN0_15': soilN * 0.6, 'SoilN15_30': soilN * 0.4}))
+    pd.concat(crop).to_csv(os.path.join(path, 'CropData.csv'), index=False)
+    pd.concat(soil).to_csv(os.path.join(path, 'SoilData.csv'), index=False)
+
+
+def makeTestSet(path, treatments, seed=0):
+    """Writes a synthetic test set of treatments to path."""
+    os.makedirs(path, exist_ok=True)
+    configs = makeConfigs(treatments, seed)
+    writeWorkbook(configs, path)
+    writeConfigs(configs.items(), path)
+    outputsPath = os.path.join(path, 'Outputs')
+    writeOutputs(configs, outputsPath, seed)
+    writeObservations(configs, outputsPath, path, seed=seed)
+
+
+def syntheticSet(cachePath, treatments, seed=0):
+    """Path of a synthetic set of treatments in cachePath, made if it isn't there from an earlier run."""
+    path = os.path.join(cachePath, f"Synthetic{treatments}")
+    doneFile = os.path.join(path, 'Synthetic.json')
+    stamp = {'version': generatorVersion, 'treatments': treatments, 'seed': seed}
+    try:
+        with open(doneFile) as f:
+            if json.load(f) == stamp:
+                return path
+    except (OSError, ValueError):
+        pass
+    shutil.rmtree(path, ignore_errors=True)
+    makeTestSet(path, treatments, seed)
+    with open(doneFile, 'w') as f:
+        json.dump(stamp, f)
+    return path
@@ -0,0 +1,26 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Serves a page for browsing the test outputs, zoomable and filtered by test.
+
+    python TestGraphs/explore.py                     the outputs in TestComponents/TestSets at http://127.0.0.1:8050/
+    python TestGraphs/explore.py --source artifacts  the snapshots in artifacts (see snapshot.py)
+    python TestGraphs/explore.py --port 0            on any free port
+
+Series are downsampled on the server to the width of the plot, so thousands
+of them can be shown at once.  Stop the server with Ctrl+C.
+"""
+
+import argparse
+from validation.driver import testSetsPath
+from validation.explorer import serveExplorer
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--source", default=testSetsPath, help="folder of test sets or snapshots (default: TestComponents/TestSets)")
+parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+parser.add_argument("--port", type=int, default=8050, help="port to listen on (default: 8050)")
+parser.add_argument("--verbose", action="store_true", help="log every request")
+args = parser.parse_args()
+
+serveExplorer(args.source, args.host, args.port, args.verbose)
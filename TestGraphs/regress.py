@@ -0,0 +1,77 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Compares the test set outputs with a baseline, without drawing anything.
+
+    python TestGraphs/regress.py --save                 keep the current outputs of every set as the baseline
+    python TestGraphs/regress.py                        compare every set with the baseline
+    python TestGraphs/regress.py WS1 --json diff.json   compare WS1 and write the result as json
+    python TestGraphs/regress.py --baseline ../old/TestComponents/TestSets   compare with another checkout
+    python TestGraphs/regress.py --baseline artifacts   compare with snapshots from snapshot.py
+    python TestGraphs/regress.py --tolerance CropN=0.01,0   allow CropN to move by 0.01 kg/ha
+
+The baseline is kept as a snapshot of each set in TestGraphs/.cache/Baseline
+unless --baseline gives another folder.  Exits with 1 if anything changed, so CI can fail on it.
+"""
+
+import os
+import sys
+import json
+import argparse
+from validation.driver import defaultSets, testGraphsPath, testSetsPath
+from validation.packed import outputColumns
+from validation.regression import compareSets, defaultTolerance, regressionReport, saveBaseline
+from validation.snapshot import compressions, defaultStep
+
+
+def tolerance(text):
+    column, _, limits = text.rpartition('=')
+    try:
+        limits = [float(x) for x in limits.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected COLUMN=ATOL[,RTOL], not '{text}'")
+    if not column or len(limits) not in (1, 2):
+        raise argparse.ArgumentTypeError(f"expected COLUMN=ATOL[,RTOL], not '{text}'")
+    return column, (limits[0], limits[1] if len(limits) == 2 else defaultTolerance[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sets", nargs="*", default=defaultSets, help="test sets to compare (default: all)")
+    parser.add_argument("--baseline", default=os.path.join(testGraphsPath, ".cache", "Baseline"), help="baseline folder (default: TestGraphs/.cache/Baseline)")
+    parser.add_argument("--save", action="store_true", help="save the current outputs as the baseline instead of comparing")
+    parser.add_argument("--json", metavar="PATH", help="write the result as json to PATH ('-' for stdout)")
+    parser.add_argument("--tolerance", type=tolerance, action="append", default=[], metavar="COLUMN=ATOL[,RTOL]",
+                        help=f"tolerance of one output column (default for all: atol {defaultTolerance[0]}, rtol {defaultTolerance[1]})")
+    parser.add_argument("--step", type=float, default=defaultStep, help=f"quantisation step of the saved baseline, 0 to keep values exactly (default: {defaultStep})")
+    parser.add_argument("--compression", choices=list(compressions), default="deflate", help="compression of the saved baseline (default: deflate)")
+    parser.add_argument("--workers", type=int, help="processes to compare sets in (default: one per cpu)")
+    args = parser.parse_args(argv)
+
+    if args.save:
+        steps = {c: args.step for c in outputColumns}
+        saveBaseline(args.sets, args.baseline, testSetsPath, steps, args.compression, args.workers)
+        print(f"Saved {', '.join(args.sets)} to {args.baseline}")
+        return 0
+
+    tolerances = dict(args.tolerance)
+    table, counts = compareSets(args.sets, args.baseline, testSetsPath, tolerances, args.workers)
+    report = regressionReport(table, counts, args.baseline, tolerances)
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    else:
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=1)
+        for testSet, summary in report["sets"].items():
+            print(f"{testSet:>10}  {summary['tests']:5d} tests  {summary['changed']:5d} changed  "
+                  f"{summary['added']:3d} added  {summary['removed']:3d} removed")
+        if len(table):
+            print(table.to_string(index=False, float_format=lambda x: f"{x:.4g}"))
+    return 1 if report["changed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
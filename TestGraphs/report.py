@@ -15,14 +15,13 @@
 
 # +
 import os
-import aspose.words as aw
+import sys
 import os.path as osp
-from glob import glob
-from pathlib import Path
 
 try: 
     if os.environ["GITHUB_WORKSPACE"] != None:
         root = os.environ["GITHUB_WORKSPACE"]
+        sys.path.append(os.path.join(root, "TestGraphs"))
         inPath = os.path.join(root, "TestGraphs", "Outputs")
 
 except: 
@@ -33,23 +32,16 @@ except:
             break
         else:
             root += d + "\\"
+    sys.path.append(os.path.join(root,"FieldNBalance","TestGraphs"))
     inPath = os.path.join(root,"FieldNBalance","TestGraphs", "Outputs")   
     
+from validation.htmlreport import writeReport
+from validation.profiling import stepProfile, writeProfile
 
 if not osp.isdir(inPath):
     raise FileNotFoundError(f"Directory does not exist: {inPath}")
 
-imgs = glob(osp.join(inPath, "*.png"))
-if len(imgs) == 0:
-    raise FileNotFoundError(f"No images found in directory: {inPath}")
-
-doc = aw.Document()
-builder = aw.DocumentBuilder(doc)
-
-for img in imgs:
-    builder.insert_image(img)
-
-outdir = "html"
-Path(outdir).mkdir(parents=True, exist_ok=True) 
-doc.save(osp.join(outdir, "index.html"))
-
+# A page per test set with its stats and figure thumbnails, and an index with the timings of the validation run
+with stepProfile("report", "All") as timings:
+    writeReport(inPath, "html")
+writeProfile(timings, inPath)
@@ -0,0 +1,43 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Writes a compact snapshot of each test set's outputs, e.g. to upload as a CI artifact.
+
+    python TestGraphs/snapshot.py artifacts                 every set to artifacts/<set>.snap
+    python TestGraphs/snapshot.py artifacts WS1 --step 1e-4 WS1 only, kept to within 5e-5
+    python TestGraphs/snapshot.py artifacts --step 0 --compression lzma   exact values, smaller file
+
+The folder can be given to regress.py as --baseline.  The snapshots are
+read with validation.snapshot.openSnapshot.
+"""
+
+import os
+import sys
+import argparse
+from validation.driver import defaultSets, testSetsPath
+from validation.packed import outputColumns
+from validation.snapshot import compressions, defaultStep, snapshotOutputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder", help="folder to write the snapshots to")
+    parser.add_argument("sets", nargs="*", default=defaultSets, help="test sets to snapshot (default: all)")
+    parser.add_argument("--step", type=float, default=defaultStep, help=f"quantisation step, 0 to keep values exactly (default: {defaultStep})")
+    parser.add_argument("--compression", choices=list(compressions), default="deflate", help="compression of each test (default: deflate)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.folder, exist_ok=True)
+    steps = {c: args.step for c in outputColumns}
+    for testSet in args.sets:
+        outputsPath = os.path.join(testSetsPath, testSet, "Outputs")
+        csvs = sum(os.path.getsize(os.path.join(outputsPath, f)) for f in os.listdir(outputsPath) if f.endswith(".csv"))
+        path = os.path.join(args.folder, testSet + ".snap")
+        tests = snapshotOutputs(outputsPath, path, steps, args.compression)
+        print(f"{testSet:>10}  {len(tests):4d} tests  {csvs / 2**20:7.2f} MB csv  {os.path.getsize(path) / 2**20:6.2f} MB snapshot")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Tests of validation.stats, run from TestGraphs with python -m unittest discover -s tests -t ."""
+
+import unittest
+import numpy as np
+import pandas as pd
+from validation.stats import regressionStats
+
+
+def _table(obs, pred, groups=None):
+    table = pd.DataFrame({'obs': obs, 'pred': pred})
+    if groups is not None:
+        table['Site'] = groups
+    return table
+
+
+class RegressionStatsTests(unittest.TestCase):
+
+    def test_nseOfOnePairIsNan(self):
+        stats = regressionStats(_table([2.0], [3.0]))
+        self.assertEqual(stats.loc['All', 'n'], 1)
+        self.assertTrue(np.isnan(stats.loc['All', 'NSE']))
+        self.assertTrue(np.isnan(stats.loc['All', 'RSR']))
+
+    def test_nseOfConstantObsIsNan(self):
+        stats = regressionStats(_table([2.0, 2.0, 2.0], [1.0, 2.0, 3.0]))
+        self.assertTrue(np.isnan(stats.loc['All', 'NSE']))
+        self.assertTrue(np.isnan(stats.loc['All', 'RSR']))
+
+    def test_nseOfEachGroup(self):
+        obs = [1.0, 2.0, 3.0, 4.0, 5.0]
+        pred = [1.5, 1.5, 3.5, 3.0, 6.0]
+        stats = regressionStats(_table(obs, pred, ['A', 'A', 'A', 'A', 'B']), by='Site')
+        x, y = np.array(obs[:4]), np.array(pred[:4])
+        expected = 1 - ((y - x) ** 2).sum() / ((x - x.mean()) ** 2).sum()
+        self.assertAlmostEqual(stats.loc['A', 'NSE'], expected)
+        self.assertTrue(np.isnan(stats.loc['B', 'NSE']))
+        self.assertFalse(np.isinf(stats[['NSE', 'RSR']].to_numpy()).any())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Runs the MakeConfigs and MakeGraphs scripts for the test sets in one Python process.
+
+    python TestGraphs/validate.py                   configs then graphs for every set
+    python TestGraphs/validate.py WS1 WS2 --graphs  only the graphs for WS1 and WS2
+    python TestGraphs/validate.py --worker          answer JSON requests on stdin (used by Test.RunAllTests)
+    python TestGraphs/validate.py --memory --profile  also trace memory and keep a cProfile of the slowest step
+    python TestGraphs/validate.py --format svg      save the figures as svg rather than png
+
+Every run records the time and memory of each step in TestGraphs/Outputs/Profile.json.
+"""
+
+import os
+import sys
+import argparse
+
+# Figures are only ever saved, never shown
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from validation.driver import defaultSets, runSets, serve
+from validation.render import figureFormats
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("sets", nargs="*", default=defaultSets, help="test sets to run (default: all)")
+parser.add_argument("--configs", dest="steps", action="append_const", const="configs", help="run the MakeConfigs scripts")
+parser.add_argument("--graphs", dest="steps", action="append_const", const="graphs", help="run the MakeGraphs scripts")
+parser.add_argument("--force", action="store_true", help="run every step even if nothing it depends on has changed")
+parser.add_argument("--worker", action="store_true", help="serve line-delimited JSON requests on stdin/stdout")
+parser.add_argument("--memory", action="store_true", help="trace the memory each stage allocates (slower)")
+parser.add_argument("--profile", action="store_true", help="write a cProfile dump of the slowest step to TestGraphs/Outputs/.profile")
+parser.add_argument("--format", choices=list(figureFormats), help="format to save figures in (default: FIGURE_FORMAT or png)")
+args = parser.parse_args()
+
+if args.format:
+    os.environ["FIGURE_FORMAT"] = args.format
+
+if args.worker:
+    serve(memory=args.memory, profile=args.profile)
+else:
+    replies = runSets(args.sets, args.steps or ["configs", "graphs"], args.force, args.memory, args.profile)
+    sys.exit(0 if all(r["ok"] for r in replies) else 1)
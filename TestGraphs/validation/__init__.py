@@ -0,0 +1,8 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Shared helpers for the MakeConfigs and MakeGraphs validation scripts."""
+
+from .dates import parseDates, parseOutputDates
+from .outputs import listTests, loadOutputs, readOutput, readOutputs
@@ -0,0 +1,155 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Reductions over the outputs of a test set, streamed a test at a time.
+
+loadOutputs puts every test in one wide frame indexed by the union of all
+their dates.  When tests cover different years most of that frame is empty,
+and it grows with tests x dates.  streamOutputs() instead hands each test's
+own frame to a list of reducers, read in turn from the set's packed copy
+(see validation.packed), so only one test's outputs are held at once and
+each reducer keeps only what it needs:
+
+  - Series keeps some columns of each test, cut to its window and cumulated
+    if asked, on that test's own dates.
+  - WindowTotals keeps one row per test, the columns summed (or otherwise
+    reduced) over its window.
+  - ObsPred pairs observations with the prediction for their day, the same
+    table alignObsPred gives.
+
+A reducer is any object with an add(test, frame) method and a result()
+method.  If it has a columns attribute only those columns are read, and if
+it has a tests attribute other than None it is only given those tests.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from .obspred import observationPairs
+from .outputs import listTests, readOutputs
+from .packed import refreshPacked
+from .profiling import timed
+
+
+def _window(frame, windows, test):
+    if windows is None:
+        return frame
+    return frame.loc[windows.loc[test, 'start']:windows.loc[test, 'end']]
+
+
+class Series:
+    """Columns of each test as a {test: frame} dict.
+
+    windows, a frame of start and end dates by test like harvestWindows
+    gives, cuts each test to its window.  Columns in cumulative are summed
+    from the start of what is kept.  With tests given only those are kept.
+    """
+
+    def __init__(self, columns, cumulative=(), windows=None, tests=None):
+        self.columns = list(columns)
+        self.cumulative = [c for c in self.columns if c in cumulative]
+        self.windows = windows
+        self.tests = None if tests is None else set(tests)
+        self.frames = {}
+
+    def add(self, test, frame):
+        kept = _window(frame[self.columns], self.windows, test).copy()
+        kept[self.cumulative] = kept[self.cumulative].cumsum()
+        self.frames[test] = kept
+
+    def result(self):
+        return self.frames
+
+
+class WindowTotals:
+    """One row per test of its columns reduced over its window.
+
+    how is anything DataFrame.agg takes that gives one value per column,
+    'sum' by default.  Without windows the whole output is reduced.
+    """
+
+    def __init__(self, columns, windows=None, how='sum'):
+        self.columns = list(columns)
+        self.windows = windows
+        self.how = how
+        self.rows = {}
+
+    def add(self, test, frame):
+        self.rows[test] = _window(frame[self.columns], self.windows, test).agg(self.how)
+
+    def result(self):
+        return pd.DataFrame.from_dict(self.rows, orient='index', columns=self.columns)
+
+
+class ObsPred:
+    """Observed and predicted variable for every test, as alignObsPred gives them.
+
+    Takes the arguments of alignObsPred other than AllData.  The observations
+    are paired up front and each test's predictions are looked up as it
+    arrives.
+    """
+
+    @timed('obspred')
+    def __init__(self, observed, variable, keys, sites, windows):
+        self.columns = [variable]
+        self.variable = variable
+        self.pairs = observationPairs(observed, keys, sites, windows)
+        self.byTest = self.pairs.groupby('Treatment').indices
+        self.dates = pd.DatetimeIndex(self.pairs['Date'])
+        self.pred = np.full(len(self.pairs), np.nan)
+
+    @timed('obspred')
+    def add(self, test, frame):
+        at = self.byTest.get(test)
+        if at is None:
+            return
+        rows = frame.index.get_indexer(self.dates[at])
+        found = rows >= 0
+        self.pred[at[found]] = frame[self.variable].to_numpy()[rows[found]]
+
+    def result(self):
+        pairs = self.pairs.assign(pred=self.pred)
+        pairs = pairs.set_index(['Site', 'Treatment', 'Date'])
+        return pairs.sort_index()
+
+
+def iterOutputs(outputsPath, tests=None, columns=None, chunkSize=128, workers=None, cache=True):
+    """Yields (test, frame) for each test in outputsPath, with only columns if given.
+
+    Frames are read from the set's packed copy, which refreshPacked first
+    brings up to date with up to workers processes.  With cache off, or if
+    the copy can't be written, the csvs are parsed by readOutputs chunkSize
+    at a time.
+    """
+    tests = listTests(outputsPath) if tests is None else list(tests)
+    packed = refreshPacked(outputsPath, workers=workers) if cache else None
+    if packed is not None:
+        for test in tests:
+            yield test, packed.frame(test, columns)
+        return
+    for start in range(0, len(tests), chunkSize):
+        chunk = tests[start:start + chunkSize]
+        frames = readOutputs([os.path.join(outputsPath, t + '.csv') for t in chunk], workers, columns)
+        for test, frame in zip(chunk, frames):
+            yield test, frame
+
+
+@timed('streamOutputs')
+def streamOutputs(outputsPath, reducers, tests=None, chunkSize=128, workers=None, cache=True):
+    """Passes every test's output in outputsPath through reducers, returning their results in order.
+
+    Only the columns the reducers ask for are read, or all of them if any
+    reducer doesn't say.
+    """
+    tests = listTests(outputsPath) if tests is None else list(tests)
+    if len(tests) == 0:
+        raise FileNotFoundError(f"No outputs found in directory: {outputsPath}")
+    columns = None
+    if all(hasattr(r, 'columns') for r in reducers):
+        columns = list(dict.fromkeys(c for r in reducers for c in r.columns))
+    for test, frame in iterOutputs(outputsPath, tests, columns, chunkSize, workers, cache):
+        for reducer in reducers:
+            if getattr(reducer, 'tests', None) is None or test in reducer.tests:
+                reducer.add(test, frame)
+    return [r.result() for r in reducers]
@@ -0,0 +1,216 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Generation and reading of the FieldConfigs files of a test set.
+
+A factorial set of treatments is described by one or more base configs, the
+factors with the coefficients each of their levels sets, and any one-off
+overrides.  workbookFactors() reads these from a workbook laid out as a
+factorial.  expandTreatments() yields the treatments one at a time, and
+writeConfigs() writes them in chunks, so the cost of a set grows linearly
+with the number of treatments and the configs never have to be held in memory.
+
+Two files are written.  FieldConfigs.csv has the values as the workbook gives
+them for Test.runTestSet to load.  FieldConfigs.parquet has the same configs
+typed by coefficientTypes, with dates as datetimes, numbers as floats and the
+categories dictionary encoded, for readConfigs() to load in the graph scripts
+without parsing anything.
+"""
+
+import os
+import re
+import itertools
+import pandas as pd
+from .profiling import timed
+
+configsFile = "FieldConfigs.parquet"
+
+# Coefficients Test.SetConfigFromDataFrame passes to the model, and the type each is stored as
+coefficientTypes = {
+    'WeatherStation': 'category',
+    'SoilCategory': 'category',
+    'Texture': 'category',
+    'Rocks': 'float',
+    'SampleDepth': 'category',
+    'PMN': 'float',
+    'Splits': 'float',
+    'PrePlantRain': 'category',
+    'InCropRain': 'category',
+    'Irrigation': 'category',
+}
+for crop in ['Prior', 'Current', 'Following']:
+    coefficientTypes.update({
+        crop + 'CropNameFull': 'category',
+        crop + 'FieldYield': 'float',
+        crop + 'FieldLoss': 'float',
+        crop + 'DressingLoss': 'float',
+        crop + 'MoistureContent': 'float',
+        crop + 'EstablishDate': 'datetime',
+        crop + 'EstablishStage': 'category',
+        crop + 'HarvestDate': 'datetime',
+        crop + 'HarvestStage': 'category',
+        crop + 'ResidueRemoval': 'category',
+        crop + 'ResidueIncorporation': 'category',
+    })
+# Optional, Test.SetConfigFromDataFrame uses Constants.InitialN if it isn't given
+coefficientTypes['InitialN'] = 'float'
+
+
+def expandTreatments(base, factors, name=None, overrides=None):
+    """Yields (name, config) for each combination of factor levels on each base treatment.
+
+    base is a config Series (coefficient -> value) named for its treatment, or
+    a frame with one such column per treatment.  factors maps each factor name
+    to {level: {coefficient: value}}, earlier factors varying slowest, and
+    every combination is applied to each base treatment in turn.  name is a
+    format string with {base} and a field for each factor, or a function of
+    the base name and {factor: level}; by default the levels are appended to
+    the base name with underscores.  overrides maps treatment names to
+    {coefficient: value} set after the factor levels.
+    """
+    if isinstance(base, pd.Series):
+        base = base.to_frame()
+    overrides = overrides or {}
+    if name is None:
+        name = '_'.join(['{base}'] + ['{' + f + '}' for f in factors])
+    if isinstance(name, str):
+        template = name
+        name = lambda b, levels: template.format(base=b, **levels)
+    for combination in itertools.product(*[list(levels) for levels in factors.values()]):
+        levels = dict(zip(factors, combination))
+        for b in base.columns:
+            treatment = name(b, levels)
+            config = base[b].copy()
+            config.name = treatment
+            settings = [factors[f][levels[f]] for f in factors] + [overrides.get(treatment, {})]
+            for setting in settings:
+                for coefficient, value in setting.items():
+                    if coefficient not in config.index:
+                        raise KeyError(f"Treatment {treatment} sets {coefficient}, which is not a config coefficient")
+                    config[coefficient] = value
+            yield treatment, config
+
+
+def workbookFactors(configs, name):
+    """The base config and factors of a factorial workbook, for expandTreatments.
+
+    configs has a column per treatment, named by the format string name with
+    a field for each factor, e.g. "{Rain}_{Irrigation}".  Every coefficient
+    that differs between treatments is put on the factor whose levels it
+    follows, and the factors are ordered by how slowly their levels change
+    across the columns.  The base is the first column.  Raises ValueError if
+    the expanded factors don't give back every column of the workbook.
+    """
+    fields = re.findall(r'{(\w+)}', name)
+    pattern = re.compile(re.sub(r'\\{(\w+)\\}', r'(?P<\1>[^_]+)', re.escape(name)))
+    matches = {c: pattern.fullmatch(c) for c in configs.columns}
+    levels = pd.DataFrame([m.groupdict() if m else {} for m in matches.values()], index=configs.columns, columns=fields)
+    if levels.isna().any(axis=None):
+        raise ValueError(f"Treatments {', '.join(levels.index[levels.isna().any(axis=1)])} aren't named {name}")
+    changes = {f: int((levels[f] != levels[f].shift()).sum()) for f in fields}
+    fields.sort(key=lambda f: changes[f])
+
+    factors = {f: {level: {} for level in levels[f].unique()} for f in fields}
+    for coefficient, values in configs[configs.nunique(axis=1) > 1].iterrows():
+        follows = [f for f in fields if values.groupby(levels[f]).nunique().max() == 1]
+        if len(follows) == 0:
+            raise ValueError(f"{coefficient} doesn't follow the levels of any of {', '.join(fields)}")
+        for level, value in values.groupby(levels[follows[0]]).first().items():
+            factors[follows[0]][level][coefficient] = value
+
+    base = configs[configs.columns[0]]
+    expanded = dict(expandTreatments(base, factors, name=lambda b, l: name.format(**l)))
+    if set(expanded) != set(configs.columns) or any(not expanded[t].equals(configs[t]) for t in configs.columns):
+        raise ValueError(f"The treatments of the workbook aren't a full factorial of {', '.join(fields)}")
+    return base, factors
+
+
+def _arrowType(kind):
+    import pyarrow as pa
+    return {'float': pa.float64(),
+            'datetime': pa.timestamp('ns'),
+            'category': pa.dictionary(pa.int32(), pa.string())}[kind]
+
+
+def typeConfigs(frame):
+    """Configs with a row per treatment, with each coefficient converted to its type in coefficientTypes.
+
+    Coefficients not in coefficientTypes are kept as categories.  Empty cells
+    become missing values.
+    """
+    typed = pd.DataFrame(index=frame.index)
+    for coefficient in frame.columns:
+        values = frame[coefficient].astype(object)
+        values = values.where(values.map(lambda v: not (isinstance(v, str) and v.strip() == '')), None)
+        kind = coefficientTypes.get(coefficient, 'category')
+        try:
+            if kind == 'float':
+                values = pd.to_numeric(values).astype(float)
+            elif kind == 'datetime':
+                values = pd.to_datetime(values)
+            else:
+                values = values.map(lambda v: None if pd.isna(v) else str(v)).astype(object)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Config coefficient {coefficient} has values that aren't of type {kind}: {e}") from e
+        typed[coefficient] = values
+    return typed
+
+
+@timed('writeConfigs')
+def writeConfigs(treatments, path, chunkSize=1000):
+    """Writes (name, config) pairs to FieldConfigs.csv and FieldConfigs.parquet in path.
+
+    The csv has a row per treatment as Test.runTestSet reads it.  Both files
+    are written chunkSize treatments at a time, the parquet file a row group
+    per chunk.  A config frame with a column per treatment can be written with
+    writeConfigs(Configs.items(), path).  Returns the number of treatments.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    csvFile = os.path.join(path, "FieldConfigs.csv")
+    coefficients = None
+    writer = None
+    count = 0
+    try:
+        with open(csvFile, 'w', newline='') as f:
+            for chunk in iter(lambda: list(itertools.islice(treatments, chunkSize)), []):
+                if coefficients is None:
+                    coefficients = chunk[0][1].index
+                    schema = pa.schema([('Name', pa.string())] +
+                                       [(str(c), _arrowType(coefficientTypes.get(c, 'category'))) for c in coefficients])
+                    writer = pq.ParquetWriter(os.path.join(path, configsFile + '.tmp'), schema)
+                for treatment, config in chunk:
+                    if not config.index.equals(coefficients):
+                        raise ValueError(f"Treatment {treatment} does not have the same coefficients as {chunk[0][0]}")
+                frame = pd.DataFrame([list(config.values) for _, config in chunk],
+                                     index=[treatment for treatment, _ in chunk],
+                                     columns=coefficients, dtype=object)
+                frame.to_csv(f, header=count == 0)
+                typed = typeConfigs(frame)
+                typed.insert(0, 'Name', frame.index.astype(str))
+                writer.write_table(pa.Table.from_pandas(typed, schema=schema, preserve_index=False))
+                count += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if count == 0:
+        raise ValueError(f"No treatments to write to {path}")
+    os.replace(os.path.join(path, configsFile + '.tmp'), os.path.join(path, configsFile))
+    return count
+
+
+def readConfigs(path, treatments=None, coefficients=None):
+    """Typed configs of the test set in path, a row per treatment indexed by Name.
+
+    treatments and coefficients pick out the rows and columns to return;
+    treatments without configs get a row of missing values.
+    """
+    import pyarrow.parquet as pq
+    columns = None if coefficients is None else ['Name'] + list(coefficients)
+    # Read without arrow's thread pools, so the graph scripts can still fork their worker pools afterwards
+    table = pq.ParquetFile(os.path.join(path, configsFile)).read(columns=columns, use_threads=False)
+    configs = table.to_pandas(use_threads=False).set_index('Name')
+    if treatments is not None:
+        configs = configs.reindex(treatments)
+    return configs
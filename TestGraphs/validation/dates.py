@@ -0,0 +1,94 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Parsing of the date columns in model outputs and observation files.
+
+Dates are only ever parsed with one of the formats listed here.  A file whose
+dates don't fit any of them raises an error rather than falling back to
+dateutil guessing, which is slow and reads 6/09/2022 as the 9th of June.
+"""
+
+import datetime as dt
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from .profiling import timed
+
+# DataFrame.SaveCsv writes en-NZ dates locally and invariant culture dates on GitHub
+outputFormats = [
+    '%d/%m/%Y %I:%M:%S %p',
+    '%m/%d/%Y %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d',
+]
+
+# Observations are entered day first, or as ISO dates when exported from a database
+observedFormats = [
+    '%Y-%m-%d',
+    '%d/%m/%Y',
+    '%Y-%m-%d %H:%M:%S',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %I:%M:%S %p',
+]
+
+# Model days are stamped at midday, which the 12 hour shift on observations lines up with
+modelDayTime = pd.Timedelta(hours=12)
+
+
+def detectFormat(samples, formats):
+    """First of formats that every one of the sample strings fits."""
+    for fmt in formats:
+        try:
+            for s in samples:
+                dt.datetime.strptime(str(s).strip(), fmt)
+        except ValueError:
+            continue
+        return fmt
+    raise ValueError(f"Dates like '{samples[0]}' are not in any of the known formats: {formats}")
+
+
+@lru_cache(maxsize=256)
+def dailyIndex(start, periods):
+    """Index of periods consecutive model days from start."""
+    return pd.date_range(start, periods=periods, freq='D', name='Date')
+
+
+@timed('dates')
+def parseOutputDates(values):
+    """Index of model days for the Date column of an output csv.
+
+    Every output is a contiguous daily series, so only the first, middle and
+    last dates are parsed and the index is built from the start and length.
+    Anything that isn't contiguous is parsed in full with the detected format.
+    """
+    values = np.asarray(values, dtype=object)
+    n = len(values)
+    if n == 0:
+        return pd.DatetimeIndex([], name='Date')
+    samples = values[[0, n // 2, n - 1]]
+    fmt = detectFormat(samples, outputFormats)
+    first, middle, last = pd.to_datetime(samples, format=fmt).normalize()
+    if (last - first).days == n - 1 and (middle - first).days == n // 2:
+        return dailyIndex(first + modelDayTime, n)
+    parsed = pd.to_datetime(values, format=fmt).normalize() + modelDayTime
+    return pd.DatetimeIndex(parsed, name='Date')
+
+
+@timed('dates')
+def parseDates(values, formats=observedFormats):
+    """Parses a column of dates with whichever of formats fits all of them.
+
+    Missing values stay missing.  Raises ValueError if no one format fits
+    every date given.
+    """
+    missing = np.asarray(pd.isna(values))
+    present = np.asarray(values, dtype=object)[~missing]
+    if len(present) == 0:
+        return pd.to_datetime(values)
+    candidates = formats[formats.index(detectFormat(present[:1], formats)):]
+    for fmt in candidates:
+        parsed = pd.to_datetime(values, format=fmt, errors='coerce')
+        if not (np.asarray(pd.isna(parsed)) & ~missing).any():
+            return parsed
+    raise ValueError(f"Dates like '{present[0]}' do not all fit any one of the known formats: {formats}")
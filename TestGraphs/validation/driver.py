@@ -0,0 +1,236 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Running of the MakeConfigs and MakeGraphs scripts for several test sets in one process.
+
+Each script is run as __main__ with runpy, just as if python had been started
+on it, but pandas, matplotlib and the validation helpers are only imported
+once for the whole validation run.  serve() keeps the process alive and takes
+requests as lines of JSON so the C# test runner can interleave the scripts
+with its own simulation of each set.
+
+A step is skipped when nothing it depends on has changed since it last ran,
+going by the content hashes kept in the set's .cache/Manifest.json: the
+script and the validation helpers, and the FieldConfigs.xlsx for configs or
+every other file in the set folder (configs, observations and Outputs csvs)
+and the figure format for graphs.  Its outputs must also still be there as it left them.  Graphs
+that a step wrote last time but not this time are deleted.
+
+The time and memory of every step and the stages inside it are recorded in
+TestGraphs/Outputs/Profile.json (see validation.profiling).
+"""
+
+import os
+import sys
+import json
+import time
+import runpy
+import traceback
+import contextlib
+from .figures import closeFigures
+from .manifest import hashFiles, readManifest, writeManifest
+from .profiling import stepProfile, writeProfile
+from .render import figureFormat, figureManifestPath
+
+# Same order as Test.RunAllTests
+defaultSets = ['WS1', 'WS2', 'CropStage', 'Residues', 'Location', 'Moisture', 'Losses']
+
+steps = {'configs': 'MakeConfigs', 'graphs': 'MakeGraphs'}
+
+testGraphsPath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+testSetsPath = os.path.join(os.path.dirname(testGraphsPath), 'TestComponents', 'TestSets')
+graphsOutPath = os.path.join(testGraphsPath, 'Outputs')
+validationPath = os.path.dirname(os.path.abspath(__file__))
+
+
+def scriptPath(step, testSet):
+    """Path of the script that does step ('configs' or 'graphs') for testSet."""
+    if step not in steps:
+        raise ValueError(f"Unknown step '{step}', expected one of {list(steps)}")
+    path = os.path.join(testGraphsPath, steps[step], testSet + '.py')
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No {steps[step]} script for test set '{testSet}': {path}")
+    return path
+
+
+def _files(folder):
+    """Files directly in folder, leaving out hidden ones like .cache."""
+    try:
+        names = sorted(os.listdir(folder))
+    except OSError:
+        return []
+    paths = [os.path.join(folder, n) for n in names if not n.startswith('.')]
+    return [p for p in paths if os.path.isfile(p)]
+
+
+def stepInputs(step, testSet):
+    """Files whose contents decide what the script for step and testSet produces."""
+    setPath = os.path.join(testSetsPath, testSet)
+    code = [scriptPath(step, testSet)] + [p for p in _files(validationPath) if p.endswith('.py')]
+    workbook = os.path.join(setPath, 'FieldConfigs.xlsx')
+    if step == 'configs':
+        return code + [workbook]
+    data = _files(setPath) + _files(os.path.join(setPath, 'Outputs'))
+    return code + [p for p in data if p != workbook]
+
+
+def _outputFolder(step, testSet):
+    return os.path.join(testSetsPath, testSet) if step == 'configs' else graphsOutPath
+
+
+def _stepOutputs(step, testSet, before, since):
+    """Files the step wrote, from the stamps of its output folder before it ran.
+
+    For graphs this includes the figures it found were already up to date.
+    """
+    folder = _outputFolder(step, testSet)
+    written = [p for p in _files(folder) if before.get(p) != _stamp(p)]
+    if step == 'graphs':
+        figures = readManifest(figureManifestPath(graphsOutPath)).get('figures', {})
+        script = scriptPath(step, testSet)
+        written += [os.path.join(graphsOutPath, name) for name, f in figures.items()
+                    if f.get('script') == script and f.get('checked', 0) >= since]
+    return sorted(set(written))
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _upToDate(record, inputs, memo):
+    if not record or record.get('inputs') != inputs or not record.get('outputs'):
+        return False
+    return hashFiles(list(record['outputs']), memo) == record['outputs']
+
+
+def runStep(step, testSet, force=False, memory=False, profile=False):
+    """Runs the script for step and testSet in this process, returning the seconds it took.
+
+    Returns None without running the script if its inputs and outputs are as
+    they were the last time it ran, unless force is set.  Changes the script
+    makes to sys.path are undone and any figures it left open are closed, so
+    one run doesn't carry over into the next.  The step's profile is written
+    to Profile.json, with traced memory if memory is set and a cProfile dump
+    if profile is set and it is the slowest step so far.
+    """
+    path = scriptPath(step, testSet)
+    manifestFile = os.path.join(testSetsPath, testSet, '.cache', 'Manifest.json')
+    manifest = readManifest(manifestFile)
+    memo = manifest['files']
+    inputs = hashFiles(stepInputs(step, testSet), memo)
+    if step == 'graphs':
+        inputs['format'] = figureFormat()
+    record = manifest.get(step)
+    if not force and _upToDate(record, inputs, memo):
+        writeManifest(manifest, manifestFile)
+        writeProfile({'set': testSet, 'step': step, 'skipped': True,
+                      'when': time.strftime('%Y-%m-%dT%H:%M:%S')}, graphsOutPath)
+        return None
+
+    folder = _outputFolder(step, testSet)
+    before = {p: _stamp(p) for p in _files(folder)}
+    since = time.time()
+    savedPath = list(sys.path)
+    timings = {}
+    try:
+        with stepProfile(step, testSet, memory, profile) as timings:
+            try:
+                runpy.run_path(path, run_name='__main__')
+            finally:
+                sys.path[:] = savedPath
+                if 'matplotlib.pyplot' in sys.modules:
+                    closeFigures()
+                    sys.modules['matplotlib.pyplot'].close('all')
+    except BaseException as e:
+        timings.update({'ok': False, 'error': f"{type(e).__name__}: {e}"})
+        writeProfile(timings, graphsOutPath)
+        raise
+    seconds = timings['wall']
+
+    outputs = hashFiles(_stepOutputs(step, testSet, before, since), memo)
+    if step == 'graphs' and record:
+        for old in set(record.get('outputs', {})) - set(outputs):
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    manifest[step] = {'inputs': inputs, 'outputs': outputs}
+    writeManifest(manifest, manifestFile)
+    writeProfile(timings, graphsOutPath)
+    return seconds
+
+
+def _attempt(step, testSet, force=False, memory=False, profile=False):
+    """Reply for one step: ok and seconds (or skipped), or the error the script raised."""
+    reply = {'step': step, 'set': testSet}
+    try:
+        seconds = runStep(step, testSet, force, memory, profile)
+        if seconds is None:
+            reply['skipped'] = True
+        else:
+            reply['seconds'] = round(seconds, 3)
+        reply['ok'] = True
+    except (Exception, SystemExit) as e:
+        traceback.print_exc()
+        reply['ok'] = False
+        reply['error'] = f"{type(e).__name__}: {e}"
+    return reply
+
+
+def runSets(testSets=None, stepsToRun=('configs', 'graphs'), force=False, memory=False, profile=False):
+    """Runs stepsToRun for each of testSets in turn, carrying on past failures.
+
+    Steps whose inputs haven't changed are skipped unless force is set.
+    memory and profile are passed to runStep.  Returns the reply of every
+    step, as serve() would give them.
+    """
+    replies = []
+    for testSet in testSets or defaultSets:
+        for step in stepsToRun:
+            reply = _attempt(step, testSet, force, memory, profile)
+            if not reply['ok']:
+                status = '   failed'
+            elif reply.get('skipped'):
+                status = 'unchanged'
+            else:
+                status = f"{reply['seconds']:8.2f}s"
+            print(f"{status}  {steps[step]}/{testSet}", file=sys.stderr)
+            replies.append(reply)
+    return replies
+
+
+def serve(requests=None, replies=None, memory=False, profile=False):
+    """Answers line-delimited JSON requests until the input ends or an exit request.
+
+    A request is {"step": "configs" or "graphs", "set": name}, optionally with
+    "force": true to run the step even if nothing changed.  It is answered
+    with one line {"step", "set", "ok", "seconds"}, with "skipped": true in
+    place of seconds if nothing had changed, or "error" if the script failed.
+    {"step": "exit"} stops the worker.  memory and profile are passed to
+    runStep for every request.  Output the scripts print goes to stderr so
+    the replies are all that is written.
+    """
+    requests = requests or sys.stdin
+    replies = replies or sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        for line in requests:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                step = request['step']
+                testSet = request.get('set')
+                force = bool(request.get('force', False))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                reply = {'ok': False, 'error': f"Bad request {line.strip()!r}: {e}"}
+            else:
+                if step == 'exit':
+                    break
+                reply = _attempt(step, testSet, force, memory, profile)
+            replies.write(json.dumps(reply) + '\n')
+            replies.flush()
@@ -0,0 +1,281 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""A local web server for browsing the test outputs.
+
+The page, explorer.html, asks for the series of the tests and variable
+selected, over the dates in view and at the width of the plot, and the
+server sends back no more points than the plot has pixels.  Outputs are read
+with validation.regression.readRuns, so the source can be the TestSets
+folder, a folder of snapshots or a baseline.  A set is read once and read
+again when its snapshot or any file in its Outputs folder changes.
+
+Series are downsampled in tiles.  A tile at level L covers tilePoints x 2^L
+days, aligned to 1970-01-01, and holds at most tilePoints points, chosen by
+largest triangle three buckets (lttb) or the min and max of each bucket
+(minmax).  A request takes the level whose days per point are just finer
+than the days per pixel of the plot, then joins the tiles in view, which
+are kept in a cache so panning and zooming over the same series reuses them.
+
+    GET /                        the explorer page
+    GET /api/sets                {set: number of tests}
+    GET /api/tests?set=WS1       tests with their first day and days, and the variables
+    GET /api/series?set=WS1&variable=CropN&match=Oni&start=2021-01-01&end=2022-01-01&width=900&method=lttb
+
+Days are sent as days since 1970-01-01.
+"""
+
+import os
+import re
+import json
+import math
+import threading
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from .regression import readRuns
+
+tilePoints = 256
+
+# Most points sent for one request, shared between its series
+maxPoints = 1_000_000
+
+maxSeries = 5000
+
+# Values are sent rounded, which halves the size of the response and is finer than a plot shows
+decimals = 4
+
+# Keeps requests inside sourcePath
+_setName = re.compile(r'^\w[\w\- ]*$')
+
+pagePath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'explorer.html')
+
+
+def lttb(x, y, n):
+    """Indices of the n of points x, y that largest triangle three buckets keeps."""
+    count = len(x)
+    if n >= count or n < 3:
+        return np.arange(count)
+    every = (count - 2) / (n - 2)
+    edges = (np.arange(n - 1) * every).astype(np.int64) + 1
+    edges[-1] = count - 1
+    kept = np.empty(n, dtype=np.int64)
+    kept[0], kept[-1] = 0, count - 1
+    a = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        after = slice(end, edges[i + 2] if i + 2 < n - 1 else count)
+        ax, ay = x[after].mean(), y[after].mean()
+        area = np.abs((x[a] - ax) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (ay - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def minMax(x, y, n):
+    """Indices of the first min and max of each of n / 2 buckets of points x, y."""
+    count = len(x)
+    buckets = n // 2
+    if n >= count or buckets < 1:
+        return np.arange(count)
+    starts = np.linspace(0, count, buckets + 1).astype(np.int64)[:-1]
+    bucket = np.repeat(np.arange(buckets), np.diff(np.append(starts, count)))
+    kept = []
+    for extreme in (np.minimum, np.maximum):
+        at = np.flatnonzero(y == extreme.reduceat(y, starts)[bucket])
+        kept.append(at[np.unique(bucket[at], return_index=True)[1]])
+    return np.unique(np.concatenate(kept))
+
+
+downsamplers = {'lttb': lttb, 'minmax': minMax}
+
+
+def level(days, width):
+    """Tile level whose days per point are the fewest that are no finer than days over width pixels."""
+    return max(0, math.ceil(math.log2(max(days, 1) / max(width, 1))))
+
+
+class OutputStore:
+    """Outputs of the sets in sourcePath, read when first asked for and again when they change."""
+
+    def __init__(self, sourcePath):
+        self.sourcePath = sourcePath
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def _source(self, testSet):
+        """testSet's snapshot or Outputs folder in sourcePath, KeyError if it has neither."""
+        if testSet is None or not _setName.match(testSet):
+            raise KeyError(testSet)
+        snap = os.path.join(self.sourcePath, testSet + '.snap')
+        if os.path.isfile(snap):
+            return snap
+        outputs = os.path.join(self.sourcePath, testSet, 'Outputs')
+        if os.path.isdir(outputs):
+            return outputs
+        raise KeyError(testSet)
+
+    def sets(self):
+        """Names of the sets in sourcePath with a snapshot or an Outputs folder."""
+        names = set()
+        for entry in os.scandir(self.sourcePath):
+            if entry.is_file() and entry.name.endswith('.snap'):
+                names.add(entry.name[:-len('.snap')])
+            elif entry.is_dir() and not entry.name.startswith('.') and os.path.isdir(os.path.join(entry.path, 'Outputs')):
+                names.add(entry.name)
+        return sorted(names)
+
+    def runs(self, testSet):
+        """(version, outputs) of testSet, the version changing whenever its outputs do.
+
+        The version is the latest modification time of the snapshot, or of
+        the Outputs folder and the files in it, so a csv rewritten in place
+        is read again.
+        """
+        source = self._source(testSet)
+        try:
+            version = os.stat(source).st_mtime_ns
+            if os.path.isdir(source):
+                version = max([version] + [e.stat().st_mtime_ns for e in os.scandir(source) if e.is_file()])
+        except OSError:
+            raise KeyError(testSet)
+        with self._lock:
+            known = self._runs.get(testSet)
+            if known is None or known[0] != version:
+                known = (version, readRuns(source))
+                self._runs[testSet] = known
+        return known
+
+
+@functools.lru_cache(maxsize=20000)
+def _tile(store, testSet, version, test, variable, method, tileLevel, index):
+    """(days, values) of one tile of a series, downsampled to at most tilePoints."""
+    runs = store.runs(testSet)[1]
+    offset, first, days = runs.tests[test]
+    span = tilePoints * 2 ** tileLevel
+    lo, hi = max(index * span, first), min((index + 1) * span, first + days)
+    if hi <= lo:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    y = runs.values[runs.columns.index(variable), offset + lo - first:offset + hi - first]
+    x = np.arange(lo, hi)
+    present = ~np.isnan(y)
+    x, y = x[present], np.asarray(y[present], dtype=np.float64)
+    kept = downsamplers[method](x.astype(np.float64), y, tilePoints)
+    return x[kept], y[kept]
+
+
+def series(store, testSet, variable, tests, start=None, end=None, width=1000, method='lttb'):
+    """Downsampled series of variable for each of tests, for a plot width pixels wide.
+
+    start and end are days since 1970-01-01, by default the first and last
+    day of the tests.  Returns the tile level used and [{test, x, y}].
+    """
+    version, runs = store.runs(testSet)
+    if variable not in runs.columns:
+        raise KeyError(variable)
+    if method not in downsamplers:
+        raise KeyError(method)
+    tests = [t for t in tests if runs.tests[t][2] > 0]
+    if len(tests) == 0:
+        return 0, []
+    if start is None:
+        start = min(runs.tests[t][1] for t in tests)
+    if end is None:
+        end = max(runs.tests[t][1] + runs.tests[t][2] for t in tests)
+    # Fewer points per series when there are many, so the response stays a similar size
+    width = max(16, min(width, maxPoints // len(tests)))
+    tileLevel = level(end - start, width)
+    span = tilePoints * 2 ** tileLevel
+    result = []
+    for test in tests:
+        first, days = runs.tests[test][1:]
+        lo, hi = max(start, first), min(end, first + days)
+        if hi <= lo:
+            continue
+        tiles = [_tile(store, testSet, version, test, variable, method, tileLevel, i)
+                 for i in range(lo // span, (hi - 1) // span + 1)]
+        x = np.concatenate([t[0] for t in tiles])
+        y = np.concatenate([t[1] for t in tiles])
+        # One point either side of the view so lines run to its edges
+        inView = np.flatnonzero((x >= lo) & (x < hi))
+        if len(inView):
+            inView = np.arange(max(inView[0] - 1, 0), min(inView[-1] + 2, len(x)))
+        result.append({'test': test, 'x': x[inView].tolist(), 'y': np.round(y[inView], decimals).tolist()})
+    return tileLevel, result
+
+
+def _day(text):
+    return None if text is None else int(np.datetime64(text, 'D').astype(np.int64))
+
+
+class ExplorerHandler(BaseHTTPRequestHandler):
+    """Answers the explorer's requests from the OutputStore of its server."""
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, contentType='application/json'):
+        data = body if isinstance(body, bytes) else json.dumps(body, separators=(',', ':')).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        def one(name, default=None):
+            return query.get(name, [default])[0]
+
+        store = self.server.store
+        try:
+            if url.path == '/':
+                with open(pagePath, 'rb') as f:
+                    self._send(200, f.read(), 'text/html; charset=utf-8')
+            elif url.path == '/api/sets':
+                self._send(200, {s: len(store.runs(s)[1].tests) for s in store.sets()})
+            elif url.path == '/api/tests':
+                runs = store.runs(one('set'))[1]
+                self._send(200, {'variables': list(runs.columns),
+                                 'tests': {t: {'first': first, 'days': days} for t, (_, first, days) in runs.tests.items()}})
+            elif url.path == '/api/series':
+                runs = store.runs(one('set'))[1]
+                tests = query.get('test') or list(runs.tests)
+                match = one('match')
+                if match:
+                    pattern = re.compile(match, re.IGNORECASE)
+                    tests = [t for t in tests if pattern.search(t)]
+                missing = [t for t in tests if t not in runs.tests]
+                if missing:
+                    raise KeyError(missing[0])
+                level, found = series(store, one('set'), one('variable'), tests[:maxSeries],
+                                      _day(one('start')), _day(one('end')), int(one('width', 1000)),
+                                      one('method', 'lttb'))
+                self._send(200, {'level': level, 'tiles': _tile.cache_info().currsize,
+                                 'truncated': len(tests) > maxSeries, 'series': found})
+            else:
+                self._send(404, {'error': f"No such page: {url.path}"})
+        except KeyError as e:
+            self._send(404, {'error': f"Not found: {e.args[0]}"})
+        except (ValueError, re.error) as e:
+            self._send(400, {'error': str(e)})
+
+
+def serveExplorer(sourcePath, host='127.0.0.1', port=8050, verbose=False):
+    """Serves the explorer for the outputs in sourcePath until interrupted."""
+    server = ThreadingHTTPServer((host, port), ExplorerHandler)
+    server.store = OutputStore(sourcePath)
+    server.verbose = verbose
+    print(f"Exploring {sourcePath} at http://{host}:{server.server_address[1]}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,93 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Reuse of figures and artists between validation figures with the same layout.
+
+Figures that share a size and grid of axes are drawn into one figure that is
+kept for the life of the process, instead of a new figure for each png.  When
+the figure is handed out again its lines and texts are taken off the axes and
+kept as spares.  Plot functions draw their series with line() and text(),
+which put a spare back with the new data and only create an artist when the
+spares run out, so memory stays flat however many figures are rendered.
+
+Axes are hidden until something is drawn on them, so a plot function can use
+as many of the grid's axes as it needs.
+"""
+
+import matplotlib.pyplot as plt
+from matplotlib import cbook
+
+_layouts = {}
+
+# Style a spare line goes back to before it is drawn again, as ax.plot would give it
+_lineDefaults = {'label': '_nolegend_', 'linestyle': '-', 'marker': 'None',
+                 'markeredgecolor': 'auto', 'markerfacecolor': 'auto'}
+
+
+def layoutFigure(figsize, layout):
+    """The figure kept for figsize and a (rows, columns) grid of axes, cleared to draw into."""
+    key = (tuple(figsize) if figsize else None, tuple(layout))
+    fig = _layouts.get(key)
+    if fig is None:
+        fig = plt.figure(figsize=figsize)
+        fig.subplots(*layout, squeeze=False)
+        for ax in fig.axes:
+            ax.spareLines = []
+            ax.spareTexts = []
+        _layouts[key] = fig
+    # tight_layout starts from the current spacing, so put back the default before it is called again
+    fig.subplots_adjust(**{k: plt.rcParams['figure.subplot.' + k] for k in ['left', 'right', 'bottom', 'top', 'wspace', 'hspace']})
+    for ax in fig.axes:
+        for artist in list(ax.lines):
+            artist.remove()
+            ax.spareLines.append(artist)
+        for artist in list(ax.texts):
+            artist.remove()
+            ax.spareTexts.append(artist)
+        if ax.legend_ is not None:
+            ax.legend_.remove()
+        ax.set_title('')
+        ax.set_xlabel('')
+        ax.set_ylabel('')
+        ax.relim()
+        ax.autoscale(enable=True)
+        ax.set_visible(False)
+    return fig
+
+
+def line(ax, x, y, **kwargs):
+    """Draws a series on ax, reusing a spare line when there is one.
+
+    kwargs are Line2D properties.  Give the colour, as a spare line keeps its
+    own rather than taking the next one from the colour cycle.
+    """
+    ax.set_visible(True)
+    if not getattr(ax, 'spareLines', None):
+        return ax.plot(x, y, **kwargs)[0]
+    artist = ax.spareLines.pop(0)
+    ax.xaxis.update_units(x)
+    ax.yaxis.update_units(y)
+    artist.set_data(x, y)
+    artist.set(**{**_lineDefaults, **cbook.normalize_kwargs(kwargs, artist)})
+    ax.add_line(artist)
+    ax.autoscale(enable=None)
+    return artist
+
+
+def text(ax, x, y, s, **kwargs):
+    """Writes s on ax, reusing a spare text when there is one."""
+    ax.set_visible(True)
+    if not getattr(ax, 'spareTexts', None):
+        return ax.text(x, y, s, **kwargs)
+    artist = ax.spareTexts.pop(0)
+    artist.set(x=x, y=y, text=s, **kwargs)
+    ax.add_artist(artist)
+    return artist
+
+
+def closeFigures():
+    """Closes every figure kept for reuse."""
+    for fig in _layouts.values():
+        plt.close(fig)
+    _layouts.clear()
@@ -0,0 +1,200 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""The validation report, written as a small static site.
+
+The figures in TestGraphs/Outputs are grouped by test set from the number
+and set name that start each png name, e.g. 2-WS2 Site 1.png.  Each set
+gets a page with its Stats tables and a thumbnail of each figure that links
+to the full size png, and index.html lists the sets with the timing table of
+the validation run.  Thumbnails are lazy loaded, so a page only fetches the
+images scrolled to and the full size ones only when clicked.  Figures saved
+as svg are shown as they are and pdfs only linked.
+
+Pages are written to the file as they go rather than built up in memory.
+Full size figures are copied and thumbnails made only for figures that changed
+since the last build, the thumbnails in a pool of worker processes.
+"""
+
+import os
+import re
+import html
+import shutil
+from urllib.parse import quote
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from .outputs import _poolContext
+from .profiling import profileTable, readProfile, timed
+
+thumbnailWidth = 480
+
+# Stages shown in the timing table, the rest are in Profile.json
+reportStages = ['xlsx', 'csv', 'dates', 'obspred', 'stats', 'render', 'savefig']
+
+_setName = re.compile(r'^(\d+)-([A-Za-z0-9]+)')
+
+figureTypes = ('.png', '.svg', '.pdf')
+
+_style = """body{font-family:sans-serif;margin:1em 2em;color:#222}
+a{color:#0366d6}
+.figures{display:flex;flex-wrap:wrap;gap:1em}
+.figures figure{margin:0}
+.figures figcaption{font-size:.85em;max-width:%dpx}
+table{border-collapse:collapse;font-size:.85em;margin-bottom:1em}
+td,th{border:1px solid #ccc;padding:2px 6px;text-align:right}""" % thumbnailWidth
+
+
+def figureSets(inPath):
+    """{set: [file names]} of the figures and Stats csvs in inPath, sets in the order of their numbers.
+
+    Files whose names don't start with a number and set name go in 'Other'.
+    """
+    grouped = {}
+    for name in sorted(os.listdir(inPath)):
+        if not name.endswith(figureTypes + ('.csv',)):
+            continue
+        match = _setName.match(name)
+        key = (int(match.group(1)), match.group(2)) if match else (float('inf'), 'Other')
+        grouped.setdefault(key, []).append(name)
+    return {testSet: names for (_, testSet), names in sorted(grouped.items())}
+
+
+def _stale(source, target):
+    try:
+        return os.stat(target).st_mtime_ns < os.stat(source).st_mtime_ns
+    except OSError:
+        return True
+
+
+def makeThumbnail(source, target, width=thumbnailWidth):
+    """Writes a copy of the png at source scaled down to width pixels wide, returning its size."""
+    from PIL import Image
+    with Image.open(source) as image:
+        image.thumbnail((width, width * image.height // max(image.width, 1)))
+        image.save(target + '.tmp', format='PNG', optimize=True)
+        size = image.size
+    os.replace(target + '.tmp', target)
+    return size
+
+
+def _imageSize(path):
+    from PIL import Image
+    with Image.open(path) as image:
+        return image.size
+
+
+@timed('thumbnails')
+def makeThumbnails(inPath, outPath, names, workers=None):
+    """Copies each figure in names to outPath/figures and makes a thumbnail of each png in outPath/thumbs.
+
+    Only figures newer than their copy are redone.  Returns {name: thumbnail size} of the pngs.
+    """
+    figures = os.path.join(outPath, 'figures')
+    thumbs = os.path.join(outPath, 'thumbs')
+    os.makedirs(figures, exist_ok=True)
+    os.makedirs(thumbs, exist_ok=True)
+    todo = []
+    for name in names:
+        source = os.path.join(inPath, name)
+        if _stale(source, os.path.join(figures, name)):
+            shutil.copy2(source, os.path.join(figures, name))
+        if name.endswith('.png') and _stale(source, os.path.join(thumbs, name)):
+            todo.append(name)
+
+    sources = [os.path.join(inPath, n) for n in todo]
+    targets = [os.path.join(thumbs, n) for n in todo]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(todo))
+    context = _poolContext()
+    if workers < 2 or context is None:
+        made = [makeThumbnail(s, t) for s, t in zip(sources, targets)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            made = list(pool.map(makeThumbnail, sources, targets))
+    sizes = dict(zip(todo, made))
+    for name in names:
+        if name.endswith('.png') and name not in sizes:
+            sizes[name] = _imageSize(os.path.join(thumbs, name))
+    return sizes
+
+
+def _page(f, title):
+    f.write('<!DOCTYPE html>\n<html lang="en"><head><meta charset="utf-8">'
+            '<meta name="viewport" content="width=device-width, initial-scale=1">'
+            f'<title>{html.escape(title)}</title><style>{_style}</style></head><body>\n')
+
+
+def _table(f, frame):
+    f.write(frame.to_html(float_format=lambda x: f"{x:.3g}", na_rep="", border=0))
+    f.write('\n')
+
+
+def _pageName(testSet):
+    return quote(testSet) + '.html'
+
+
+def _figure(name, sizes):
+    caption = html.escape(os.path.splitext(name)[0])
+    link = f'figures/{quote(name)}'
+    if name.endswith('.png'):
+        width, height = sizes[name]
+        image = f'<img src="thumbs/{quote(name)}" loading="lazy" width="{width}" height="{height}" alt="{caption}">'
+    elif name.endswith('.svg'):
+        image = f'<img src="{link}" loading="lazy" width="{thumbnailWidth}" alt="{caption}">'
+    else:
+        image = 'PDF'
+    return f'<figure><a href="{link}">{image}</a><figcaption>{caption}</figcaption></figure>\n'
+
+
+def writeSetPage(inPath, outPath, testSet, names, sizes):
+    """Writes testSet's page, its Stats tables then a lazy loaded thumbnail of each figure."""
+    with open(os.path.join(outPath, testSet + '.html'), 'w', encoding='utf-8') as f:
+        _page(f, f"{testSet} validation")
+        f.write(f'<p><a href="index.html">All test sets</a></p>\n<h1>{html.escape(testSet)}</h1>\n')
+        for name in names:
+            if name.endswith('.csv'):
+                f.write(f'<h2>{html.escape(name[:-len(".csv")])}</h2>\n')
+                _table(f, pd.read_csv(os.path.join(inPath, name), index_col=0))
+        f.write('<div class="figures">\n')
+        for name in names:
+            if name.endswith(figureTypes):
+                f.write(_figure(name, sizes))
+        f.write('</div>\n</body></html>\n')
+
+
+def writeIndex(inPath, outPath, sets, sizes):
+    """Writes index.html, linking each set's page with its first png thumbnail, then the timing table."""
+    with open(os.path.join(outPath, 'index.html'), 'w', encoding='utf-8') as f:
+        _page(f, 'FieldNBalance validation')
+        f.write('<h1>FieldNBalance validation</h1>\n<div class="figures">\n')
+        for testSet, names in sets.items():
+            pngs = [n for n in names if n.endswith('.png')]
+            count = sum(n.endswith(figureTypes) for n in names)
+            f.write(f'<figure><a href="{_pageName(testSet)}">')
+            if pngs:
+                width, height = sizes[pngs[0]]
+                f.write(f'<img src="thumbs/{quote(pngs[0])}" loading="lazy" width="{width}" height="{height}" alt="">')
+            f.write(f'</a><figcaption><a href="{_pageName(testSet)}">{html.escape(testSet)}</a>, '
+                    f'{count} figure{"" if count == 1 else "s"}</figcaption></figure>\n')
+        f.write('</div>\n')
+        steps = readProfile(inPath)
+        if steps:
+            f.write('<h2>Validation run timings</h2>\n')
+            _table(f, profileTable(steps, reportStages))
+        f.write('</body></html>\n')
+
+
+def writeReport(inPath, outPath, workers=None):
+    """Writes the report site for the figures in inPath to outPath. Returns the sets it has pages for."""
+    sets = figureSets(inPath)
+    figures = [n for names in sets.values() for n in names if n.endswith(figureTypes)]
+    if len(figures) == 0:
+        raise FileNotFoundError(f"No images found in directory: {inPath}")
+    os.makedirs(outPath, exist_ok=True)
+    sizes = makeThumbnails(inPath, outPath, figures, workers)
+    for testSet, names in sets.items():
+        writeSetPage(inPath, outPath, testSet, names, sizes)
+    writeIndex(inPath, outPath, sets, sizes)
+    return list(sets)
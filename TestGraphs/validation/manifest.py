@@ -0,0 +1,115 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Content hashes of the files and data that each validation step depends on.
+
+A manifest is a small json file recording the hash of every input and output
+of a step the last time it ran.  The step can be skipped when its inputs hash
+the same as then and its outputs are still there unchanged.  Hashes are of
+file contents, so a file that is rewritten with the same values (as the
+Outputs csvs are on every test run) counts as unchanged.  The hash of each
+file is remembered against its size and modification time so files that
+haven't been touched aren't read again.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+manifestVersion = 1
+
+
+def _newHash():
+    return hashlib.blake2b(digest_size=16)
+
+
+def fileStamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def fileHash(path):
+    """Hash of the contents of the file at path."""
+    h = _newHash()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hashFiles(paths, memo):
+    """Hash of each of paths that exists, reusing memo entries for files that haven't changed.
+
+    memo maps a path to the stamp and hash it had when last hashed and is
+    updated in place.  Missing files are left out of the result.
+    """
+    hashes = {}
+    for path in paths:
+        try:
+            stamp = fileStamp(path)
+        except OSError:
+            continue
+        known = memo.get(path)
+        if known is None or known['stamp'] != stamp:
+            known = {'stamp': stamp, 'hash': fileHash(path)}
+            memo[path] = known
+        hashes[path] = known['hash']
+    return hashes
+
+
+def _updateData(h, obj):
+    if isinstance(obj, pd.DataFrame):
+        h.update(repr((type(obj).__name__, list(obj.columns), list(obj.dtypes.astype(str)))).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, (pd.Series, pd.Index)):
+        h.update(repr((type(obj).__name__, obj.name, str(obj.dtype))).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=isinstance(obj, pd.Series)).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(repr((obj.dtype.str, obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes() if obj.dtype != object else repr(obj.tolist()).encode())
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for item in obj:
+            _updateData(h, item)
+    elif isinstance(obj, dict):
+        h.update(f"dict{len(obj)}".encode())
+        for key in sorted(obj, key=repr):
+            _updateData(h, key)
+            _updateData(h, obj[key])
+    else:
+        h.update(repr(obj).encode())
+
+
+def dataHash(*objs):
+    """Hash of the values in objs: frames, series, arrays, and lists, tuples or dicts of them."""
+    h = _newHash()
+    for obj in objs:
+        _updateData(h, obj)
+    return h.hexdigest()
+
+
+def readManifest(path):
+    """The manifest saved at path, or an empty one if there isn't a current one."""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    if manifest.get('version') != manifestVersion:
+        manifest = {'version': manifestVersion}
+    manifest.setdefault('files', {})
+    return manifest
+
+
+def writeManifest(manifest, path):
+    """Saves manifest to path, quietly leaving the old one if it can't be written."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass
@@ -0,0 +1,162 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Memory-mapped archive of the weather in SVSModel/Data/Met.
+
+compileMetArchive() reads every met csv once and lays the stations out on one
+daily calendar in a station x day x variable array of float64, saved as a
+.npy file in the .cache folder next to the csvs.  Climatology stations (DOY
+files) are unrolled over the calendar by day of year, as
+ModelInterface.BuildMetDataDictionaries looks them up, so day 366 is only
+used in leap years and a range that crosses the new year is still one slice.
+Actual stations (Year, DOY files) have their recorded days, and NaN on the
+days outside their record.
+
+openMetArchive() maps the array read only and rebuilds it first if any csv
+has changed, and MetArchive.weather() returns each variable over a date range
+as a view into the mapped file, so nothing is copied or parsed.
+"""
+
+import os
+import json
+import glob
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from .manifest import hashFiles
+
+archiveVersion = 1
+
+metVariables = ['MeanT', 'Rain', 'MeanPET']
+
+metPath = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                       'SVSModel', 'Data', 'Met')
+
+# Weather from startDate up to but not including endDate, as BuildMetDataDictionaries gives it
+MetData = namedtuple('MetData', ['station', 'dates'] + metVariables)
+
+
+def _archiveFiles(path, cachePath):
+    if cachePath is None:
+        cachePath = os.path.join(path, '.cache')
+    return os.path.join(cachePath, 'Met.npy'), os.path.join(cachePath, 'Met.json')
+
+
+def _metFiles(path):
+    return sorted(glob.glob(os.path.join(path, '*.csv')))
+
+
+def _stationValues(file, days):
+    """Values of each variable of the met file on each of days, NaN where it has none."""
+    data = pd.read_csv(file, encoding='utf-8-sig')
+    values = np.full((len(days), len(metVariables)), np.nan)
+    if 'Year' in data.columns:
+        dates = pd.to_datetime(data['Year'].astype(str), format='%Y') + pd.to_timedelta(data['DOY'] - 1, unit='D')
+        # DOY 366 of a year that isn't a leap year isn't a day BuildMetDataDictionaries looks for
+        recorded = (dates.dt.year == data['Year']).to_numpy()
+        rows = days.get_indexer(dates[recorded])
+        inCalendar = rows >= 0
+        values[rows[inCalendar]] = data.loc[recorded, metVariables].to_numpy()[inCalendar]
+        return 'actual', values
+    byDOY = np.full((367, len(metVariables)), np.nan)
+    byDOY[data['DOY'].to_numpy()] = data[metVariables].to_numpy()
+    values[:] = byDOY[days.dayofyear]
+    return 'climatology', values
+
+
+def compileMetArchive(path=metPath, cachePath=None, firstYear=1990, lastYear=2050, memo=None):
+    """Reads every met csv in path into the archive, returning its index.
+
+    The calendar runs from the start of firstYear to the end of lastYear, or
+    further to take in all the days of the actual stations.
+    """
+    files = _metFiles(path)
+    if not files:
+        raise FileNotFoundError(f"No met files in {path}")
+    arrayFile, indexFile = _archiveFiles(path, cachePath)
+    for file in files:
+        if os.path.basename(file).endswith('Actual.csv'):
+            years = pd.read_csv(file, usecols=['Year'], encoding='utf-8-sig')['Year']
+            firstYear = min(firstYear, int(years.min()))
+            lastYear = max(lastYear, int(years.max()))
+    days = pd.date_range(f'{firstYear}-01-01', f'{lastYear}-12-31', freq='D')
+
+    os.makedirs(os.path.dirname(arrayFile), exist_ok=True)
+    archive = np.lib.format.open_memmap(arrayFile + '.tmp', mode='w+', dtype=np.float64,
+                                        shape=(len(files), len(days), len(metVariables)))
+    kinds = {}
+    for i, file in enumerate(files):
+        station = os.path.splitext(os.path.basename(file))[0]
+        kinds[station], archive[i] = _stationValues(file, days)
+    archive.flush()
+    del archive
+    os.replace(arrayFile + '.tmp', arrayFile)
+
+    index = {'version': archiveVersion,
+             'start': str(days[0].date()),
+             'days': len(days),
+             'variables': metVariables,
+             'stations': list(kinds),
+             'kinds': kinds,
+             'sources': hashFiles(files, memo if memo is not None else {})}
+    with open(indexFile + '.tmp', 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(indexFile + '.tmp', indexFile)
+    return index
+
+
+class MetArchive:
+    """The weather of every station, read from a compiled archive.
+
+    values is the mapped station x day x variable array, with day 0 at start.
+    """
+
+    def __init__(self, arrayFile, index):
+        self.values = np.load(arrayFile, mmap_mode='r')
+        self.start = np.datetime64(index['start'], 'D')
+        self.stations = index['stations']
+        self.kinds = index['kinds']
+        self.variables = index['variables']
+        self._stationRows = {s: i for i, s in enumerate(self.stations)}
+
+    @property
+    def end(self):
+        """The day after the last day in the archive."""
+        return self.start + self.values.shape[1]
+
+    def _day(self, date):
+        return int((np.datetime64(pd.Timestamp(date).date(), 'D') - self.start).astype(int))
+
+    def weather(self, station, startDate, endDate):
+        """MeanT, Rain and MeanPET of station from startDate up to but not including endDate.
+
+        Each variable is a read only view of the archive.  Days without a
+        record at an actual station are NaN, where BuildMetDataDictionaries
+        would leave them out.
+        """
+        row = self._stationRows.get(station)
+        if row is None:
+            raise KeyError(f"No met station '{station}' in the archive, expected one of {self.stations}")
+        first, last = self._day(startDate), self._day(endDate)
+        if first < 0 or last > self.values.shape[1]:
+            raise ValueError(f"Dates {startDate} to {endDate} are outside the archive, which covers "
+                             f"{self.start} to {self.end}; compile it with more years")
+        days = self.values[row, first:max(first, last)]
+        dates = self.start + np.arange(first, max(first, last))
+        return MetData(station, dates, *[days[:, v] for v in range(len(self.variables))])
+
+
+def openMetArchive(path=metPath, cachePath=None):
+    """The archive of the met files in path, compiled first if it is missing or any file has changed."""
+    arrayFile, indexFile = _archiveFiles(path, cachePath)
+    try:
+        with open(indexFile) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    memo = {}
+    current = hashFiles(_metFiles(path), memo)
+    if index.get('version') != archiveVersion or index.get('sources') != current or not os.path.isfile(arrayFile):
+        index = compileMetArchive(path, cachePath, memo=memo)
+    return MetArchive(arrayFile, index)
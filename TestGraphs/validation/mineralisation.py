@@ -0,0 +1,230 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Soil organic matter and residue N mineralisation as array operations.
+
+These are the response functions and daily accumulations of SoilOrganic.cs
+and Residues.cs, written so that every argument broadcasts.  Days are always
+the last axis, so temperatures and soil water can carry any other axes
+(station, treatment, ensemble member) and a sweep over PMN and RSWC is a
+single outer product rather than a loop over days.  checkOutputs() compares
+them with the SoilOMN and ResidueN the model wrote for a test set.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+# From SVSModel/Configuration/Constants.cs
+particleDensity = {'Sedimentary': 2.65, 'Volcanic': 1.9}
+porosity = {'Sand': 0.5, 'LoamySand': 0.51, 'SandyLoam': 0.52, 'SandyClay': 0.54, 'SandyClayLoam': 0.56,
+            'Loam': 0.54, 'Silt': 0.54, 'SiltLoam': 0.55, 'SiltyClayLoam': 0.58, 'ClayLoam': 0.58,
+            'SiltyClay': 0.61, 'Clay': 0.63}
+sampleDepthFactor = {'Top15cm': 0.75, 'Top30cm': 1, 'Top60cm': 1.25, 'Top90cm': 1.5}
+proportionTt = {'Seed': -0.0517, 'Seedling': 0.050, 'Vegetative': 0.5, 'EarlyReproductive': 0.5847,
+                'MidReproductive': 0.6815, 'LateReproductive': 0.7944, 'Maturity': 0.999, 'Late': 1.2957}
+unitConversions = {'t/ha': 1000, 'kg/ha': 1.0, 'kg/head': 1.0}
+residueFactRetained = {'None removed': 1.0, 'Baled': 0.2, 'Burnt': 0.05, 'Grazed': 0.4, 'All removed': 0.0}
+
+# Test.SetConfigFromDataFrame gives every crop's yield in these units
+configYieldUnits = 't/ha'
+
+
+def lloydTaylorTemp(t):
+    """SoilOrganic.LloydTaylorTemp."""
+    return 0.3124 * np.exp(308.56 * (1 / 56.02 - (1 / ((np.asarray(t) + 273.15) - 227.13))))
+
+
+def qiuBeareCurtinWater(rwc):
+    """SoilOrganic.QiuBeareCurtinWater."""
+    rwc = np.asarray(rwc)
+    return np.minimum(0.57 * rwc ** 2 + (0.15 * rwc) + 0.33, 1.0)
+
+
+def vanHoffQ10(temp):
+    """residue.VanHoffQ10."""
+    return np.power(2.0, (np.asarray(temp) - 30) / 10)
+
+
+def linearSoilWater(rwc):
+    """residue.linearSoilWater."""
+    return np.minimum(1, np.asarray(rwc) * 2)
+
+
+def bulkDensity(soilCategory, texture):
+    return particleDensity[soilCategory] * (1 - porosity[texture])
+
+
+def pmnKgPerHa(pmn, bulkDensity, sampleDepth='Top30cm', rocks=0):
+    """Mineralisable N in kg/ha for a PMN in mg/g, as SoilOrganic.Mineralisation works it out.
+
+    rocks is the percentage of stones, as in the configs.
+    """
+    depthFactor = 30 * sampleDepthFactor[sampleDepth] * (1 - np.asarray(rocks) / 100)
+    return np.asarray(pmn) * bulkDensity * depthFactor * 0.1
+
+
+def somMineralisation(meanT, rswc, pmnKgPerHa):
+    """Daily N mineralised from soil organic matter, broadcasting all three arguments."""
+    return np.asarray(pmnKgPerHa) / 98 * lloydTaylorTemp(meanT) * qiuBeareCurtinWater(rswc)
+
+
+def somSweep(meanT, pmnKgPerHa, rswc):
+    """somMineralisation for every combination of meanT, PMN and RSWC values.
+
+    Returns an array of shape meanT.shape + pmnKgPerHa.shape + rswc.shape, so
+    station x day temperatures against 20 PMNs and 50 soil waters gives
+    station x day x 20 x 50.  Each factor is worked out once and the result
+    is their outer product.
+    """
+    tempF = lloydTaylorTemp(meanT)
+    pmn = np.asarray(pmnKgPerHa, dtype=float) / 98
+    waterF = qiuBeareCurtinWater(rswc)
+    return np.multiply.outer(np.multiply.outer(tempF, pmn), waterF)
+
+
+def residueCoefficients(amountN, nConc):
+    """Mineralisable and immobilising N and their rate constants of a residue, as the residue constructor sets them."""
+    cnr = 40 / np.asarray(nConc, dtype=float)
+    amountN = np.asarray(amountN, dtype=float)
+    anm = amountN * 81.614 / 100
+    ani = amountN * (4.8701 + (cnr * 2.43475)) / 100
+    km = 0.041678 + (1.026182 - 0.041678) * np.exp(-0.123883 * cnr)
+    ki = 0.112333 + (1.026182 - 0.041678) * np.exp(-0.130226 * cnr)
+    return anm, ani, km, ki
+
+
+def residueNetMineralisation(meanT, rswc, amountN, nConc, start):
+    """Cumulative net N mineralised from residue cohorts by each day, as residue.NetMineralisation.
+
+    meanT and rswc have days on the last axis.  amountN, nConc and start, the
+    index of the day after the residue was added, give one cohort per element
+    and broadcast against the other axes of meanT and rswc.  The result has
+    the broadcast cohort axes followed by days.
+    """
+    ftm = vanHoffQ10(meanT) * linearSoilWater(rswc)
+    start = np.expand_dims(np.asarray(start), -1)
+    active = np.arange(ftm.shape[-1]) >= start
+    sigma = np.cumsum(np.where(active, ftm, 0.0), axis=-1)
+    anm, ani, km, ki = [np.expand_dims(c, -1) for c in residueCoefficients(amountN, nConc)]
+    net = anm * (1 - np.exp(-km * sigma)) - ani * (1 - np.exp(-ki * sigma))
+    return np.where(active, net, 0.0)
+
+
+def residueMineralisation(meanT, rswc, amountN, nConc, start):
+    """Daily N mineralised from all residue cohorts, as Residues.Mineralisation.
+
+    The cohorts are on the last axis of amountN, nConc and start, and are
+    summed.  meanT and rswc have days on their last axis.
+    """
+    meanT = np.expand_dims(np.asarray(meanT), -2)
+    rswc = np.expand_dims(np.asarray(rswc), -2)
+    total = residueNetMineralisation(meanT, rswc, amountN, nConc, start).sum(axis=-2)
+    return np.diff(total, axis=-1, prepend=0)
+
+
+def _sigmoid(x, xo, b):
+    return 1 / (1 + np.exp(-(x - xo) / b))
+
+
+def readCropCoefficients(cropTablePath):
+    """The crop coefficient table Crop.LoadCropCoefficients reads, indexed by UniqueName."""
+    return pd.read_csv(cropTablePath, encoding='utf-8-sig', index_col='UniqueName')
+
+
+def harvestResidues(config, crop, coefficients, meanT):
+    """N in the root, stover and field loss residues of a crop at harvest, as Residues.Mineralisation adds them.
+
+    config is a treatment's configs, crop 'Prior' or 'Current', coefficients
+    the crop's row of the coefficient table and meanT the daily mean
+    temperatures from its establish date to its harvest date.  The pools are
+    those Crop.Grow gives on the harvest date, with stover and field loss
+    cut to the share residue removal leaves, as CropConfig.ResStoverReturn
+    and ResFieldLossReturn do.
+    """
+    c = coefficients
+    establishStage = config[crop + 'EstablishStage']
+    ttEstabToHarv = np.maximum(0, np.asarray(meanT) - c['Tbase']).sum()
+    ttSowToEmerg = c['TtEmerg'] if establishStage == 'Seed' else 0
+    propnTt = proportionTt[config[crop + 'HarvestStage']] - max(proportionTt[establishStage], 0)
+    ttEmergToMat = (ttEstabToHarv - ttSowToEmerg) / propnTt
+    ttEmergToSeedling = ttEmergToMat * proportionTt['Seedling'] if establishStage == 'Seedling' else 0
+
+    if c['Typical Yield Units'] == 'kg/head':
+        typicalYield = c['Typical Yield'] * c['Typical Population (/ha)']
+    else:
+        typicalYield = c['Typical Yield'] * unitConversions[c['Typical Yield Units']]
+    fieldLossPct = 100 if c['EndUse'] == 'Green manure' else config[crop + 'FieldLoss']
+    productFwt = config[crop + 'FieldYield'] * unitConversions[configYieldUnits]
+    hi = min(c['Typical HI'] - c['HI Range'] + productFwt * c['HI Range'] / typicalYield, 0.95)
+    if c['Yield type'] == 'Standing DM':
+        productFwt *= hi
+    productDwt = productFwt * (1 - config[crop + 'MoistureContent'] / 100)
+    fieldLossN = productDwt * fieldLossPct / 100 * c['Product [N]'] / 100
+    stoverDwt = productDwt / hi - productDwt
+    stoverN = stoverDwt * c['Stover [N]'] / 100
+    rootN = (stoverDwt + productDwt) * c['P Root'] * c['Root [N]'] / 100
+
+    # Share of the final pools on the harvest date, 1 unless the crop hadn't emerged
+    xo = ttEmergToMat * 0.5
+    ttEmerged = ttEstabToHarv - ttSowToEmerg + ttEmergToSeedling
+    atHarvest = _sigmoid(max(0, ttEmerged), xo, xo * 0.2) / _sigmoid(ttEmerged, xo, xo * 0.2)
+    retained = residueFactRetained[config[crop + 'ResidueRemoval']]
+    return np.array([rootN, stoverN * retained, fieldLossN * retained]) * atHarvest
+
+
+def checkOutputs(testSetPath, cropTablePath=None, archive=None, tolerance=1e-9):
+    """Largest differences between these functions and the SoilOMN and ResidueN of each test in a set.
+
+    Weather comes from the met archive and RSWC from the output itself.  The
+    N in each residue cohort is worked out from the config and the crop
+    coefficients as Crop.Grow and Residues.Mineralisation do.  On days the
+    soil doesn't have the N residues would immobilise SoilNitrogen.cs cuts
+    ResidueN back towards 0, so there it only has to lie between the
+    potential worked out here and 0; LimitedDays counts those days.  Raises
+    AssertionError if either column differs by more than tolerance in any
+    test.
+    """
+    from .configs import readConfigs
+    from .met import metPath, openMetArchive
+    from .outputs import listTests, readOutput
+    if cropTablePath is None:
+        cropTablePath = os.path.join(os.path.dirname(metPath), 'CropCoefficientTableFull.csv')
+    archive = archive or openMetArchive()
+    coefficients = readCropCoefficients(cropTablePath)
+    configs = readConfigs(testSetPath)
+    outputsPath = os.path.join(testSetPath, 'Outputs')
+    errors = {}
+    for test in listTests(outputsPath):
+        output = readOutput(os.path.join(outputsPath, test + '.csv'))
+        config = configs.loc[test]
+        station = config['WeatherStation']
+        met = archive.weather(station, output.index[0], output.index[-1] + pd.Timedelta(days=1))
+        rswc = output['RSWC'].to_numpy()
+
+        pmn = pmnKgPerHa(config['PMN'], bulkDensity(config['SoilCategory'], config['Texture']),
+                         config['SampleDepth'], config['Rocks'])
+        som = somMineralisation(met.MeanT, rswc, pmn)
+
+        amounts, nConc, start = [], [], []
+        for crop in ['Prior', 'Current']:
+            c = coefficients.loc[config[crop + 'CropNameFull']]
+            harvest = config[crop + 'HarvestDate']
+            grown = archive.weather(station, config[crop + 'EstablishDate'], harvest + pd.Timedelta(days=1))
+            amounts.append(harvestResidues(config, crop, c, grown.MeanT))
+            nConc.append(c[['Root [N]', 'Stover [N]', 'Product [N]']].to_numpy(dtype=float))
+            start += [output.index.normalize().get_indexer([harvest])[0] + 1] * 3
+        residue = residueMineralisation(met.MeanT, rswc, np.concatenate(amounts), np.concatenate(nConc), np.array(start))
+
+        modelled = output['ResidueN'].to_numpy()
+        immobilising = residue < 0
+        residueError = np.abs(modelled - np.where(immobilising, np.clip(modelled, residue, 0), residue))
+        errors[test] = {'SoilOMN': np.abs(som - output['SoilOMN'].to_numpy()).max(),
+                        'ResidueN': residueError.max(),
+                        'LimitedDays': int((immobilising & (modelled > residue + tolerance)).sum())}
+    table = pd.DataFrame.from_dict(errors, orient='index')
+    failed = table.index[(table[['SoilOMN', 'ResidueN']] > tolerance).any(axis=1)]
+    if len(failed):
+        raise AssertionError(f"Mineralisation of {', '.join(failed)} differs from the model by more than {tolerance}")
+    return table
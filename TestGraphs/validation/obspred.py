@@ -0,0 +1,86 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Pairing of observed values with the model predictions for the same day.
+
+Observations are joined to AllData in one pass for all tests instead of
+writing one prediction at a time into a frame indexed by every simulated
+date.  The result is a long table with one row per observation that falls
+within a test's prior harvest to current harvest window.  The ObsPred
+reducer of validation.aggregate builds the same table one test at a time.
+"""
+
+import numpy as np
+import pandas as pd
+from .profiling import timed
+
+# Observations are dated at midnight and model days at midday
+observationShift = pd.Timedelta(hours=12)
+
+
+@timed('obspred')
+def observedMeans(observed, variable):
+    """Mean of variable for each observed site and date.
+
+    observed is a CropData or SoilData frame indexed by site with a parsed
+    Date column.  Dates are shifted onto the model day and rows without a
+    value are dropped.
+    """
+    obs = pd.DataFrame({'Date': observed['Date'] + observationShift,
+                        'obs': observed[variable]},
+                       index=observed.index)
+    obs = obs.set_index('Date', append=True)
+    obs = obs.groupby(level=[0, 1]).mean()
+    return obs['obs'].dropna()
+
+
+def harvestWindows(Configs, tests):
+    """Prior harvest and current harvest dates of each test, from the configs readConfigs gives.
+
+    Raises KeyError naming any of tests without a config, rather than give
+    them a window over their whole output.
+    """
+    missing = [t for t in tests if t not in Configs.index]
+    if missing:
+        raise KeyError(f"No configs for {len(missing)} tests: {', '.join(missing)}")
+    windows = pd.DataFrame({'start': Configs['PriorHarvestDate'],
+                            'end': Configs['CurrentHarvestDate']})
+    return windows.reindex(tests)
+
+
+def observationPairs(observed, keys, sites, windows):
+    """The observations of every test that fall within its window, without predictions.
+
+    Takes the arguments of alignObsPred and returns a frame with Site,
+    Treatment, Date and obs columns, one row per observation.
+    """
+    tests = pd.DataFrame({'key': keys, 'Site': sites}).join(windows)
+    tests.index.name = 'Treatment'
+    obs = observed.rename_axis(['key', 'Date']).reset_index()
+    pairs = tests.reset_index().merge(obs, on='key')
+    inWindow = (pairs['Date'] >= pairs['start']) & (pairs['Date'] <= pairs['end'])
+    return pairs.loc[inWindow, ['Site', 'Treatment', 'Date', 'obs']]
+
+
+@timed('obspred')
+def alignObsPred(AllData, observed, variable, keys, sites, windows):
+    """Observed and predicted variable for every test, one row per observation.
+
+    observed is a Series from observedMeans indexed by (observation key, date),
+    keys maps each test to its key in observed, sites maps each test to the
+    site label used in the result and windows holds the start and end dates
+    from harvestWindows.  Observations outside a test's window are left out.
+    Returns a frame with obs and pred columns indexed by (Site, Treatment, Date).
+    """
+    pairs = observationPairs(observed, keys, sites, windows)
+
+    rows = AllData.index.get_indexer(pairs['Date'])
+    cols = AllData.columns.get_indexer(pd.MultiIndex.from_arrays([pairs['Treatment'], np.repeat(variable, len(pairs))]))
+    found = (rows >= 0) & (cols >= 0)
+    pred = np.full(len(pairs), np.nan)
+    pred[found] = AllData.to_numpy()[rows[found], cols[found]]
+    pairs['pred'] = pred
+
+    pairs = pairs.set_index(['Site', 'Treatment', 'Date'])
+    return pairs.sort_index()
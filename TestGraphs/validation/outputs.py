@@ -0,0 +1,167 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Loading of the model outputs written by Test.runTestSet.
+
+Each test set has one csv per test in its Outputs folder.  Parsing those is
+the slow part of every graph script, so the parsed values are kept in one
+parquet file in the set's .cache folder and only csvs whose size or
+modification time changed since the last load are read again.  When many
+csvs need reading they are parsed in a pool of worker processes.
+"""
+
+import os
+import sys
+import json
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from .dates import parseOutputDates
+from .profiling import timed
+
+cacheVersion = 2
+
+# Below this many csvs to parse, starting worker processes costs more than it saves
+parallelThreshold = 32
+
+
+def listTests(outputsPath):
+    """Names of the tests with a csv in outputsPath, in sorted order."""
+    return sorted(f[:-len('.csv')] for f in os.listdir(outputsPath) if f.endswith('.csv'))
+
+
+def readOutput(path, columns=None):
+    """Reads a single output csv into a frame indexed by date.
+
+    Every column after Date is a double in SimulateField, so they are all read
+    as floats even where a test only ever wrote whole numbers.  With columns
+    given only those are parsed.
+    """
+    usecols = None if columns is None else ['Date'] + list(columns)
+    frame = pd.read_csv(path, index_col=0, usecols=usecols).astype(float)
+    frame.index = parseOutputDates(frame.index)
+    return frame
+
+
+def defaultCachePath(outputsPath):
+    return os.path.join(os.path.dirname(os.path.abspath(outputsPath)), '.cache')
+
+
+def _fileStamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _readManifest(manifestFile):
+    try:
+        with open(manifestFile) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != cacheVersion:
+        return {}
+    return manifest.get('files', {})
+
+
+def _poolContext():
+    """Start method for the parsing pool, or None if a pool can't be used.
+
+    Spawned workers re-run the __main__ script, and the graph scripts have no
+    __main__ guard, so spawning is only safe from a notebook or interpreter.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    if getattr(sys.modules['__main__'], '__file__', None) is None:
+        return multiprocessing.get_context('spawn')
+    return None
+
+
+@timed('csv')
+def readOutputs(paths, workers=None, columns=None):
+    """Reads the output csvs in paths, returning the frames in the same order.
+
+    Uses up to workers processes (default one per cpu) when there are at
+    least parallelThreshold files, otherwise reads them one after another.
+    With columns given only those are parsed.
+    """
+    read = readOutput if columns is None else functools.partial(readOutput, columns=list(columns))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(paths))
+    context = _poolContext()
+    if workers < 2 or len(paths) < parallelThreshold or context is None:
+        return [read(p) for p in paths]
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return list(pool.map(read, paths, chunksize=chunksize))
+
+
+def _toWide(long, tests, columns):
+    """Turns the cached long table back into the Test x Variable AllData frame."""
+    wide = long.set_index(['Date', 'Test']).unstack('Test')
+    wide = wide.swaplevel(axis=1)
+    order = pd.MultiIndex.from_tuples([(t, c) for t in tests for c in columns[t]])
+    wide = wide.reindex(columns=order)
+    wide.sort_index(axis=0, inplace=True)
+    wide.index.name = 'Date'
+    return wide
+
+
+@timed('loadOutputs')
+def loadOutputs(outputsPath, cache=True, cachePath=None, workers=None):
+    """Loads every output csv in outputsPath into one frame.
+
+    Columns are a (test, variable) MultiIndex and rows the union of the dates
+    of all tests, the same shape as concatenating the csvs with the test names
+    as keys.  With cache on, parsed values are reused from the set's .cache
+    folder for every csv that has not changed since it was last read.  The
+    rest are parsed by readOutputs with up to workers processes.
+    """
+    tests = listTests(outputsPath)
+    if len(tests) == 0:
+        raise FileNotFoundError(f"No outputs found in directory: {outputsPath}")
+    stamps = {t: _fileStamp(os.path.join(outputsPath, t + '.csv')) for t in tests}
+
+    if cachePath is None:
+        cachePath = defaultCachePath(outputsPath)
+    dataFile = os.path.join(cachePath, 'Outputs.parquet')
+    manifestFile = os.path.join(cachePath, 'Outputs.json')
+
+    cached = _readManifest(manifestFile) if cache else {}
+    if cached and not os.path.exists(dataFile):
+        cached = {}
+    fresh = [t for t in tests if t in cached and cached[t]['stamp'] == stamps[t]]
+    stale = [t for t in tests if t not in fresh]
+
+    parts = []
+    columns = {}
+    # Parse before touching parquet so no arrow threads are running when the pool forks
+    frames = readOutputs([os.path.join(outputsPath, t + '.csv') for t in stale], workers)
+    for t, frame in zip(stale, frames):
+        columns[t] = list(frame.columns)
+        frame = frame.reset_index()
+        frame.insert(0, 'Test', t)
+        parts.append(frame)
+    if len(fresh) > 0:
+        kept = pd.read_parquet(dataFile, filters=[('Test', 'in', fresh)])
+        kept['Test'] = kept['Test'].astype(str)
+        parts.append(kept)
+        columns.update({t: cached[t]['columns'] for t in fresh})
+    long = pd.concat(parts, ignore_index=True)
+
+    if cache and len(stale) > 0:
+        long['Test'] = long['Test'].astype('category')
+        files = {t: {'stamp': stamps[t], 'columns': columns[t]} for t in tests}
+        try:
+            os.makedirs(cachePath, exist_ok=True)
+            long.to_parquet(dataFile + '.tmp', index=False)
+            os.replace(dataFile + '.tmp', dataFile)
+            with open(manifestFile, 'w') as f:
+                json.dump({'version': cacheVersion, 'files': files}, f)
+        except OSError:
+            pass
+        long['Test'] = long['Test'].astype(str)
+
+    return _toWide(long, tests, columns)
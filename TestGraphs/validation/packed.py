@@ -0,0 +1,183 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Binary copy of a test set's outputs that is read by memory mapping.
+
+The outputs of every test in an Outputs folder are packed into Outputs.npy,
+a float64 array with one row per SimulateField column.  Each test has a run
+of days in every row, so one column of one test is a contiguous slice of the
+file.  Outputs.json next to it holds the column names and where each test's
+run starts, its length and its first date.  The days of a test are
+consecutive, as SimulateField writes them, so no dates are stored.
+
+openPacked() maps the file read only, so a graph script only reads the pages
+of the columns it plots.  packOutputs() converts the csvs of an existing
+Outputs folder.
+
+refreshPacked() keeps such a copy of every set in its .cache/Packed folder,
+stamped with the size and modification time of each csv, and only parses
+the csvs that changed since it was last written.  This is where the graph
+scripts read their outputs from, through loadPacked() and
+validation.aggregate.streamOutputs().
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from .dates import dailyIndex, modelDayTime
+from .outputs import _fileStamp, defaultCachePath, listTests, readOutputs
+
+packedVersion = 2
+
+# Columns after Date in the array Simulation.SimulateField returns
+outputColumns = ['SoilMineralN', 'UptakeN', 'ResidueN', 'SoilOMN', 'FertiliserN', 'CropN', 'ProductN',
+                 'LostN', 'RSWC', 'Drainage', 'Irrigation', 'Green cover', 'NDemand']
+
+
+def _packedFiles(outputsPath):
+    return os.path.join(outputsPath, 'Outputs.npy'), os.path.join(outputsPath, 'Outputs.json')
+
+
+def packedCachePath(outputsPath):
+    """Folder refreshPacked keeps the packed copy of outputsPath in."""
+    return os.path.join(defaultCachePath(outputsPath), 'Packed')
+
+
+def writePacked(frames, outputsPath, stamps=None):
+    """Packs {test: output frame} into Outputs.npy and Outputs.json in outputsPath.
+
+    Each frame is indexed by consecutive days, as readOutput gives them.
+    Columns missing from a frame are stored as NaN.  stamps, {test: stamp}
+    of the csvs the frames were read from, are kept in the index.
+    """
+    columns = list(outputColumns)
+    for frame in frames.values():
+        columns += [c for c in frame.columns if c not in columns]
+    tests = {}
+    offset = 0
+    for test, frame in frames.items():
+        days = frame.index.normalize()
+        if len(days) > 1 and not (np.diff(days.values) == np.timedelta64(1, 'D')).all():
+            raise ValueError(f"Output of {test} is not a run of consecutive days")
+        tests[test] = {'offset': offset, 'days': len(frame),
+                       'start': str(days[0].date()) if len(days) else None,
+                       'columns': list(frame.columns)}
+        if stamps is not None:
+            tests[test]['stamp'] = stamps[test]
+        offset += len(frame)
+
+    arrayFile, indexFile = _packedFiles(outputsPath)
+    values = np.lib.format.open_memmap(arrayFile + '.tmp', mode='w+', dtype=np.float64,
+                                       shape=(len(columns), offset))
+    for test, frame in frames.items():
+        run = slice(tests[test]['offset'], tests[test]['offset'] + tests[test]['days'])
+        values[:, run] = frame.reindex(columns=columns).to_numpy(dtype=np.float64).T
+    values.flush()
+    del values
+    os.replace(arrayFile + '.tmp', arrayFile)
+    with open(indexFile + '.tmp', 'w') as f:
+        json.dump({'version': packedVersion, 'columns': columns, 'tests': tests}, f)
+    os.replace(indexFile + '.tmp', indexFile)
+
+
+def packOutputs(outputsPath, workers=None):
+    """Packs the csvs of an Outputs folder, parsing them with readOutputs. Returns the tests packed."""
+    tests = listTests(outputsPath)
+    if len(tests) == 0:
+        raise FileNotFoundError(f"No outputs found in directory: {outputsPath}")
+    frames = readOutputs([os.path.join(outputsPath, t + '.csv') for t in tests], workers)
+    writePacked(dict(zip(tests, frames)), outputsPath)
+    return tests
+
+
+class PackedOutputs:
+    """Outputs of a test set, mapped from its Outputs.npy."""
+
+    def __init__(self, outputsPath):
+        arrayFile, indexFile = _packedFiles(outputsPath)
+        with open(indexFile) as f:
+            index = json.load(f)
+        if index.get('version') != packedVersion:
+            raise ValueError(f"{indexFile} is from another version of the packed format, pack the outputs again")
+        self.values = np.load(arrayFile, mmap_mode='r')
+        self.columns = index['columns']
+        self.tests = list(index['tests'])
+        self._tests = index['tests']
+        self._rows = {c: i for i, c in enumerate(self.columns)}
+
+    def dates(self, test):
+        """Model days of test, stamped at midday as readOutput gives them."""
+        t = self._tests[test]
+        return dailyIndex(pd.Timestamp(t['start']) + modelDayTime, t['days'])
+
+    def column(self, test, column):
+        """Values of one column of test, as a read only view of the file."""
+        t = self._tests[test]
+        return self.values[self._rows[column], t['offset']:t['offset'] + t['days']]
+
+    def frame(self, test, columns=None):
+        """Output of test as readOutput would give it, with only columns if given."""
+        columns = self._tests[test]['columns'] if columns is None else columns
+        return pd.DataFrame({c: self.column(test, c) for c in columns}, index=self.dates(test))
+
+
+def openPacked(outputsPath):
+    """The packed outputs in outputsPath, mapped read only."""
+    return PackedOutputs(outputsPath)
+
+
+def refreshPacked(outputsPath, cachePath=None, workers=None):
+    """The packed copy of the csvs in outputsPath, repacked first if any csv changed.
+
+    The copy is kept in cachePath, by default the set's .cache/Packed folder.
+    Only csvs whose stamp differs from the one packed are parsed, by
+    readOutputs with up to workers processes, and the rest are copied from
+    the old file.  Returns None if the copy can't be written, when the
+    outputs have to be read from the csvs.
+    """
+    tests = listTests(outputsPath)
+    stamps = {t: _fileStamp(os.path.join(outputsPath, t + '.csv')) for t in tests}
+    if cachePath is None:
+        cachePath = packedCachePath(outputsPath)
+    try:
+        packed = PackedOutputs(cachePath)
+    except (OSError, ValueError):
+        packed = None
+    fresh = [] if packed is None else [t for t in tests if packed._tests.get(t, {}).get('stamp') == stamps[t]]
+    if packed is not None and len(fresh) == len(tests) == len(packed.tests):
+        return packed
+
+    stale = [t for t in tests if t not in fresh]
+    frames = dict(zip(stale, readOutputs([os.path.join(outputsPath, t + '.csv') for t in stale], workers)))
+    for t in fresh:
+        frames[t] = packed.frame(t)
+    # The old file is still mapped by packed, which some systems won't replace
+    del packed
+    try:
+        os.makedirs(cachePath, exist_ok=True)
+        writePacked({t: frames[t] for t in tests}, cachePath, stamps)
+        return PackedOutputs(cachePath)
+    except (OSError, ValueError):
+        return None
+
+
+def loadPacked(outputsPath, columns=None, tests=None, cache=True, workers=None):
+    """The (test, variable) frame loadOutputs gives, from the packed copy of the csvs in outputsPath.
+
+    Only columns of tests are read from the file.  A folder that was packed
+    with packOutputs is read as it is; otherwise the set's packed copy is
+    refreshed first, and if it can't be, or cache is off, the csvs are read.
+    """
+    if os.path.exists(_packedFiles(outputsPath)[0]):
+        packed = openPacked(outputsPath)
+    else:
+        packed = refreshPacked(outputsPath, workers=workers) if cache else None
+    if packed is None:
+        tests = listTests(outputsPath) if tests is None else list(tests)
+        frames = readOutputs([os.path.join(outputsPath, t + '.csv') for t in tests], workers, columns)
+    else:
+        tests = packed.tests if tests is None else tests
+        frames = [packed.frame(t, columns) for t in tests]
+    return pd.concat(frames, axis=1, keys=tests).sort_index(axis=0).rename_axis('Date')
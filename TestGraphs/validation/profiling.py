@@ -0,0 +1,211 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Wall time, CPU time and memory of each stage of a validation run.
+
+The slow parts of the validation helpers are marked as stages with
+@timed or the stage() context: xlsx reading, csv parsing, date parsing,
+obs/pred alignment, statistics and figure rendering.  Inside a step, which
+is one MakeConfigs or MakeGraphs script for one set or the report, each
+stage adds up its calls, wall and CPU seconds and the most memory traced
+while it ran.  Stages nest and their times include the stages they call.
+
+Time spent in worker processes counts towards the wall time of the stage
+that started them but not its CPU time, except savefig, which renderFigures
+records from the time each figure took.  Traced memory is only measured when
+the step runs with memory on, as tracemalloc slows Python down by half or
+more.  The peak resident size of the process is always recorded where the
+platform gives it.
+
+writeProfile() keeps the record of each set and step in Profile.json in
+TestGraphs/Outputs, replacing the record from an earlier run of the same
+step.  With profile on, the step also runs under cProfile, and the stats of
+the slowest step profiled in this process are written to
+Outputs/.profile/<set>-<step>.prof.
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import functools
+import contextlib
+import tracemalloc
+import pandas as pd
+
+profileVersion = 1
+
+_records = {}
+_stack = []
+_slowest = {'wall': -1.0}
+
+
+def _resident():
+    """Peak resident size of this process in bytes, or None where it can't be read."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _add(name, calls, wall, cpu, peak=None):
+    record = _records.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak': None})
+    record['calls'] += calls
+    record['wall'] += wall
+    record['cpu'] += cpu
+    if peak is not None:
+        record['peak'] = max(peak, record['peak'] or 0)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Counts the time and memory of the code it wraps towards stage name."""
+    tracing = tracemalloc.is_tracing()
+    frame = {'peak': 0}
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if _stack:
+            _stack[-1]['peak'] = max(_stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        frame['start'] = current
+    _stack.append(frame)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        _stack.pop()
+        peak = None
+        if tracing and tracemalloc.is_tracing():
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            if _stack:
+                _stack[-1]['peak'] = max(_stack[-1]['peak'], peak)
+            peak -= frame['start']
+        _add(name, 1, wall, cpu, peak)
+
+
+def timed(name):
+    """Decorator that runs every call of a function as stage name."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def addTime(name, wall, calls=1):
+    """Adds wall seconds measured elsewhere, e.g. in a worker process, to stage name."""
+    _add(name, calls, wall, 0.0)
+
+
+@contextlib.contextmanager
+def stepProfile(step, testSet, memory=False, profile=False):
+    """Records the stages of one step and yields the record, which is filled in when the step ends.
+
+    With memory on, memory is traced for the step.  With profile on, the step
+    runs under cProfile and the profiler is kept in the record as 'profiler'.
+    """
+    _records.clear()
+    record = {'set': testSet, 'step': step, 'when': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if profile else None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        with stage('step'):
+            yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            record['profiler'] = profiler
+        if started:
+            tracemalloc.stop()
+        total = _records.pop('step')
+        record.update({'wall': total['wall'], 'cpu': total['cpu'], 'peakTraced': total['peak'],
+                       'peakResident': _resident(), 'stages': dict(_records)})
+        _records.clear()
+
+
+def profilePath(outPath):
+    return os.path.join(outPath, 'Profile.json')
+
+
+def readProfile(outPath):
+    """The steps recorded in outPath's Profile.json, as {'<set>/<step>': record}."""
+    try:
+        with open(profilePath(outPath)) as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if profile.get('version') != profileVersion:
+        return {}
+    return profile.get('steps', {})
+
+
+def writeProfile(record, outPath):
+    """Puts the record of a step into outPath's Profile.json, replacing the last one for its set and step.
+
+    If the record has a profiler and is the slowest step profiled so far in
+    this process, its stats are written to .profile/<set>-<step>.prof.
+    """
+    record = dict(record)
+    profiler = record.pop('profiler', None)
+    os.makedirs(outPath, exist_ok=True)
+    if profiler is not None and record.get('wall', 0) > _slowest['wall']:
+        folder = os.path.join(outPath, '.profile')
+        os.makedirs(folder, exist_ok=True)
+        dump = os.path.join(folder, f"{record['set']}-{record['step']}.prof")
+        profiler.dump_stats(dump)
+        if _slowest.get('dump') not in (None, dump):
+            with contextlib.suppress(OSError):
+                os.remove(_slowest['dump'])
+        _slowest.update({'wall': record['wall'], 'dump': dump})
+        record['cProfile'] = os.path.relpath(dump, outPath)
+    steps = readProfile(outPath)
+    steps[f"{record['set']}/{record['step']}"] = record
+    path = profilePath(outPath)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'version': profileVersion, 'steps': steps}, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def profileTable(steps, stages=None):
+    """Timing table of the steps readProfile gives, one row per set and step.
+
+    Has the wall and CPU seconds and peak memory in MB of each step, then the
+    wall seconds of each of stages in that order (by default every stage
+    recorded).
+    Unchanged steps that were skipped are shown as such.
+    """
+    rows = {}
+    for record in steps.values():
+        if record.get('skipped'):
+            rows[(record['set'], record['step'])] = {'status': 'unchanged'}
+            continue
+        traced, resident = record.get('peakTraced'), record.get('peakResident')
+        row = {'status': 'ok' if record.get('ok', True) else 'failed',
+               'wall s': record['wall'], 'cpu s': record['cpu'],
+               'traced MB': None if traced is None else traced / 2 ** 20,
+               'resident MB': None if resident is None else resident / 2 ** 20}
+        for name, s in record.get('stages', {}).items():
+            if stages is None or name in stages:
+                row[name + ' s'] = s['wall']
+        rows[(record['set'], record['step'])] = row
+    table = pd.DataFrame.from_dict(rows, orient='index')
+    if stages is not None:
+        first = [c for c in table.columns if not c.endswith(' s') or c in ['wall s', 'cpu s']]
+        table = table[first + [s + ' s' for s in stages if s + ' s' in table.columns]]
+    if len(table):
+        table.index.names = ['Set', 'Step']
+    return table
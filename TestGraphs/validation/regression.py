@@ -0,0 +1,262 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Comparison of the test set outputs with a stored baseline.
+
+saveBaseline() keeps the Outputs csvs of each set as a snapshot,
+<baseline>/<set>.snap (see validation.snapshot).  compareSets() then reads
+the current csvs of each set and checks every value against the baseline on
+the same day, one set per worker process.  A baseline can also be a folder
+of snapshots saved as CI artifacts, a folder of sets packed by
+validation.packed, or another TestSets folder, e.g. a checkout of an earlier
+commit, whose csvs are read as they are.
+
+A value has changed when it differs from the baseline by more than
+atol + rtol * |baseline| for its column, or is missing on one side only.
+The check is done on all the tests of a set at once: the days the two sides
+have in common are gathered into two columns x days arrays, compared in one
+go, and reduced to each test with reduceat.  The result is a table with a
+row for each test and variable that changed, giving the number of days
+changed, the first of them and the largest absolute and relative change,
+the relative change only over days the baseline isn't zero.
+Tests only on one side are listed as added or removed, and tests whose run
+of days moved as dates, with the days gained or lost and the new first day.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from .outputs import _poolContext, listTests, readOutputs
+from .packed import PackedOutputs, outputColumns
+from .snapshot import openSnapshot, snapshotOutputs
+from .profiling import timed
+
+regressionVersion = 1
+
+# atol and rtol of columns not given their own
+defaultTolerance = (1e-6, 1e-6)
+
+changeColumns = ['Set', 'Test', 'Variable', 'Status', 'Days', 'First', 'MaxAbs', 'MaxRel']
+
+
+def baselineSource(baselinePath, testSet):
+    """testSet's snapshot in baselinePath if it has one, else the folder of its outputs."""
+    snap = os.path.join(baselinePath, testSet + '.snap')
+    if os.path.isfile(snap):
+        return snap
+    folder = os.path.join(baselinePath, testSet)
+    outputs = os.path.join(folder, 'Outputs')
+    return outputs if os.path.isdir(outputs) else folder
+
+
+def _day(index):
+    return index.normalize().values.astype('datetime64[D]').astype(np.int64)
+
+
+class _Runs:
+    """Outputs of a set as a columns x days array with each test's run of days in turn."""
+
+    def __init__(self, values, columns, tests):
+        self.values = values
+        self.columns = columns
+        # test: (offset in values, first day, days)
+        self.tests = tests
+
+    @classmethod
+    def fromFrames(cls, frames):
+        columns = list(outputColumns)
+        for frame in frames.values():
+            columns += [c for c in frame.columns if c not in columns]
+        tests = {}
+        offset = 0
+        for test, frame in frames.items():
+            days = _day(frame.index)
+            if len(days) > 1 and not (np.diff(days) == 1).all():
+                raise ValueError(f"Output of {test} is not a run of consecutive days")
+            tests[test] = (offset, int(days[0]) if len(days) else 0, len(days))
+            offset += len(days)
+        values = np.empty((len(columns), offset))
+        for test, frame in frames.items():
+            start, _, days = tests[test]
+            values[:, start:start + days] = frame.reindex(columns=columns).to_numpy(dtype=np.float64).T
+        return cls(values, columns, tests)
+
+    @classmethod
+    def fromPacked(cls, packed):
+        tests = {}
+        for test in packed.tests:
+            t = packed._tests[test]
+            first = np.datetime64(t['start'], 'D').astype(np.int64) if t['start'] else 0
+            tests[test] = (t['offset'], int(first), t['days'])
+        return cls(packed.values, packed.columns, tests)
+
+    @classmethod
+    def fromSnapshot(cls, snap):
+        tests = {}
+        offset = 0
+        for test in snap.tests:
+            start = snap.start(test)
+            tests[test] = (offset, 0 if start is None else int(start.astype(np.int64)), snap.days(test))
+            offset += snap.days(test)
+        values = np.full((len(snap.columns), offset), np.nan)
+        rows = {c: i for i, c in enumerate(snap.columns)}
+        for test in snap.tests:
+            start, _, days = tests[test]
+            for column, run in snap.arrays(test).items():
+                values[rows[column], start:start + days] = run
+        return cls(values, snap.columns, tests)
+
+    def rows(self, columns):
+        """values with rows in the order of columns, NaN for columns it doesn't have."""
+        known = {c: i for i, c in enumerate(self.columns)}
+        rows = np.full((len(columns), self.values.shape[1]), np.nan)
+        for i, c in enumerate(columns):
+            if c in known:
+                rows[i] = self.values[known[c]]
+        return rows
+
+
+def readRuns(outputsPath, workers=1):
+    """The outputs in outputsPath, a snapshot, or a folder read from Outputs.npy if it was packed or else the csvs."""
+    if os.path.isfile(outputsPath):
+        with openSnapshot(outputsPath) as snap:
+            return _Runs.fromSnapshot(snap)
+    if os.path.exists(os.path.join(outputsPath, 'Outputs.npy')):
+        return _Runs.fromPacked(PackedOutputs(outputsPath))
+    tests = listTests(outputsPath)
+    frames = readOutputs([os.path.join(outputsPath, t + '.csv') for t in tests], workers)
+    return _Runs.fromFrames(dict(zip(tests, frames)))
+
+
+def _tolerances(columns, tolerances):
+    tolerances = tolerances or {}
+    atol, rtol = zip(*[tolerances.get(c, defaultTolerance) for c in columns])
+    return np.array(atol)[:, None], np.array(rtol)[:, None]
+
+
+def _isoDay(day):
+    return str(np.datetime64(int(day), 'D'))
+
+
+def compareRuns(old, new, testSet='', tolerances=None):
+    """Table of the changes from old to new, the _Runs of one set, with a row per test and variable changed.
+
+    tolerances maps a column to its (atol, rtol), defaultTolerance for the rest.
+    """
+    records = []
+    for test in sorted(set(old.tests) - set(new.tests)):
+        records.append({'Test': test, 'Status': 'removed'})
+    for test in sorted(set(new.tests) - set(old.tests)):
+        records.append({'Test': test, 'Status': 'added'})
+
+    # Gather the days each test has on both sides into one array per side
+    tests, oldAt, newAt, days = [], [], [], []
+    for test in sorted(set(old.tests) & set(new.tests)):
+        oldOffset, oldFirst, oldDays = old.tests[test]
+        newOffset, newFirst, newDays = new.tests[test]
+        if (oldFirst, oldDays) != (newFirst, newDays):
+            records.append({'Test': test, 'Status': 'dates', 'Days': newDays - oldDays,
+                            'First': _isoDay(newFirst) if newDays else None})
+        first = max(oldFirst, newFirst)
+        common = np.arange(first, min(oldFirst + oldDays, newFirst + newDays))
+        if len(common) == 0:
+            continue
+        tests.append(test)
+        days.append(common)
+        oldAt.append(common - oldFirst + oldOffset)
+        newAt.append(common - newFirst + newOffset)
+
+    if tests:
+        starts = np.cumsum([0] + [len(d) for d in days[:-1]])
+        day = np.concatenate(days)
+        columns = list(dict.fromkeys(list(new.columns) + list(old.columns)))
+        a = old.rows(columns)[:, np.concatenate(oldAt)]
+        b = new.rows(columns)[:, np.concatenate(newAt)]
+        atol, rtol = _tolerances(columns, tolerances)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            diff = np.abs(b - a)
+            missing = np.isnan(a) != np.isnan(b)
+            changed = (diff > atol + rtol * np.abs(a)) | missing
+            diff = np.where(missing, np.inf, np.nan_to_num(diff, nan=0.0))
+            rel = np.where(a != 0, diff / np.abs(a), 0.0)
+
+        count = np.add.reduceat(changed.astype(np.int64), starts, axis=1)
+        firstChanged = np.minimum.reduceat(np.where(changed, day, np.iinfo(np.int64).max), starts, axis=1)
+        maxAbs = np.maximum.reduceat(np.where(changed, diff, 0.0), starts, axis=1)
+        maxRel = np.maximum.reduceat(np.where(changed, rel, 0.0), starts, axis=1)
+        for c, t in zip(*np.nonzero(count)):
+            records.append({'Test': tests[t], 'Variable': columns[c], 'Status': 'changed',
+                            'Days': int(count[c, t]), 'First': _isoDay(firstChanged[c, t]),
+                            'MaxAbs': float(maxAbs[c, t]), 'MaxRel': float(maxRel[c, t])})
+
+    table = pd.DataFrame.from_records(records, columns=changeColumns)
+    table['Set'] = testSet
+    table['Days'] = table['Days'].astype('Int64')
+    return table.sort_values(['Test', 'Status', 'Variable'], na_position='first', kind='stable').reset_index(drop=True)
+
+
+def compareSet(testSet, baselinePath, setsPath, tolerances=None):
+    """Changes in testSet's outputs in setsPath since the baseline, and how many tests it has."""
+    old = readRuns(baselineSource(baselinePath, testSet))
+    new = readRuns(os.path.join(setsPath, testSet, 'Outputs'))
+    return compareRuns(old, new, testSet, tolerances), len(new.tests)
+
+
+def _compareSet(args):
+    return compareSet(*args)
+
+
+@timed('regression')
+def compareSets(sets, baselinePath, setsPath, tolerances=None, workers=None):
+    """Changes in the outputs of each of sets since the baseline, as one table, and {set: number of tests}.
+
+    Sets are compared in up to workers processes (default one per cpu).
+    """
+    missing = [s for s in sets if not os.path.exists(baselineSource(baselinePath, s))]
+    if missing:
+        raise FileNotFoundError(f"No baseline for {', '.join(missing)} in {baselinePath}")
+    jobs = [(s, baselinePath, setsPath, tolerances) for s in sets]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+    context = _poolContext()
+    if workers < 2 or context is None:
+        results = [_compareSet(j) for j in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            results = list(pool.map(_compareSet, jobs))
+    tables = [r[0] for r in results if len(r[0])]
+    table = pd.concat(tables, ignore_index=True) if tables else results[0][0]
+    return table, {s: r[1] for s, r in zip(sets, results)}
+
+
+def saveBaseline(sets, baselinePath, setsPath, steps=None, compression='deflate', workers=None):
+    """Keeps the current outputs of each of sets as baselinePath/<set>.snap, replacing what was there.
+
+    steps and compression are as for writeSnapshot.
+    """
+    os.makedirs(baselinePath, exist_ok=True)
+    for testSet in sets:
+        snapshotOutputs(os.path.join(setsPath, testSet, 'Outputs'), os.path.join(baselinePath, testSet + '.snap'),
+                        steps, compression, workers)
+
+
+def regressionReport(table, counts, baselinePath, tolerances=None):
+    """The comparison as a json-ready dict: a summary of each set and the list of changes."""
+    sets = {}
+    for testSet, tests in counts.items():
+        rows = table[table['Set'] == testSet]
+        sets[testSet] = {'tests': tests,
+                         'changed': int(rows.loc[rows['Status'].isin(['changed', 'dates']), 'Test'].nunique()),
+                         'added': int((rows['Status'] == 'added').sum()),
+                         'removed': int((rows['Status'] == 'removed').sum())}
+    # Infinite changes, to or from zero or a missing value, aren't valid json
+    table = table.replace([np.inf, -np.inf], np.nan)
+    changes = table.astype(object).where(table.notna(), None).to_dict('records')
+    return {'version': regressionVersion, 'baseline': os.path.abspath(baselinePath),
+            'when': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'tolerances': {'default': list(defaultTolerance), **{c: list(t) for c, t in (tolerances or {}).items()}},
+            'changed': bool(len(table)), 'sets': sets, 'changes': changes}
@@ -0,0 +1,247 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Rendering of the validation figures in a pool of worker processes.
+
+A graph script describes each figure it saves as a FigureJob: the png name,
+a function that draws into a new figure and the arguments to pass it.  The
+jobs are independent so they are drawn and saved in parallel with the Agg
+backend, and the time taken by each figure is reported.
+
+Workers are forked so they share the script's data and can call plot
+functions defined in it.  Where fork isn't available the figures are drawn
+one after another in the calling process.
+
+A job that gives a layout is drawn into the figure that the process keeps
+for that size and grid of axes (see validation.figures), so jobs that only
+change the series plotted reuse one figure and its artists.  Other jobs get
+a new figure that is closed as soon as it is saved.
+
+Figures whose png is already in outPath from an earlier run with the same
+data and plotting code are not drawn again.  The data is a job's inputs, or
+its args if it has none, so a plot function that reads frames from the
+script's globals should list the parts it draws as inputs.  Every figure
+drawn is also kept in TestGraphs/.cache/Figures under the hash of its code
+and data, so a figure that was deleted from outPath, or whose data went back
+to what it was in an earlier run, is copied from there instead of drawn.
+Figures not used for storeDays are dropped from that store.
+
+Figures are saved as png unless format, or the FIGURE_FORMAT environment
+variable, asks for png8 (a png quantised to 256 colours, a third of the
+size or less), svg or pdf.  The extension of the job's name is changed to
+suit.
+"""
+
+import os
+import time
+import shutil
+import contextlib
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+import pandas as pd
+from .figures import layoutFigure
+from .manifest import dataHash, hashFiles, readManifest, writeManifest
+from .profiling import addTime, timed
+
+FigureJob = namedtuple('FigureJob', ['name', 'plot', 'args', 'figsize', 'layout', 'inputs'], defaults=[(), None, None, None])
+
+# Changes to these change every figure, as well as changes to the script a plot function is in
+codeFiles = [os.path.join(os.path.dirname(os.path.abspath(__file__)), f) for f in ['render.py', 'figures.py']]
+
+figureStorePath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'Figures')
+storeDays = 30
+
+# Extension each format is saved with
+figureFormats = {'png': '.png', 'png8': '.png', 'svg': '.svg', 'pdf': '.pdf'}
+
+
+def figureFormat(format=None):
+    """The format asked for, by default FIGURE_FORMAT or png."""
+    format = format or os.environ.get('FIGURE_FORMAT') or 'png'
+    if format not in figureFormats:
+        raise ValueError(f"Unknown figure format '{format}', expected one of {list(figureFormats)}")
+    return format
+
+
+def figureName(name, format):
+    """name with the extension of format."""
+    return os.path.splitext(name)[0] + figureFormats[format]
+
+
+def figureManifestPath(outPath):
+    return os.path.join(outPath, '.cache', 'Figures.json')
+
+
+def figureSource(job):
+    """File the job's plot function is defined in, or None if it isn't in a file."""
+    code = getattr(job.plot, '__code__', None)
+    if code is None or not os.path.isfile(code.co_filename):
+        return None
+    return os.path.abspath(code.co_filename)
+
+
+def figureKey(job, memo, format='png'):
+    """Hash of the code and data that job's figure depends on, or None if it can't be worked out."""
+    source = figureSource(job)
+    if source is None:
+        return None
+    code = hashFiles([source] + codeFiles, memo)
+    inputs = job.args if job.inputs is None else job.inputs
+    return dataHash(sorted(code.values()), matplotlib.__version__, job.name, job.plot.__name__,
+                    job.figsize, job.layout, job.args, inputs, format)
+
+
+def storedFigure(key, format):
+    return os.path.join(figureStorePath, key + figureFormats[format])
+
+
+def _copy(source, target):
+    shutil.copyfile(source, target + '.tmp')
+    os.replace(target + '.tmp', target)
+
+
+def _fromStore(key, format, path):
+    """Copies the figure stored under key to path, returning False if there isn't one."""
+    if key is None:
+        return False
+    stored = storedFigure(key, format)
+    try:
+        _copy(stored, path)
+        os.utime(stored)
+    except OSError:
+        return False
+    return True
+
+
+def _toStore(key, format, path):
+    os.makedirs(figureStorePath, exist_ok=True)
+    _copy(path, storedFigure(key, format))
+
+
+def pruneFigureStore(days=storeDays):
+    """Deletes figures in the store that haven't been drawn or copied for days."""
+    cutoff = time.time() - days * 86400
+    try:
+        entries = list(os.scandir(figureStorePath))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _initWorker():
+    matplotlib.use('Agg', force=True)
+
+
+def saveFigure(fig, path, format='png'):
+    """Saves fig to path in format."""
+    if format != 'png8':
+        fig.savefig(path, format=format)
+        return
+    from PIL import Image
+    fig.savefig(path, format='png')
+    with Image.open(path) as image:
+        quantised = image.convert('RGB').quantize(256)
+    quantised.save(path, optimize=True)
+
+
+def renderFigure(job, outPath, format='png'):
+    """Draws and saves one figure, returning the seconds it took."""
+    import matplotlib.pyplot as plt
+    start = time.perf_counter()
+    path = os.path.join(outPath, figureName(job.name, format))
+    if job.layout is not None:
+        fig = layoutFigure(job.figsize, job.layout)
+        job.plot(fig, *job.args)
+        saveFigure(fig, path, format)
+        return time.perf_counter() - start
+    fig = plt.figure(figsize=job.figsize)
+    try:
+        job.plot(fig, *job.args)
+        saveFigure(fig, path, format)
+    finally:
+        plt.close(fig)
+    return time.perf_counter() - start
+
+
+@timed('render')
+def renderFigures(jobs, outPath, workers=None, verbose=True, cache=True, format=None):
+    """Renders every job into outPath, returning the render time of each figure.
+
+    Uses up to workers forked processes (default one per cpu).  With cache on,
+    jobs whose figure is unchanged since it was rendered from the same code
+    and data are skipped, and those drawn before from the same code and data
+    are copied from the store, and both take 0 seconds.  The times are
+    returned as a Series indexed by figure file name, in the order of jobs.
+    """
+    jobs = list(jobs)
+    format = figureFormat(format)
+    os.makedirs(outPath, exist_ok=True)
+    manifestFile = figureManifestPath(outPath)
+    manifest = readManifest(manifestFile) if cache else {'files': {}}
+    memo = manifest['files']
+    figures = manifest.setdefault('figures', {})
+    names = [figureName(job.name, format) for job in jobs]
+    keys = [figureKey(job, memo, format) if cache else None for job in jobs]
+    paths = [os.path.join(outPath, name) for name in names]
+    current = hashFiles(paths, memo)
+
+    todo, copied = [], []
+    for i, (name, key, path) in enumerate(zip(names, keys, paths)):
+        known = figures.get(name)
+        if key is not None and known is not None and known['key'] == key and current.get(path) == known['hash']:
+            # Keep its stored copy from being pruned while it is in use
+            with contextlib.suppress(OSError):
+                os.utime(storedFigure(key, format))
+            continue
+        if _fromStore(key, format, path):
+            copied.append(i)
+        else:
+            todo.append(i)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(todo))
+    if workers < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+        rendered = [renderFigure(jobs[i], outPath, format) for i in todo]
+    else:
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_initWorker) as pool:
+            rendered = list(pool.map(renderFigure, [jobs[i] for i in todo], [outPath] * len(todo), [format] * len(todo)))
+    seconds = [0.0] * len(jobs)
+    for i, s in zip(todo, rendered):
+        seconds[i] = s
+    addTime('savefig', sum(rendered), len(rendered))
+
+    if cache:
+        checked = time.time()
+        hashes = hashFiles([paths[i] for i in todo + copied], memo)
+        for i in todo:
+            if keys[i] is not None:
+                _toStore(keys[i], format, paths[i])
+        for job, name, key, path in zip(jobs, names, keys, paths):
+            if key is None:
+                figures.pop(name, None)
+                continue
+            if path in hashes:
+                figures[name] = {'key': key, 'hash': hashes[path], 'script': figureSource(job)}
+            figures[name]['checked'] = checked
+        writeManifest(manifest, manifestFile)
+        pruneFigureStore()
+
+    times = pd.Series(seconds, index=names, name='seconds')
+    if verbose:
+        drawn, stored = set(todo), set(copied)
+        for i, (name, s) in enumerate(times.items()):
+            if i in drawn:
+                print(f"{s:7.2f}s  {name}")
+            else:
+                print(f"{'from cache' if i in stored else 'unchanged':>11}  {name}")
+    return times
@@ -0,0 +1,213 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Morris and Sobol sensitivity analysis of config coefficients.
+
+A study varies some coefficients of a base config.  Each parameter is a
+coefficient with a (low, high) tuple, which is a range of values or, for a
+date, a range of shifts in days, or a list of levels for categories like
+InCropRain.  Samples are drawn on the unit cube:
+
+  - morrisSample() gives trajectories of k + 1 points, each step moving one
+    parameter by the same amount, for elementary effects screening.
+  - saltelliSample() gives k + 2 rows for each base sample (A, B and A with
+    each column in turn from B) for first order and total Sobol indices.
+
+Both are generated in chunks of whole trajectories or base samples, so
+writeBatches() can turn them into FieldConfigs batches, one test set folder
+per chunk, without holding the study in memory.  Once the model has run the
+batches, collectResponses() reduces each output to one number in a pool of
+processes, and morrisIndices() and sobolIndices() reduce those to indices
+chunk by chunk.
+"""
+
+import os
+import re
+import functools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from .configs import coefficientTypes, writeConfigs
+from .outputs import listTests, readOutput, _poolContext
+
+
+def _value(coefficient, base, spec, u):
+    """Value of coefficient for the unit sample u of a parameter spec."""
+    if isinstance(spec, tuple):
+        low, high = spec
+        if coefficientTypes.get(coefficient) == 'datetime':
+            return pd.Timestamp(base) + pd.Timedelta(days=int(round(low + u * (high - low))))
+        return low + u * (high - low)
+    levels = list(spec)
+    return levels[min(int(u * len(levels)), len(levels) - 1)]
+
+
+def sampleConfigs(base, parameters, samples, first=0, prefix='S'):
+    """Yields (name, config) for each row of unit samples applied to the base config.
+
+    parameters maps coefficients to their ranges or levels, in the order of
+    the sample columns.  Treatments are named prefix and the row number,
+    counting from first.
+    """
+    for i, row in enumerate(samples):
+        config = base.copy()
+        for (coefficient, spec), u in zip(parameters.items(), row):
+            if coefficient not in config.index:
+                raise KeyError(f"{coefficient} is not a config coefficient")
+            config[coefficient] = _value(coefficient, base[coefficient], spec, u)
+        name = f"{prefix}{first + i:07d}"
+        config.name = name
+        yield name, config
+
+
+def morrisSample(k, trajectories, levels=4, seed=None, chunkSize=100):
+    """Yields chunks of Morris trajectories over k parameters, chunkSize trajectories at a time.
+
+    Each trajectory is k + 1 rows of the unit cube on a grid of levels, each
+    row moving one parameter up or down by levels / (2 (levels - 1)).
+    """
+    rng = np.random.default_rng(seed)
+    delta = levels / (2 * (levels - 1))
+    steps = np.tril(np.ones((k + 1, k)), -1)
+    grid = np.arange(levels // 2) / (levels - 1)
+    for start in range(0, trajectories, chunkSize):
+        r = min(chunkSize, trajectories - start)
+        xStar = rng.choice(grid, size=(r, 1, k))
+        direction = rng.choice([-1.0, 1.0], size=(r, 1, k))
+        order = np.argsort(rng.random((r, k)), axis=1)
+        moved = xStar + delta / 2 * ((2 * steps - 1) * direction + 1)
+        points = np.take_along_axis(moved, order[:, None, :].repeat(k + 1, axis=1), axis=2)
+        yield points.reshape(r * (k + 1), k)
+
+
+def saltelliSample(k, n, seed=None, chunkSize=1000):
+    """Yields chunks of Saltelli samples for n base samples over k parameters, chunkSize base samples at a time.
+
+    Each base sample is k + 2 rows: A, B, then A with column i taken from B
+    for each parameter i.
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, n, chunkSize):
+        m = min(chunkSize, n - start)
+        a = rng.random((m, k))
+        b = rng.random((m, k))
+        ab = np.repeat(a[:, None, :], k, axis=1)
+        ab[:, np.arange(k), np.arange(k)] = b
+        yield np.concatenate([a[:, None, :], b[:, None, :], ab], axis=1).reshape(m * (k + 2), k)
+
+
+def writeBatches(base, parameters, sampleChunks, outPath, prefix='S'):
+    """Writes each chunk of unit samples as a test set folder Batch<n> of outPath.
+
+    Each folder gets the FieldConfigs.csv and FieldConfigs.parquet of
+    writeConfigs.  Returns the batch folders.
+    """
+    folders = []
+    first = 0
+    for b, samples in enumerate(sampleChunks):
+        folder = os.path.join(outPath, f"Batch{b + 1:04d}")
+        os.makedirs(folder, exist_ok=True)
+        writeConfigs(sampleConfigs(base, parameters, samples, first, prefix), folder, chunkSize=len(samples))
+        folders.append(folder)
+        first += len(samples)
+    return folders
+
+
+def finalValue(column, output):
+    """Value of column on the last day of an output."""
+    return output[column].iloc[-1]
+
+
+def totalValue(column, output):
+    """Sum of column over every day of an output."""
+    return output[column].sum()
+
+
+def _response(metric, path):
+    return metric(readOutput(path))
+
+
+def collectResponses(batchFolders, metric, workers=None):
+    """One number per sample from the outputs of every batch, as a Series in sample order.
+
+    metric takes an output frame, e.g. functools.partial(finalValue,
+    'SoilMineralN'), and must be picklable to run in the worker processes.
+    """
+    paths = []
+    for folder in batchFolders:
+        outputsPath = os.path.join(folder, 'Outputs')
+        paths += [os.path.join(outputsPath, t + '.csv') for t in listTests(outputsPath)]
+    names = [os.path.basename(p)[:-len('.csv')] for p in paths]
+    read = functools.partial(_response, metric)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    context = _poolContext()
+    if workers < 2 or context is None or len(paths) < 2:
+        values = [read(p) for p in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            values = list(pool.map(read, paths, chunksize=max(1, len(paths) // (workers * 4))))
+    responses = pd.Series(values, index=names, dtype=float)
+    order = sorted(names, key=lambda n: int(re.sub(r'\D', '', n) or 0))
+    return responses.loc[order]
+
+
+def _chunks(values, rows):
+    values = np.asarray(values, dtype=float)
+    for start in range(0, len(values), rows):
+        yield values[start:start + rows]
+
+
+def morrisIndices(sampleChunks, responses, names):
+    """mu, mu* and sigma of the elementary effects of each parameter.
+
+    sampleChunks are the chunks morrisSample gave and responses the model
+    response for each of their rows, in order.
+    """
+    k = len(names)
+    count = np.zeros(k)
+    total = np.zeros(k)
+    totalAbs = np.zeros(k)
+    totalSq = np.zeros(k)
+    position = 0
+    for samples in sampleChunks:
+        r = len(samples) // (k + 1)
+        x = samples.reshape(r, k + 1, k)
+        y = np.asarray(responses[position:position + len(samples)], dtype=float).reshape(r, k + 1)
+        position += len(samples)
+        dx = np.diff(x, axis=1)
+        moved = np.abs(dx).argmax(axis=2)
+        effects = np.diff(y, axis=1) / np.take_along_axis(dx, moved[:, :, None], axis=2)[:, :, 0]
+        for i in range(k):
+            e = effects[moved == i]
+            count[i] += len(e)
+            total[i] += e.sum()
+            totalAbs[i] += np.abs(e).sum()
+            totalSq[i] += (e ** 2).sum()
+    mu = total / count
+    sigma = np.sqrt(np.maximum(totalSq / count - mu ** 2, 0) * count / np.maximum(count - 1, 1))
+    return pd.DataFrame({'mu': mu, 'mu_star': totalAbs / count, 'sigma': sigma}, index=names)
+
+
+def sobolIndices(responses, names, chunkSize=100000):
+    """First order (S1) and total (ST) Sobol indices from the responses to saltelliSample rows.
+
+    Uses the Saltelli (2010) first order and Jansen total estimators,
+    accumulated chunkSize base samples at a time.
+    """
+    k = len(names)
+    n = 0
+    sumY = sumYSq = 0.0
+    first = np.zeros(k)
+    total = np.zeros(k)
+    for chunk in _chunks(responses, chunkSize * (k + 2)):
+        y = chunk.reshape(-1, k + 2)
+        fA, fB, fAB = y[:, 0], y[:, 1], y[:, 2:]
+        n += len(y)
+        sumY += fA.sum() + fB.sum()
+        sumYSq += (fA ** 2).sum() + (fB ** 2).sum()
+        first += (fB[:, None] * (fAB - fA[:, None])).sum(axis=0)
+        total += ((fA[:, None] - fAB) ** 2).sum(axis=0)
+    variance = sumYSq / (2 * n) - (sumY / (2 * n)) ** 2
+    return pd.DataFrame({'S1': first / n / variance, 'ST': total / (2 * n) / variance}, index=names)
@@ -0,0 +1,191 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Compact snapshot of a test set's outputs, for baselines and CI artifacts.
+
+A snapshot is one zip file, <set>.snap, with a member per test and an
+index.json giving each test's first date and days and where each of its
+columns is in its member.  Members are compressed on their own, so reading
+one test or one column of a test only inflates that test's block.
+
+Each column of a test is stored in the smallest of these:
+
+  - zero: nothing, when every value is 0.
+  - sparse: the days that aren't 0 and their values, for event columns
+    like FertiliserN, Irrigation and Drainage.
+  - delta: the day to day changes of the values, which are small or 0 for
+    the smooth and cumulative columns and compress well.
+  - raw: the float64 values, when the column is kept exactly or has NaNs.
+
+Values are quantised to a multiple of step, by default 1e-7, so they are
+kept to within half a step, well inside the tolerance of
+validation.regression.  A step of 0 keeps a column exactly.  Quantised
+values are stored as the narrowest integers they fit.
+"""
+
+import os
+import json
+import zipfile
+import numpy as np
+import pandas as pd
+from .dates import dailyIndex, modelDayTime
+from .outputs import listTests, readOutputs
+from .packed import outputColumns
+
+snapshotVersion = 1
+
+defaultStep = 1e-7
+
+compressions = {'deflate': zipfile.ZIP_DEFLATED, 'bzip2': zipfile.ZIP_BZIP2, 'lzma': zipfile.ZIP_LZMA}
+
+
+def _narrowest(values):
+    """values as the narrowest signed integer type that holds them."""
+    if len(values) == 0:
+        return values.astype(np.int8)
+    low, high = values.min(), values.max()
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return values.astype(dtype)
+    return values.astype(np.int64)
+
+
+def encodeColumn(values, step=defaultStep):
+    """(header, bytes) of one column of a test, in whichever encoding is smallest."""
+    values = np.asarray(values, dtype=np.float64)
+    if not step or not np.isfinite(values).all():
+        return {'encoding': 'raw'}, values.tobytes()
+    quantised = np.rint(values / step).astype(np.int64)
+    nonZero = np.flatnonzero(quantised)
+    if len(nonZero) == 0:
+        return {'encoding': 'zero', 'step': step}, b''
+    delta = _narrowest(np.diff(quantised, prepend=0))
+    days = _narrowest(np.diff(nonZero, prepend=0))
+    events = _narrowest(quantised[nonZero])
+    if days.nbytes + events.nbytes < delta.nbytes:
+        return ({'encoding': 'sparse', 'step': step, 'count': len(nonZero),
+                 'days': days.dtype.str, 'values': events.dtype.str}, days.tobytes() + events.tobytes())
+    return {'encoding': 'delta', 'step': step, 'dtype': delta.dtype.str}, delta.tobytes()
+
+
+def decodeColumn(header, data, days):
+    """The days values of a column from its header and bytes."""
+    encoding = header['encoding']
+    if encoding == 'raw':
+        return np.frombuffer(data, dtype=np.float64).copy()
+    if encoding == 'zero':
+        return np.zeros(days)
+    if encoding == 'delta':
+        return np.cumsum(np.frombuffer(data, dtype=header['dtype']), dtype=np.int64) * header['step']
+    count = header['count']
+    dayType, valueType = np.dtype(header['days']), np.dtype(header['values'])
+    at = np.cumsum(np.frombuffer(data, dtype=dayType, count=count), dtype=np.int64)
+    values = np.zeros(days)
+    values[at] = np.frombuffer(data, dtype=valueType, count=count, offset=count * dayType.itemsize) * header['step']
+    return values
+
+
+def writeSnapshot(frames, path, steps=None, compression='deflate'):
+    """Writes {test: output frame} to the snapshot file at path.
+
+    Each frame is indexed by consecutive days, as readOutput gives them.
+    steps maps a column to its quantisation step, defaultStep for the rest.
+    compression is one of compressions.
+    """
+    steps = steps or {}
+    tests = {}
+    with zipfile.ZipFile(path + '.tmp', 'w', compression=compressions[compression]) as snap:
+        for test, frame in frames.items():
+            days = frame.index.normalize()
+            if len(days) > 1 and not (np.diff(days.values) == np.timedelta64(1, 'D')).all():
+                raise ValueError(f"Output of {test} is not a run of consecutive days")
+            columns = {}
+            blocks = []
+            offset = 0
+            for column in frame.columns:
+                header, data = encodeColumn(frame[column].to_numpy(), steps.get(column, defaultStep))
+                header.update({'offset': offset, 'length': len(data)})
+                columns[column] = header
+                blocks.append(data)
+                offset += len(data)
+            tests[test] = {'start': str(days[0].date()) if len(days) else None,
+                           'days': len(frame), 'columns': columns}
+            snap.writestr('tests/' + test, b''.join(blocks))
+        snap.writestr('index.json', json.dumps({'version': snapshotVersion, 'tests': tests}))
+    os.replace(path + '.tmp', path)
+
+
+def snapshotOutputs(outputsPath, path, steps=None, compression='deflate', workers=None):
+    """Writes a snapshot of the csvs in an Outputs folder, parsing them with readOutputs. Returns the tests."""
+    tests = listTests(outputsPath)
+    if len(tests) == 0:
+        raise FileNotFoundError(f"No outputs found in directory: {outputsPath}")
+    frames = readOutputs([os.path.join(outputsPath, t + '.csv') for t in tests], workers)
+    writeSnapshot(dict(zip(tests, frames)), path, steps, compression)
+    return tests
+
+
+class Snapshot:
+    """Outputs of a test set, read from its snapshot a test at a time."""
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+        index = json.loads(self._zip.read('index.json'))
+        if index.get('version') != snapshotVersion:
+            raise ValueError(f"{path} is from another version of the snapshot format, take the snapshot again")
+        self._tests = index['tests']
+        self.tests = list(self._tests)
+        self.columns = list(dict.fromkeys(list(outputColumns) + [c for t in self._tests.values() for c in t['columns']]))
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self, test):
+        """First day of test as a numpy day, or None if it has no days."""
+        start = self._tests[test]['start']
+        return None if start is None else np.datetime64(start, 'D')
+
+    def days(self, test):
+        return self._tests[test]['days']
+
+    def dates(self, test):
+        """Model days of test, stamped at midday as readOutput gives them."""
+        t = self._tests[test]
+        return dailyIndex(pd.Timestamp(t['start']) + modelDayTime, t['days'])
+
+    def _block(self, test):
+        return self._zip.read('tests/' + test)
+
+    def _decode(self, test, block, column):
+        t = self._tests[test]
+        header = t['columns'][column]
+        data = block[header['offset']:header['offset'] + header['length']]
+        return decodeColumn(header, data, t['days'])
+
+    def column(self, test, column):
+        """Values of one column of test."""
+        return self._decode(test, self._block(test), column)
+
+    def arrays(self, test, columns=None):
+        """{column: values} of test, inflating its block once."""
+        columns = self._tests[test]['columns'] if columns is None else columns
+        block = self._block(test)
+        return {c: self._decode(test, block, c) for c in columns}
+
+    def frame(self, test, columns=None):
+        """Output of test as readOutput would give it, with only columns if given."""
+        return pd.DataFrame(self.arrays(test, columns), index=self.dates(test))
+
+
+def openSnapshot(path):
+    """The snapshot at path, reading tests from it as they are asked for."""
+    return Snapshot(path)
@@ -0,0 +1,83 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Goodness of fit statistics for observed vs predicted tables.
+
+These are the statistics of APSIM's MathUtilities.CalcRegressionStats, with
+the regression of predicted on observed.  They are worked out for every
+group of a long obs/pred table at once from per-group sums, so the cost does
+not grow with the number of groups.
+"""
+
+import numpy as np
+import pandas as pd
+from .profiling import timed
+
+statNames = ['n', 'Slope', 'Intercept', 'SEslope', 'SEintercept', 'R2',
+             'RMSE', 'NRMSE', 'NSE', 'ME', 'MAE', 'RSR']
+
+
+@timed('stats')
+def regressionStats(table, by=None, obs='obs', pred='pred'):
+    """Regression statistics of pred against obs for each group in table.
+
+    by names the index levels or columns to group on; with none given the
+    whole table is one group labelled 'All'.  Rows missing either value are
+    left out.  Returns a frame with one row per group and statNames columns.
+    """
+    if isinstance(by, str):
+        by = [by]
+    data = table.reset_index()
+    data = data.loc[data[obs].notna() & data[pred].notna()]
+    x = data[obs].to_numpy(dtype=float)
+    y = data[pred].to_numpy(dtype=float)
+
+    if by:
+        grouped = data.groupby(by, sort=True)
+        index = grouped.size().index
+        groups = len(index)
+        codes = grouped.ngroup().to_numpy()
+        keep = codes >= 0
+        codes, x, y = codes[keep], x[keep], y[keep]
+    else:
+        codes = np.zeros(len(x), dtype=int)
+        index = pd.Index(['All'])
+        groups = 1
+
+    def total(values):
+        return np.bincount(codes, weights=values, minlength=groups)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = np.bincount(codes, minlength=groups).astype(float)
+        meanx = total(x) / n
+        meany = total(y) / n
+        dx = x - meanx[codes]
+        dy = y - meany[codes]
+        sxx = total(dx * dx)
+        syy = total(dy * dy)
+        sxy = total(dx * dy)
+        err = y - x
+        sse = total(err * err)
+
+        slope = sxy / sxx
+        intercept = meany - slope * meanx
+        residual = np.sqrt(np.maximum(syy - slope * sxy, 0) / (n - 2))
+        rmse = np.sqrt(sse / n)
+        # NSE and RSR scale by the spread of obs, which one pair or a constant obs doesn't have
+        spread = (n >= 2) & (sxx > 0)
+        stats = pd.DataFrame({
+            'n': n.astype(int),
+            'Slope': slope,
+            'Intercept': intercept,
+            'SEslope': residual / np.sqrt(sxx),
+            'SEintercept': residual * np.sqrt(total(x * x) / (n * sxx)),
+            'R2': sxy * sxy / (sxx * syy),
+            'RMSE': rmse,
+            'NRMSE': rmse / meanx * 100,
+            'NSE': np.where(spread, 1 - sse / sxx, np.nan),
+            'ME': total(err) / n,
+            'MAE': total(np.abs(err)) / n,
+            'RSR': np.where(spread, rmse / np.sqrt(sxx / (n - 1)), np.nan),
+        }, index=index)
+    return stats[statNames]
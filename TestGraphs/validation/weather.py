@@ -0,0 +1,115 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Synthetic weather ensembles resampled from the Actual met records.
+
+Each member of an ensemble covers the same target years.  By default every
+target year of every member takes its weather from a source year drawn at
+random from the station's complete years of record.  Days are matched by
+month and day, so seasonality is kept and Feb 29 is taken from Feb 28 of a
+source year that isn't a leap year.
+
+With blockDays the target days are instead cut into blocks of that length.
+Each block starts on the same month and day of a random source year and runs
+on through consecutive days of the complete years joined end to end, so a
+block that crosses a year boundary keeps the weather that followed in the
+record, wrapping back to the first complete year only at the end of the
+archive.  The source days of all members are worked out as one index array
+and gathered from the met archive in one step.
+
+writeEnsemble() saves each member in the Year,DOY,MeanT,Rain,MeanPET layout of
+the *Actual.csv files, named <site>E<member>Actual.csv, so a member can be
+used as a weather station like any other Actual file.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from .met import openMetArchive
+
+
+def _isLeap(years):
+    years = np.asarray(years)
+    return (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+
+
+def _slot(dates):
+    """Position of each date in a 366 day year with Feb 29 at 59, whether or not its year is a leap year."""
+    doy = dates.dayofyear.to_numpy() - 1
+    return doy + ((~_isLeap(dates.year)) & (doy >= 59))
+
+
+def completeYears(archive, station):
+    """Years with a record of every variable on every day at station."""
+    values = archive.values[archive.stations.index(station)]
+    dates = pd.DatetimeIndex(archive.start + np.arange(values.shape[0]))
+    recorded = pd.Series(~np.isnan(values).any(axis=1), index=dates)
+    byYear = recorded.groupby(dates.year)
+    return [int(y) for y, days in byYear if days.all() and len(days) == (366 if _isLeap(y) else 365)]
+
+
+def weatherEnsemble(station, members, years=None, blockDays=None, seed=None, archive=None):
+    """Daily weather for members resamplings of station over the target years.
+
+    years are the target calendar years, by default the station's complete
+    years of record.  blockDays is the length of the blocks resampled, from
+    the start of the first target year, each taking consecutive days of the
+    record; None resamples whole years.  Returns the target dates and a
+    members x days x variable array in the order of archive.variables.
+    """
+    archive = archive or openMetArchive()
+    if station not in archive.stations:
+        raise KeyError(f"No met station '{station}' in the archive, expected one of {archive.stations}")
+    if archive.kinds[station] != 'actual':
+        raise ValueError(f"Station '{station}' is a climatology, ensembles are resampled from Actual records")
+    sourceYears = np.array(completeYears(archive, station))
+    if len(sourceYears) == 0:
+        raise ValueError(f"Station '{station}' has no complete years of record to resample")
+    years = sourceYears if years is None else np.asarray(sorted(years))
+    dates = pd.date_range(f'{years[0]}-01-01', f'{years[-1]}-12-31', freq='D')
+    dates = dates[np.isin(dates.year, years)]
+
+    rng = np.random.default_rng(seed)
+    values = archive.values[archive.stations.index(station)]
+    yearStart = (np.array([f'{y}-01-01' for y in sourceYears], dtype='datetime64[D]') - archive.start).astype(int)
+    slot = _slot(dates)
+    if blockDays is None:
+        block = np.searchsorted(years, dates.year)
+        source = rng.integers(0, len(sourceYears), size=(members, block.max() + 1))[:, block]
+        offset = slot - ((~_isLeap(sourceYears)[source]) & (slot >= 59))
+        return dates, values[yearStart[source] + offset]
+
+    # Archive index of every day of the complete years, in order
+    yearDays = np.where(_isLeap(sourceYears), 366, 365)
+    record = np.concatenate([start + np.arange(n) for start, n in zip(yearStart, yearDays)])
+    recordYearStart = np.cumsum(yearDays) - yearDays
+
+    first = np.arange(0, len(dates), blockDays)
+    block = np.arange(len(dates)) // blockDays
+    drawn = rng.integers(0, len(sourceYears), size=(members, len(first)))
+    firstSlot = slot[first]
+    start = recordYearStart[drawn] + firstSlot - ((~_isLeap(sourceYears)[drawn]) & (firstSlot >= 59))
+    at = (start[:, block] + np.arange(len(dates)) - first[block]) % len(record)
+    return dates, values[record[at]]
+
+
+def writeEnsemble(station, members, outPath, years=None, blockDays=None, seed=None, archive=None):
+    """Writes a weatherEnsemble of station to outPath as one Actual met file per member.
+
+    Returns the paths written.
+    """
+    archive = archive or openMetArchive()
+    dates, values = weatherEnsemble(station, members, years, blockDays, seed, archive)
+    os.makedirs(outPath, exist_ok=True)
+    site = station[:-len('Actual')] if station.endswith('Actual') else station
+    width = len(str(members))
+    frame = pd.DataFrame({'Year': dates.year, 'DOY': dates.dayofyear})
+    paths = []
+    for m in range(members):
+        member = frame.copy()
+        member[archive.variables] = values[m]
+        path = os.path.join(outPath, f"{site}E{m + 1:0{width}d}Actual.csv")
+        member.to_csv(path, index=False)
+        paths.append(path)
+    return paths
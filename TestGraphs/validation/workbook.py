@@ -0,0 +1,124 @@
+# FieldNBalance is a program that estimates the N balance and provides N fertilizer recommendations for cultivated crops.
+# Author: Hamish Brown.
+# Copyright (c) 2024 The New Zealand Institute for Plant and Food Research Limited
+
+"""Reading of the FieldConfigs.xlsx workbooks for the MakeConfigs scripts.
+
+Each workbook is opened once, read only, and the cell values of every sheet
+are taken in one pass.  The values are kept in the .cache folder next to the
+workbook, under the hash of its contents, so while the workbook is unchanged
+it is never opened by openpyxl again.  readSheet() turns a sheet's values
+into a frame with the same parser pd.read_excel uses, so it takes the same
+header, skiprows, nrows, usecols and na options and gives the same frame.
+"""
+
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+from .manifest import fileHash
+from .profiling import timed
+
+cacheVersion = 2
+
+
+def _cellValue(cell):
+    """Value of an openpyxl cell the way pandas' openpyxl reader gives it."""
+    if cell.value is None:
+        return ''
+    if cell.data_type == 'e':
+        return np.nan
+    if cell.data_type == 'n':
+        whole = int(cell.value)
+        return whole if whole == cell.value else float(cell.value)
+    return cell.value
+
+
+def _sheetRows(sheet):
+    """Cell values of each row of sheet, without the empty cells at the end of the row."""
+    rows = []
+    for row in sheet.iter_rows():
+        values = [_cellValue(cell) for cell in row]
+        while values and values[-1] == '':
+            values.pop()
+        rows.append(values)
+    return rows
+
+
+def _rowsNeeded(header, skiprows, nrows):
+    """Number of rows read_excel takes from the top of a sheet for these options, None for all.
+
+    Only these rows decide where the data ends and how many columns there are.
+    """
+    if nrows is None:
+        return None
+    wanted = (1 if header is None else 1 + header) + nrows
+    if skiprows is None:
+        return wanted
+    if isinstance(skiprows, int):
+        return wanted + skiprows
+    skip = skiprows if callable(skiprows) else skiprows.__contains__
+    used = row = 0
+    while used < wanted:
+        if not skip(row):
+            used += 1
+        row += 1
+    return row
+
+
+@timed('xlsx')
+def _readCells(path):
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        return {sheet.title: _sheetRows(sheet) for sheet in workbook.worksheets}
+    finally:
+        workbook.close()
+
+
+def readWorkbook(path, cache=True, cachePath=None):
+    """Cell values of every sheet in the workbook at path, as {sheet name: rows} in sheet order.
+
+    With cache on, the values are read from the .cache folder next to the
+    workbook if they were saved there from a workbook with the same contents.
+    """
+    if not cache:
+        return _readCells(path)
+    if cachePath is None:
+        cachePath = os.path.join(os.path.dirname(os.path.abspath(path)), '.cache')
+    cacheFile = os.path.join(cachePath, os.path.splitext(os.path.basename(path))[0] + '.sheets.pkl')
+    contentHash = fileHash(path)
+    try:
+        cached = pd.read_pickle(cacheFile)
+        if cached['version'] == cacheVersion and cached['hash'] == contentHash:
+            return cached['sheets']
+    except (OSError, ValueError, KeyError, TypeError, EOFError, pickle.UnpicklingError):
+        pass
+    sheets = _readCells(path)
+    try:
+        os.makedirs(cachePath, exist_ok=True)
+        pd.to_pickle({'version': cacheVersion, 'hash': contentHash, 'sheets': sheets}, cacheFile + '.tmp')
+        os.replace(cacheFile + '.tmp', cacheFile)
+    except OSError:
+        pass
+    return sheets
+
+
+def readSheet(sheets, sheetName=0, header=0, **kwargs):
+    """Frame for one sheet of readWorkbook's result, as pd.read_excel would read it.
+
+    sheetName is a sheet name or its position in the workbook.  Other keyword
+    arguments are the read_excel ones, e.g. skiprows, nrows, usecols and
+    keep_default_na.
+    """
+    if isinstance(sheetName, int):
+        sheetName = list(sheets)[sheetName]
+    rows = sheets[sheetName][:_rowsNeeded(header, kwargs.get('skiprows'), kwargs.get('nrows'))]
+    while rows and not rows[-1]:
+        rows = rows[:-1]
+    if not rows:
+        return pd.DataFrame()
+    width = max(len(r) for r in rows)
+    rows = [r + [''] * (width - len(r)) for r in rows]
+    return TextParser(rows, header=header, **kwargs).read(nrows=kwargs.get('nrows'))